@@ -1,5 +1,19 @@
 from django.contrib import admin
 from .models import *
+from .search import filter_matching
+
+
+class FullTextSearchMixin:
+    """Answer the changelist search from the core_search index instead of
+    icontains over ``search_fields``, which scans the whole table
+    """
+
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return filter_matching(queryset, self.search_kind, search_term), False
 
 
 @admin.register(UserProfile)
@@ -29,10 +43,11 @@ class ClassSubjectAdmin(admin.ModelAdmin):
 
 
 @admin.register(Student)
-class StudentAdmin(admin.ModelAdmin):
+class StudentAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ["admission_number", "user", "class_enrolled", "roll_number"]
     list_filter = ["class_enrolled"]
     search_fields = ["admission_number", "user__username"]
+    search_kind = "student"
 
 
 @admin.register(Attendance)
@@ -41,6 +56,13 @@ class AttendanceAdmin(admin.ModelAdmin):
     list_filter = ["status", "date"]
 
 
+@admin.register(AttendanceSummary)
+class AttendanceSummaryAdmin(admin.ModelAdmin):
+    list_display = ["student", "month", "present", "absent", "late", "excused"]
+    list_filter = ["month"]
+    readonly_fields = ["student", "month", "present", "absent", "late", "excused"]
+
+
 @admin.register(Grade)
 class GradeAdmin(admin.ModelAdmin):
     list_display = ["student", "subject", "exam_type", "marks_obtained", "total_marks"]
@@ -48,8 +70,10 @@ class GradeAdmin(admin.ModelAdmin):
 
 
 @admin.register(Assignment)
-class AssignmentAdmin(admin.ModelAdmin):
+class AssignmentAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ["title", "class_subject", "due_date", "total_marks"]
+    search_fields = ["title", "description"]
+    search_kind = "assignment"
 
 
 @admin.register(Submission)
@@ -64,6 +88,8 @@ class AnnouncementAdmin(admin.ModelAdmin):
 
 
 @admin.register(Message)
-class MessageAdmin(admin.ModelAdmin):
+class MessageAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ["sender", "receiver", "subject", "sent_at", "is_read"]
     list_filter = ["is_read"]
+    search_fields = ["subject", "content"]
+    search_kind = "message"
@@ -0,0 +1,224 @@
+"""Attendance analytics computed over whole classes or schools at once
+
+Attendance is loaded into a student x school day matrix of small status
+codes, one row per student and one column per date anyone was marked, and
+every metric is an array operation over that matrix. A school of 600
+students over a year is a 600 x 180 int8 array, about 100 KB.
+
+A day counts as missed when the student was absent or excused, as in the
+usual definition of chronic absence; late still counts as attended.
+"""
+import numpy as np
+from django.db.models import Case, CharField, F, IntegerField, Value, When
+from django.db.models.functions import Cast, Replace
+
+from .models import Attendance
+
+# Status codes of the matrix, 0 where the student has no record that day
+NO_RECORD = 0
+STATUS_CODES = {
+    status: code for code, (status, _) in enumerate(Attendance.STATUS_CHOICES, 1)
+}
+MISSED = [STATUS_CODES["absent"], STATUS_CODES["excused"]]
+WEEKDAYS = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+
+# A student attending less than this share of their days is chronically absent
+CHRONIC_BELOW = 0.9
+# Calendar days covered by the rolling attendance rate
+WINDOW_DAYS = 30
+# Missed school days in a row, up to the latest one, that flag a student
+AT_RISK_STREAK = 3
+# Place values of the integers load_attendance fetches, see _packed_record
+_DATE_BASE = 10**8
+_CODE_BASE = 8
+
+
+def _packed_record():
+    """Each record as one integer, ``(student_id * 10**8 + yyyymmdd) * 8 +
+    status code``
+
+    The database builds it, so a row reaches Python as a single int instead
+    of an id, a date string parsed into a date and a status; NumPy unpacks
+    them all at once.
+    """
+    code = Case(
+        *[When(status=status, then=Value(n)) for status, n in STATUS_CODES.items()],
+        output_field=IntegerField(),
+    )
+    iso_date = Cast("date", CharField())
+    yyyymmdd = Cast(Replace(iso_date, Value("-"), Value("")), IntegerField())
+    return (F("student_id") * _DATE_BASE + yyyymmdd) * _CODE_BASE + code
+
+
+def load_attendance(students):
+    """The attendance of ``students`` as ``(student_ids, dates, codes)``
+
+    ``student_ids`` and ``dates`` (datetime64[D]) are sorted and label the
+    rows and columns of the int8 ``codes`` matrix. Students without a
+    single record are left out.
+    """
+    packed = np.array(
+        Attendance.objects.filter(student__in=students)
+        .order_by()
+        .annotate(packed=_packed_record())
+        .values_list("packed", flat=True),
+        dtype=np.int64,
+    )
+    packed, status = np.divmod(packed, _CODE_BASE)
+    student, yyyymmdd = np.divmod(packed, _DATE_BASE)
+    year, mmdd = np.divmod(yyyymmdd, 10000)
+    month, day = np.divmod(mmdd, 100)
+    months = (year - 1970) * 12 + month - 1
+    dates = months.astype("datetime64[M]").astype("datetime64[D]") + (day - 1)
+
+    student_ids, row = np.unique(student, return_inverse=True)
+    dates, column = np.unique(dates, return_inverse=True)
+    codes = np.zeros((len(student_ids), len(dates)), dtype=np.int8)
+    codes[row, column] = status
+    return student_ids, dates, codes
+
+
+def _rate(attended, recorded):
+    """``attended / recorded``, NaN where nothing was recorded"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(recorded > 0, attended / recorded, np.nan)
+
+
+def absence_streaks(missed):
+    """The longest run of missed days and the run ending on the last day
+
+    A day without a record, before enrolment or when a register was not
+    taken for the student, breaks a run like a day attended.
+    """
+    days = np.cumsum(missed, axis=1, dtype=np.int32)
+    # Days missed so far, as of the latest day that was not missed
+    before_run = np.maximum.accumulate(np.where(missed, 0, days), axis=1)
+    runs = days - before_run
+    return runs.max(axis=1), runs[:, -1]
+
+
+def rolling_rates(dates, recorded, attended, days=WINDOW_DAYS):
+    """Attendance rate of each student over the ``days`` calendar days up
+    to each date, as a matrix shaped like ``recorded``"""
+    ordinals = dates.astype(np.int64)
+    starts = np.searchsorted(ordinals, ordinals - (days - 1))
+
+    def window_sums(matrix):
+        totals = np.zeros((len(matrix), matrix.shape[1] + 1), dtype=np.int32)
+        np.cumsum(matrix, axis=1, out=totals[:, 1:])
+        return totals[:, 1:] - totals[:, starts]
+
+    return _rate(window_sums(attended), window_sums(recorded))
+
+
+def attendance_metrics(dates, codes):
+    """Every metric for each row of ``codes``, as arrays, see load_attendance
+
+    rate: share of recorded days attended; chronic: rate below CHRONIC_BELOW;
+    longest_streak / current_streak: missed days in a row; weekday_rates:
+    share of each weekday missed, one column per WEEKDAYS entry;
+    worst_weekday: index of the weekday missed most, the earliest on a tie,
+    -1 if none ever was; recent_rate: rate over the WINDOW_DAYS up to the
+    last date; trend: recent_rate against the WINDOW_DAYS before those.
+    ``dates`` must not be empty.
+    """
+    recorded = codes != NO_RECORD
+    missed = np.isin(codes, MISSED)
+    attended = recorded & ~missed
+    rate = _rate(attended.sum(axis=1), recorded.sum(axis=1))
+    longest_streak, current_streak = absence_streaks(missed)
+
+    # 1970-01-01 was a Thursday
+    weekday = (dates.astype(np.int64) + 3) % 7
+    on_weekday = (weekday[:, None] == np.arange(7)).astype(np.int32)
+    missed_by_weekday = missed.astype(np.int32) @ on_weekday
+    weekday_rates = _rate(missed_by_weekday, recorded.astype(np.int32) @ on_weekday)
+    worst_weekday = np.where(
+        missed_by_weekday.any(axis=1),
+        np.nan_to_num(weekday_rates, nan=-1).argmax(axis=1),
+        -1,
+    )
+
+    rolling = rolling_rates(dates, recorded, attended)
+    recent_rate = rolling[:, -1]
+    # The last date at least WINDOW_DAYS before the latest one
+    earlier = np.searchsorted(dates, dates[-1] - WINDOW_DAYS, "right") - 1
+    trend = recent_rate - rolling[:, earlier] if earlier >= 0 else recent_rate * np.nan
+
+    return {
+        "rate": rate,
+        "chronic": rate < CHRONIC_BELOW,
+        "longest_streak": longest_streak,
+        "current_streak": current_streak,
+        "weekday_rates": weekday_rates,
+        "worst_weekday": worst_weekday,
+        "recent_rate": recent_rate,
+        "trend": trend,
+    }
+
+
+def _number(value):
+    return None if np.isnan(value) else float(value)
+
+
+def student_analytics(students):
+    """``{student_id: metrics}`` for those of ``students`` with attendance
+
+    The arrays of attendance_metrics split into one dict of plain Python
+    values per student, rates as fractions or None, worst_weekday as a
+    WEEKDAYS name or None. The rolling windows end on the latest date any
+    of ``students`` was marked rather than today, so the same records
+    always give the same figures.
+    """
+    student_ids, dates, codes = load_attendance(students)
+    if not len(dates):
+        return {}
+    metrics = attendance_metrics(dates, codes)
+    return {
+        student_id: {
+            "rate": _number(metrics["rate"][i]),
+            "chronic": bool(metrics["chronic"][i]),
+            "longest_streak": int(metrics["longest_streak"][i]),
+            "current_streak": int(metrics["current_streak"][i]),
+            "worst_weekday": (
+                WEEKDAYS[metrics["worst_weekday"][i]]
+                if metrics["worst_weekday"][i] >= 0
+                else None
+            ),
+            "recent_rate": _number(metrics["recent_rate"][i]),
+            "trend": _number(metrics["trend"][i]),
+        }
+        for i, student_id in enumerate(student_ids.tolist())
+    }
+
+
+def risk_reasons(metrics):
+    """Why a student's ``metrics``, from student_analytics, are a concern"""
+    reasons = []
+    if metrics["chronic"]:
+        reasons.append("chronically absent")
+    if metrics["recent_rate"] is not None and metrics["recent_rate"] < CHRONIC_BELOW:
+        reasons.append(f"below {CHRONIC_BELOW:.0%} over the last {WINDOW_DAYS} days")
+    if metrics["current_streak"] >= AT_RISK_STREAK:
+        reasons.append(f"absent the last {metrics['current_streak']} school days")
+    return reasons
+
+
+def at_risk(students):
+    """``[(student_id, metrics, reasons)]`` for the students of concern,
+    lowest attendance first"""
+    flagged = []
+    for student_id, metrics in student_analytics(students).items():
+        reasons = risk_reasons(metrics)
+        if reasons:
+            flagged.append((student_id, metrics, reasons))
+    flagged.sort(key=lambda item: (item[1]["rate"], item[1]["recent_rate"] or 0))
+    return flagged
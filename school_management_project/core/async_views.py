@@ -0,0 +1,47 @@
+from asgiref.sync import sync_to_async
+from django.shortcuts import render
+
+from .auth import role_required
+from .views import DASHBOARDS
+
+
+async def run_queries(queries):
+    """Run ``{name: callable}`` and return ``{name: result}``
+
+    Django 4.2's async ORM runs each query through sync_to_async on the
+    request's one thread-sensitive thread, so the callables go the same
+    way, all in a single hop, on the connection the sync views use. They
+    run one after another: on SQLite, spreading them over threads with a
+    connection each cost more than it saved. These views are no faster than
+    the sync ones (see benchmark_dashboards); they only keep the event loop
+    free while the queries run.
+    """
+    return await sync_to_async(
+        lambda: {name: query() for name, query in queries.items()}
+    )()
+
+
+async def render_dashboard(request, role):
+    template, queries, context = DASHBOARDS[role]
+    results = await run_queries(queries(request))
+    return await sync_to_async(render)(request, template, context(request, results))
+
+
+@role_required("admin")
+async def admin_dashboard(request):
+    return await render_dashboard(request, "admin")
+
+
+@role_required("teacher")
+async def teacher_dashboard(request):
+    return await render_dashboard(request, "teacher")
+
+
+@role_required("student")
+async def student_dashboard(request):
+    return await render_dashboard(request, "student")
+
+
+@role_required("parent")
+async def parent_dashboard(request):
+    return await render_dashboard(request, "parent")
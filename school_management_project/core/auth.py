@@ -0,0 +1,63 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib import messages
+from django.contrib.auth.backends import ModelBackend, UserModel
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import redirect
+
+
+class ProfileBackend(ModelBackend):
+    """ModelBackend that loads the user's profile and student record with the
+    user itself, so ``request.user.profile`` and ``request.user.student_profile``
+    cost no further queries.
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related(
+                "profile", "student_profile__class_enrolled"
+            ).get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+def user_role(user):
+    """The role of ``user``, from the profile ProfileBackend loads with it"""
+    profile = getattr(user, "profile", None)
+    return profile.role if profile else None
+
+
+def role_required(*roles):
+    """Allow only signed-in users with one of ``roles``; send anyone else back
+    to their dashboard.
+    """
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            # login_required only wraps sync views before Django 5.0
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # Loads the lazy user, so the view can use it freely
+                if not await sync_to_async(lambda: request.user.is_authenticated)():
+                    return redirect_to_login(request.get_full_path())
+                if user_role(request.user) not in roles:
+                    messages.error(request, "Access denied")
+                    return redirect("dashboard")
+                return await view(request, *args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if user_role(request.user) not in roles:
+                messages.error(request, "Access denied")
+                return redirect("dashboard")
+            return view(request, *args, **kwargs)
+
+        return login_required(wrapper)
+
+    return decorator
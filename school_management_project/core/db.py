@@ -0,0 +1,13 @@
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """connection_created receiver running the PRAGMAS of a SQLite database
+
+    PRAGMAS is an optional mapping in the database's DATABASES entry. Most
+    pragmas only last as long as the connection, so they are set again on
+    every new one; journal_mode=wal is stored in the database file.
+    """
+    if connection.vendor != "sqlite":
+        return
+    pragmas = connection.settings_dict.get("PRAGMAS") or {}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
@@ -0,0 +1,45 @@
+import time
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Announcement
+
+FEED_SIZE = 5
+FEED_TIMEOUT = 60 * 60
+VERSION_KEY = "announcements:version"
+
+
+def _feed_version():
+    # The version is the time it was set, so one that has been culled from
+    # the cache comes back as a new value, never as one a stale feed was
+    # cached under.
+    return cache.get_or_set(VERSION_KEY, time.time_ns, timeout=None)
+
+
+def announcement_feed(role=None, class_id=None):
+    """Return the latest active announcements for a role (and class).
+
+    ``role=None`` is the unfiltered feed shown to admins. Feeds are cached
+    per (role, class) and dropped as a whole whenever an announcement
+    changes, see invalidate_announcement_feeds.
+    """
+    key = f"announcements:feed:{role or 'all'}:{class_id or ''}"
+    version = _feed_version()
+    feed = cache.get(key, version=version)
+    if feed is None:
+        announcements = Announcement.objects.filter(is_active=True)
+        if role:
+            audience = Q(target_role=role) | Q(target_role="")
+            if class_id:
+                audience |= Q(target_class_id=class_id)
+            announcements = announcements.filter(audience)
+        feed = list(announcements.order_by("-created_at")[:FEED_SIZE])
+        cache.set(key, feed, FEED_TIMEOUT, version=version)
+    return feed
+
+
+def invalidate_announcement_feeds():
+    # A new version orphans every cached feed at once; they expire on their
+    # own after FEED_TIMEOUT.
+    cache.set(VERSION_KEY, time.time_ns(), timeout=None)
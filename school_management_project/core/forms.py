@@ -1,6 +1,8 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
+from django.template.defaultfilters import filesizeformat
 from .models import *
 
 
@@ -57,6 +59,11 @@ class AttendanceForm(forms.ModelForm):
 
 
 class GradeForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Student.__str__ reads the user's name
+        self.fields["student"].queryset = Student.objects.select_related("user")
+
     class Meta:
         model = Grade
         fields = [
@@ -74,7 +81,29 @@ class GradeForm(forms.ModelForm):
         }
 
 
+class GradeImportForm(forms.Form):
+    grades_file = forms.FileField(
+        label="Grade sheet",
+        help_text="CSV or XLSX with columns: admission_number, subject_code, "
+        "exam_type, marks_obtained, total_marks, exam_date (YYYY-MM-DD) and an "
+        "optional remarks column.",
+    )
+
+    def clean_grades_file(self):
+        grades_file = self.cleaned_data["grades_file"]
+        if not grades_file.name.lower().endswith((".csv", ".xlsx")):
+            raise forms.ValidationError("Upload a .csv or .xlsx file")
+        return grades_file
+
+
 class AssignmentForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # ClassSubject.__str__ reads both the class and the subject
+        self.fields["class_subject"].queryset = ClassSubject.objects.select_related(
+            "class_obj", "subject"
+        )
+
     class Meta:
         model = Assignment
         fields = [
@@ -97,6 +126,23 @@ class SubmissionForm(forms.ModelForm):
         fields = ["submission_file"]
 
 
+class ChunkedUploadForm(forms.ModelForm):
+    class Meta:
+        model = ChunkedUpload
+        fields = ["filename", "size", "sha256"]
+
+    def clean_size(self):
+        size = self.cleaned_data["size"]
+        if not size:
+            raise forms.ValidationError("The file is empty.")
+        if size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+            raise forms.ValidationError(
+                "The file is larger than "
+                f"{filesizeformat(settings.CHUNKED_UPLOAD_MAX_SIZE)}."
+            )
+        return size
+
+
 class AnnouncementForm(forms.ModelForm):
     class Meta:
         model = Announcement
@@ -113,3 +159,52 @@ class MessageForm(forms.ModelForm):
         widgets = {
             "content": forms.Textarea(attrs={"rows": 4}),
         }
+
+
+class ReplyForm(forms.ModelForm):
+    class Meta:
+        model = Message
+        fields = ["subject", "content"]
+        widgets = {
+            "content": forms.Textarea(attrs={"rows": 3}),
+        }
+
+
+class BroadcastForm(forms.Form):
+    AUDIENCE_CHOICES = [
+        ("class", "Students of a class"),
+        ("class_parents", "Parents of a class"),
+        ("role", "Everyone with a role"),
+    ]
+
+    audience = forms.ChoiceField(choices=AUDIENCE_CHOICES)
+    class_obj = forms.ModelChoiceField(
+        queryset=Class.objects.all(), required=False, label="Class"
+    )
+    role = forms.ChoiceField(choices=UserProfile.ROLE_CHOICES, required=False)
+    subject = forms.CharField(max_length=200)
+    content = forms.CharField(widget=forms.Textarea(attrs={"rows": 4}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        audience = cleaned_data.get("audience")
+        if audience in ("class", "class_parents") and not cleaned_data.get(
+            "class_obj"
+        ):
+            self.add_error("class_obj", "Choose the class to send to.")
+        if audience == "role" and not cleaned_data.get("role"):
+            self.add_error("role", "Choose the role to send to.")
+        return cleaned_data
+
+    def receivers(self):
+        """The users the message goes to, as an unevaluated queryset"""
+        audience = self.cleaned_data["audience"]
+        if audience == "class":
+            return User.objects.filter(
+                student_profile__class_enrolled=self.cleaned_data["class_obj"]
+            )
+        if audience == "class_parents":
+            return User.objects.filter(
+                children__class_enrolled=self.cleaned_data["class_obj"]
+            )
+        return User.objects.filter(profile__role=self.cleaned_data["role"])
@@ -0,0 +1,215 @@
+import csv
+import datetime
+import io
+import zipfile
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from .models import Grade, Student, Subject, refresh_rankings
+
+GRADE_COLUMNS = [
+    "admission_number",
+    "subject_code",
+    "exam_type",
+    "marks_obtained",
+    "total_marks",
+    "exam_date",
+    "remarks",
+]
+REQUIRED_COLUMNS = GRADE_COLUMNS[:-1]
+# Raised while reading a file that is not the CSV or XLSX it claims to be
+UNREADABLE_FILE_ERRORS = (
+    UnicodeDecodeError,
+    csv.Error,
+    zipfile.BadZipFile,
+    InvalidFileException,
+)
+
+
+def _csv_lines(uploaded_file):
+    """``(line, values)`` of each CSV record, numbered by its first line"""
+    reader = csv.reader(io.TextIOWrapper(uploaded_file, encoding="utf-8-sig"))
+    line = 1
+    for values in reader:
+        yield line, values
+        # A quoted value may span several lines
+        line = reader.line_num + 1
+
+
+def read_rows(uploaded_file):
+    """Yield ``(line_number, row)`` for each data row of a CSV or XLSX upload.
+
+    ``row`` is a dict keyed by the header names, matched case-insensitively;
+    the cells missing from a row shorter than the header are None. Blank rows
+    are skipped but still counted, so ``line_number`` is the line of the CSV
+    file or the row of the sheet the user sees. CSV files are decoded as they
+    are read, while openpyxl needs the whole XLSX workbook at hand. Raises one
+    of UNREADABLE_FILE_ERRORS for a file that cannot be parsed.
+    """
+    if uploaded_file.name.lower().endswith(".xlsx"):
+        wb = load_workbook(uploaded_file, read_only=True, data_only=True)
+        rows = enumerate(wb.active.iter_rows(values_only=True), start=1)
+    else:
+        rows = _csv_lines(uploaded_file)
+
+    _, header = next(rows, (1, []))
+    header = [str(cell or "").strip().lower() for cell in header]
+    for line, values in rows:
+        if any(value not in (None, "") for value in values):
+            values = list(values) + [None] * (len(header) - len(values))
+            yield line, dict(zip(header, values))
+
+
+def _text(value):
+    return "" if value is None else str(value).strip()
+
+
+def _marks(value):
+    marks = Decimal(_text(value))
+    if not marks.is_finite() or marks < 0 or marks >= 1000:
+        raise InvalidOperation
+    return marks.quantize(Decimal("0.01"))
+
+
+def _date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return parse_date(_text(value))
+
+
+def import_grades(uploaded_file, uploaded_by):
+    """Validate every row of a grade sheet, then save them all or none.
+
+    Returns ``(saved, errors)`` where ``errors`` is a list of
+    ``(line_number, message)``. All the rows are held in memory so that
+    it can be validated before anything is written. A row for a grade that
+    already exists, the same student, subject, exam type and exam date,
+    updates it, so uploading a corrected sheet again does not duplicate
+    grades. New rows go in a single bulk_create, and only the rankings of
+    the classes and exam types in the sheet are recomputed.
+    """
+    try:
+        rows = list(read_rows(uploaded_file))
+    except UNREADABLE_FILE_ERRORS:
+        return 0, [(1, "The file is not a readable UTF-8 CSV or XLSX sheet")]
+    if not rows:
+        return 0, [(1, "The file has no grade rows")]
+    missing = [column for column in REQUIRED_COLUMNS if column not in rows[0][1]]
+    if missing:
+        return 0, [(1, f"Missing columns: {', '.join(missing)}")]
+
+    students = {
+        admission_number: (student_id, class_id)
+        for admission_number, student_id, class_id in Student.objects.filter(
+            admission_number__in={
+                _text(row.get("admission_number")) for _, row in rows
+            }
+        ).values_list("admission_number", "id", "class_enrolled")
+    }
+    subjects = dict(
+        Subject.objects.filter(
+            code__in={_text(row.get("subject_code")) for _, row in rows}
+        ).values_list("code", "id")
+    )
+
+    grades, errors = [], []
+    # (student id, subject id, exam type, exam date) -> line it is on
+    lines = {}
+    # (class id, exam type) whose rankings the new grades change
+    partitions = set()
+    for line, row in rows:
+        blank = [
+            column for column in REQUIRED_COLUMNS if _text(row.get(column)) == ""
+        ]
+        if blank:
+            errors.append((line, f"missing {', '.join(blank)}"))
+            continue
+
+        problems = []
+        student = students.get(_text(row["admission_number"]))
+        student_id, class_id = student or (None, None)
+        if student_id is None:
+            problems.append(f"unknown admission number {row['admission_number']!r}")
+        subject_id = subjects.get(_text(row["subject_code"]))
+        if subject_id is None:
+            problems.append(f"unknown subject code {row['subject_code']!r}")
+        exam_type = _text(row["exam_type"])
+        if len(exam_type) > 50:
+            problems.append("exam type is too long (max 50 characters)")
+        try:
+            marks_obtained = _marks(row["marks_obtained"])
+            total_marks = _marks(row["total_marks"])
+            if marks_obtained > total_marks:
+                problems.append("marks obtained exceed total marks")
+        except InvalidOperation:
+            problems.append("marks must be numbers between 0 and 999.99")
+        try:
+            exam_date = _date(row["exam_date"])
+        except ValueError:
+            exam_date = None
+        if exam_date is None:
+            problems.append("exam date must be YYYY-MM-DD")
+
+        key = (student_id, subject_id, exam_type, exam_date)
+        if not problems and key in lines:
+            problems.append(
+                f"same student, subject, exam and date as line {lines[key]}"
+            )
+        if problems:
+            errors.append((line, "; ".join(problems)))
+            continue
+        lines[key] = line
+        if class_id:
+            partitions.add((class_id, exam_type))
+        grades.append(
+            Grade(
+                student_id=student_id,
+                subject_id=subject_id,
+                exam_type=exam_type,
+                marks_obtained=marks_obtained,
+                total_marks=total_marks,
+                exam_date=exam_date,
+                remarks=_text(row.get("remarks")),
+                uploaded_by=uploaded_by,
+            )
+        )
+
+    if errors:
+        return 0, errors
+    with transaction.atomic():
+        existing = {
+            tuple(key): pk
+            for pk, *key in Grade.objects.filter(
+                student__in={grade.student_id for grade in grades},
+                subject__in={grade.subject_id for grade in grades},
+                exam_type__in={grade.exam_type for grade in grades},
+                exam_date__in={grade.exam_date for grade in grades},
+            ).values_list("pk", "student", "subject", "exam_type", "exam_date")
+        }
+        changed, new = [], []
+        now = timezone.now()
+        for grade in grades:
+            grade.pk = existing.get(
+                (grade.student_id, grade.subject_id, grade.exam_type, grade.exam_date)
+            )
+            if grade.pk is None:
+                new.append(grade)
+            else:
+                # bulk_update does not apply auto_now
+                grade.updated_at = now
+                changed.append(grade)
+        Grade.objects.bulk_create(new, batch_size=500)
+        Grade.objects.bulk_update(
+            changed,
+            ["marks_obtained", "total_marks", "remarks", "uploaded_by", "updated_at"],
+            batch_size=500,
+        )
+        refresh_rankings(partitions)
+    return len(grades), []
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import statistics
+import time
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from core.models import *
+
+from .benchmark_views import percentile
+
+ROLES = ["admin", "teacher", "student", "parent"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the sync and async versions of the four dashboards through "
+        "the ASGI application with --concurrency requests in flight and "
+        "compare their latency percentiles and throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument(
+            "--requests", type=int, default=400, help="Requests per dashboard"
+        )
+        parser.add_argument("--output", help="Also write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        student = (
+            Student.objects.filter(parent__isnull=False, class_enrolled__isnull=False)
+            .select_related("user", "parent")
+            .order_by("pk")
+            .first()
+        )
+        if student is None:
+            raise CommandError("No students with a parent and class, run seed_school")
+        users = {
+            "admin": User.objects.filter(profile__role="admin").order_by("pk").first(),
+            "teacher": User.objects.filter(profile__role="teacher")
+            .order_by("pk")
+            .first(),
+            "student": student.user,
+            "parent": student.parent,
+        }
+
+        app = get_asgi_application()
+        results = {}
+        for role in ROLES:
+            client = Client(HTTP_HOST="localhost")
+            client.force_login(users[role])
+            cookie = "; ".join(f"{m.key}={m.coded_value}" for m in client.cookies.values())
+            for variant, name in [
+                ("sync", f"{role}_dashboard"),
+                ("async", f"{role}_dashboard_async"),
+            ]:
+                result = asyncio.run(
+                    self.load(app, reverse(name), cookie.encode(), options)
+                )
+                results[f"{role}:{variant}"] = result
+                self.report(f"{role}:{variant}", result)
+
+        self.stdout.write("\nAsync against sync (p50, p99):")
+        for role in ROLES:
+            old, new = results[f"{role}:sync"], results[f"{role}:async"]
+            self.stdout.write(
+                f"{role:8} p50 {old['p50_ms']:8.2f} -> {new['p50_ms']:8.2f} ms  "
+                f"p99 {old['p99_ms']:8.2f} -> {new['p99_ms']:8.2f} ms"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    async def load(self, app, path, cookie, options):
+        await self.get(app, path, cookie)  # warm up
+        remaining = options["requests"]
+        timings = []
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                await self.get(app, path, cookie)
+                timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(options["concurrency"])))
+        elapsed = time.perf_counter() - start
+
+        timings = sorted(t * 1000 for t in timings)
+        return {
+            "requests": len(timings),
+            "per_second": round(len(timings) / elapsed, 1),
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p99_ms": round(percentile(timings, 99), 3),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:16} p50 {result['p50_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+            f"{result['per_second']:7.1f} req/s"
+        )
+
+    async def get(self, app, path, cookie):
+        """Send one GET through the ASGI application as a server would"""
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"localhost"), (b"cookie", cookie)],
+            "client": ("127.0.0.1", 0),
+            "server": ("localhost", 80),
+        }
+        status = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        await app(scope, receive, send)
+        if status[0] != 200:
+            raise CommandError(f"GET {path} returned {status[0]}")
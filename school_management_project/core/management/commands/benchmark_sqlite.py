@@ -0,0 +1,196 @@
+import datetime
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections
+from django.test import Client
+from django.urls import reverse
+
+from core.models import *
+
+from .benchmark_views import percentile
+
+# The stock Django setup: rollback journal, sqlite3's 5 second busy
+# timeout and a new connection per request
+DEFAULT_PROFILE = {
+    "OPTIONS": {},
+    "CONN_MAX_AGE": 0,
+    "CONN_HEALTH_CHECKS": False,
+    "PRAGMAS": {"journal_mode": "delete"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the default SQLite setup with settings.SQLITE_PRODUCTION "
+        "under concurrent load: reader threads open student dashboards while "
+        "writer threads mark attendance, like the morning rush. Each profile "
+        "runs on its own copy of the current database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=10)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument("--output", help="Also write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        original = connections.settings["default"]
+        if original["ENGINE"] != "django.db.backends.sqlite3":
+            raise CommandError("benchmark_sqlite needs a SQLite default database")
+
+        students = list(
+            Student.objects.filter(class_enrolled__isnull=False)
+            .select_related("user")
+            .order_by("pk")[: options["readers"]]
+        )
+        if not students:
+            raise CommandError("No students in classes, run seed_school")
+        self.readers = [student.user for student in students]
+        self.teacher = User.objects.filter(profile__role="teacher").order_by("pk")[0]
+        self.classes = {}
+        for class_id, student_id in Student.objects.filter(
+            class_enrolled__isnull=False
+        ).values_list("class_enrolled", "pk"):
+            self.classes.setdefault(class_id, []).append(student_id)
+
+        profiles = {"default": DEFAULT_PROFILE, "production": settings.SQLITE_PRODUCTION}
+        results = {}
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                for name, profile in profiles.items():
+                    path = os.path.join(tmp, f"{name}.sqlite3")
+                    self.copy_database(original["NAME"], path)
+                    self.use_database({**original, **profile, "NAME": path})
+                    results[name] = self.run(options)
+                    self.report(name, results[name])
+                    self.use_database(original)
+        finally:
+            self.use_database(original)
+
+        self.compare(results["default"], results["production"])
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def copy_database(self, source, target):
+        src, dst = sqlite3.connect(source), sqlite3.connect(target)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+
+    def use_database(self, settings_dict):
+        connections.close_all()
+        try:
+            del connections["default"]
+        except AttributeError:
+            pass
+        connections.settings["default"] = settings_dict
+
+    def run(self, options):
+        samples = {"read": [], "write": []}
+        errors = {"read": 0, "write": 0}
+        lock = threading.Lock()
+        ready = threading.Barrier(options["readers"] + options["writers"] + 1)
+        deadline = []
+
+        def worker(kind, user, seed):
+            rng = random.Random(seed)
+            client = Client(HTTP_HOST="localhost")
+            client.force_login(user)
+            close_old_connections()
+            request = self.reader_request if kind == "read" else self.writer_request
+            ready.wait()
+            timings, failed = [], 0
+            try:
+                while time.perf_counter() < deadline[0]:
+                    start = time.perf_counter()
+                    try:
+                        ok = request(client, rng).status_code < 400
+                    except OperationalError:
+                        ok = False
+                    # The test client keeps connections open; close them the
+                    # way a server does at the end of a request
+                    close_old_connections()
+                    if ok:
+                        timings.append(time.perf_counter() - start)
+                    else:
+                        failed += 1
+            finally:
+                connections.close_all()
+            with lock:
+                samples[kind].extend(timings)
+                errors[kind] += failed
+
+        threads = [
+            threading.Thread(
+                target=worker, args=("read", self.readers[i % len(self.readers)], i)
+            )
+            for i in range(options["readers"])
+        ] + [
+            threading.Thread(target=worker, args=("write", self.teacher, 1000 + i))
+            for i in range(options["writers"])
+        ]
+        for thread in threads:
+            thread.start()
+        deadline.append(time.perf_counter() + options["seconds"])
+        ready.wait()
+        for thread in threads:
+            thread.join()
+
+        return {
+            kind: self.summarize(samples[kind], errors[kind], options["seconds"])
+            for kind in samples
+        }
+
+    def reader_request(self, client, rng):
+        return client.get(reverse("student_dashboard"))
+
+    def writer_request(self, client, rng):
+        class_id = rng.choice(list(self.classes))
+        date = datetime.date(2020, 1, 1) + datetime.timedelta(days=rng.randrange(365))
+        data = {"date": date.isoformat()}
+        for student_id in self.classes[class_id]:
+            data[f"status_{student_id}"] = rng.choice(["present", "absent", "late"])
+        return client.post(reverse("mark_attendance", args=[class_id]), data)
+
+    def summarize(self, timings, errors, seconds):
+        timings = sorted(t * 1000 for t in timings)
+        if not timings:
+            return {"requests": 0, "per_second": 0, "errors": errors}
+        return {
+            "requests": len(timings),
+            "per_second": round(len(timings) / seconds, 1),
+            "errors": errors,
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p99_ms": round(percentile(timings, 99), 3),
+        }
+
+    def report(self, name, result):
+        for kind, stats in result.items():
+            line = f"{name:12} {kind:6} {stats['per_second']:8.1f} req/s"
+            if stats["requests"]:
+                line += f"  p50 {stats['p50_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms"
+            self.stdout.write(f"{line}  {stats['errors']} errors")
+
+    def compare(self, before, after):
+        self.stdout.write("\nProduction profile against the default:")
+        for kind in before:
+            old, new = before[kind]["per_second"], after[kind]["per_second"]
+            change = f"{new / old:.2f}x" if old else "n/a"
+            self.stdout.write(
+                f"{kind:6} {old:8.1f} -> {new:8.1f} req/s ({change}), errors "
+                f"{before[kind]['errors']} -> {after[kind]['errors']}"
+            )
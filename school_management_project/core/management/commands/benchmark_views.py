@@ -0,0 +1,238 @@
+import json
+import math
+import statistics
+import subprocess
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from core import utils
+from core.models import *
+from core.profiler import QueryRecorder, recording
+
+# url name -> (role that opens the page, function returning the reverse() kwargs)
+ROUTES = {
+    "login": (None, None),
+    "dashboard": ("admin", None),
+    "admin_dashboard": ("admin", None),
+    "teacher_dashboard": ("teacher", None),
+    "student_dashboard": ("student", None),
+    "parent_dashboard": ("parent", None),
+    "admin_dashboard_async": ("admin", None),
+    "teacher_dashboard_async": ("teacher", None),
+    "student_dashboard_async": ("student", None),
+    "parent_dashboard_async": ("parent", None),
+    "student_list": ("admin", None),
+    "student_create": ("admin", None),
+    "at_risk_students": ("admin", None),
+    "mark_attendance": ("teacher", lambda s: {"class_id": s.class_enrolled_id}),
+    "mark_grade_attendance": (
+        "admin",
+        lambda s: {"class_name": s.class_enrolled.name},
+    ),
+    "upload_grades": ("teacher", None),
+    "assignment_list": ("student", None),
+    "assignment_create": ("teacher", None),
+    "submit_assignment": (
+        "student",
+        lambda s: {
+            "assignment_id": Assignment.objects.filter(
+                class_subject__class_obj=s.class_enrolled_id
+            )
+            .values_list("pk", flat=True)
+            .first()
+        },
+    ),
+    "announcement_create": ("admin", None),
+    "send_message": ("teacher", None),
+    "broadcast_message": ("teacher", None),
+    "inbox": ("teacher", None),
+    "conversation": ("teacher", lambda s: {"user_id": s.user_id}),
+    "child_details": ("parent", lambda s: {"student_id": s.pk}),
+    "search": ("teacher", None),
+    "query_profile": ("admin", None),
+}
+# url name -> query string to request it with
+QUERIES = {"search": {"q": "lessons"}}
+# Routes that change state on GET, or need state set up by an earlier POST
+SKIPPED_ROUTES = {
+    "logout",
+    "start_chunked_upload",
+    "upload_chunk",
+    "request_report",
+    "report_job",
+    "download_report",
+}
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a sorted list"""
+    rank = max(1, math.ceil(pct / 100 * len(samples)))
+    return samples[rank - 1]
+
+
+def summarize(timings, queries):
+    timings = sorted(t * 1000 for t in timings)
+    return {
+        "runs": len(timings),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p90_ms": round(percentile(timings, 90), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "queries": queries,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every core route and the report functions against the current "
+        "database (see seed_school) and write latency percentiles and query "
+        "counts to a JSON file. Pass --compare to diff against an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--report-iterations", type=int, default=3)
+        parser.add_argument("--output", default="benchmark-results.json")
+        parser.add_argument("--compare", help="Earlier results file to diff against")
+        parser.add_argument(
+            "--skip-reports", action="store_true", help="Only benchmark the views"
+        )
+
+    def handle(self, *args, **options):
+        student = (
+            Student.objects.filter(parent__isnull=False, class_enrolled__isnull=False)
+            .select_related("class_enrolled", "user", "parent")
+            .order_by("pk")
+            .first()
+        )
+        if student is None:
+            raise CommandError("No students with a parent and class, run seed_school")
+
+        teacher = (
+            ClassSubject.objects.filter(class_obj=student.class_enrolled_id)
+            .values_list("teacher", flat=True)
+            .first()
+        )
+        users = {
+            "admin": User.objects.filter(profile__role="admin").order_by("pk").first(),
+            "teacher": User.objects.get(pk=teacher),
+            "student": student.user,
+            "parent": student.parent,
+        }
+        clients = {}
+        for role, user in users.items():
+            clients[role] = Client(HTTP_HOST="localhost")
+            clients[role].force_login(user)
+        clients[None] = Client(HTTP_HOST="localhost")
+
+        results = {}
+        for name in self.route_names():
+            role, kwargs = ROUTES[name]
+            url = reverse(name, kwargs=kwargs(student) if kwargs else None)
+            client = clients[role]
+            results[f"view:{name}"] = self.measure(
+                lambda: self.check_response(client.get(url, QUERIES.get(name)), url),
+                options["iterations"],
+            )
+            self.report(f"view:{name}", results[f"view:{name}"])
+
+        if not options["skip_reports"]:
+            class_obj = student.class_enrolled
+            reports = {
+                "generate_student_report": lambda: utils.generate_student_report(
+                    student
+                ),
+                "generate_class_report": lambda: utils.generate_class_report(class_obj),
+                "generate_school_report": utils.generate_school_report,
+                "generate_report_cards:class": lambda: utils.generate_report_cards(
+                    class_obj.students.all()
+                ),
+            }
+            for name, func in reports.items():
+                results[f"report:{name}"] = self.measure(
+                    func, options["report_iterations"]
+                )
+                self.report(f"report:{name}", results[f"report:{name}"])
+
+        data = {
+            "meta": {
+                "commit": git_commit(),
+                "created": timezone.now().isoformat(),
+                "students": Student.objects.count(),
+                "attendance": Attendance.objects.count(),
+                "grades": Grade.objects.count(),
+                "messages": Message.objects.count(),
+                "database": connection.vendor,
+            },
+            "results": results,
+        }
+        with open(options["output"], "w") as f:
+            json.dump(data, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                self.compare(json.load(f)["results"], results)
+
+    def route_names(self):
+        names = [
+            pattern.name
+            for pattern in get_resolver("core.urls").url_patterns
+            if pattern.name not in SKIPPED_ROUTES
+        ]
+        missing = [name for name in names if name not in ROUTES]
+        if missing:
+            raise CommandError(f"No benchmark set up for: {', '.join(missing)}")
+        return names
+
+    def check_response(self, response, url):
+        if response.status_code >= 400:
+            raise CommandError(f"GET {url} returned {response.status_code}")
+
+    def measure(self, func, iterations):
+        func()  # warm up caches and the connection
+        # Each request resets connection.queries, so count with a recorder.
+        # The active one also sees the queries the async dashboards run in
+        # sync_to_async threads, which connection.execute_wrapper would miss.
+        recorder = QueryRecorder()
+        with recording(recorder):
+            func()
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return summarize(timings, recorder.count)
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:45} p50 {result['p50_ms']:9.2f} ms  "
+            f"p99 {result['p99_ms']:9.2f} ms  {result['queries']:4d} queries"
+        )
+
+    def compare(self, before, after):
+        self.stdout.write("\nChange against the earlier run (p50, queries):")
+        for name, new in after.items():
+            old = before.get(name)
+            if old is None:
+                self.stdout.write(f"{name:45} new")
+                continue
+            change = (new["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+            self.stdout.write(
+                f"{name:45} {old['p50_ms']:9.2f} -> {new['p50_ms']:9.2f} ms "
+                f"({change:+6.1f}%)  {old['queries']:4d} -> {new['queries']:4d}"
+            )
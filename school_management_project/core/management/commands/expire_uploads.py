@@ -0,0 +1,21 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from core.uploads import expire_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Discard chunked submission uploads that have not received a chunk "
+        "for a while, with their partial files. Run periodically from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours", type=int, default=48, help="Idle time before an upload expires"
+        )
+
+    def handle(self, *args, **options):
+        count = expire_uploads(datetime.timedelta(hours=options["hours"]))
+        self.stdout.write(self.style.SUCCESS(f"Discarded {count} stale uploads"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from core.models import UserProfile
+from core.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the thumbnails of every profile picture that does not have "
+        "them yet, e.g. pictures uploaded before thumbnails existed."
+    )
+
+    def handle(self, *args, **options):
+        profiles = (
+            UserProfile.objects.filter(thumbnails_ready=False)
+            .exclude(profile_picture="")
+            .exclude(profile_picture=None)
+            .values_list("pk", "profile_picture")
+        )
+        for pk, name in list(profiles):
+            generate_thumbnails(pk, name)
+        ready = UserProfile.objects.filter(thumbnails_ready=True).count()
+        self.stdout.write(
+            self.style.SUCCESS(f"{ready} profile pictures have thumbnails")
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.models import AttendanceSummary
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the monthly attendance summaries from the raw attendance "
+        "rows. Run after migrating an existing database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        AttendanceSummary.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {AttendanceSummary.objects.count()} attendance summaries"
+            )
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Conversation
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the inbox conversations and unread message counts from the "
+        "messages. Run after migrating an existing database, and after loading "
+        "messages in bulk or deleting them in the admin, which bypass the "
+        "signals that keep them up to date."
+    )
+
+    def handle(self, *args, **options):
+        Conversation.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {Conversation.objects.count()} conversations"
+            )
+        )
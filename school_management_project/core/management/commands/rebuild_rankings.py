@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.models import ClassRank, SubjectRank, rebuild_rankings
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every class and subject ranking from the grades. Run after "
+        "migrating an existing database, and after loading grades in bulk or "
+        "moving students between classes, which bypass the signals and imports "
+        "that keep them up to date."
+    )
+
+    def handle(self, *args, **options):
+        rebuild_rankings()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Ranked {SubjectRank.objects.count()} grades and "
+                f"{ClassRank.objects.count()} class places"
+            )
+        )
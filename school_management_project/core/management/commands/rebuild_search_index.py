@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.models import SearchEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Recreate the full-text search index from the students, messages, "
+        "announcements and assignments. Run after migrating an existing "
+        "database and after loading data in bulk, which bypasses the signals "
+        "that keep the index up to date."
+    )
+
+    def handle(self, *args, **options):
+        SearchEntry.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {SearchEntry.objects.count()} rows")
+        )
@@ -0,0 +1,28 @@
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management.base import BaseCommand
+
+from core.models import StoredBlob
+from core.thumbnails import remove_orphan_thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the references to each stored upload from the file fields "
+        "and delete the files and thumbnails nothing refers to any more. Run "
+        "periodically (e.g. nightly from cron) to correct drift from failed "
+        "saves or rows removed without signals."
+    )
+
+    def handle(self, *args, **options):
+        orphans = StoredBlob.reconcile()
+        for name in orphans:
+            # Skip the reference counting, these files have no references left
+            FileSystemStorage.delete(default_storage, name)
+        thumbnails = remove_orphan_thumbnails()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Reconciled {StoredBlob.objects.count()} stored files, "
+                f"deleted {len(orphans)} unreferenced and {thumbnails} "
+                "thumbnails of deleted pictures"
+            )
+        )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core.models import DashboardCounter
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the admin dashboard counters from the source tables. "
+        "Run after migrating an existing database, and periodically (e.g. "
+        "nightly from cron) to correct drift from bulk writes that bypass "
+        "signals."
+    )
+
+    def handle(self, *args, **options):
+        before = {
+            (c.name, c.academic_year): c.value for c in DashboardCounter.objects.all()
+        }
+        after = DashboardCounter.reconcile()
+        drifted = {
+            key: (before.get(key, 0), value)
+            for key, value in after.items()
+            if before.get(key, 0) != value
+        }
+        for (name, year), (old, new) in sorted(drifted.items()):
+            self.stdout.write(f"{name} {year or '(all)'}: {old} -> {new}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Reconciled {len(after)} counters, {len(drifted)} had drifted"
+            )
+        )
@@ -0,0 +1,37 @@
+import datetime
+import os
+
+from django.core.management.base import BaseCommand
+
+from core.models import ReportJob
+from core.reports import run_worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the reports queued through the report API in a pool of "
+        "worker processes. Runs until interrupted, or until the queue is "
+        "empty with --once. Jobs older than --keep-days are deleted first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Worker processes, 0 renders in this process",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0, help="Seconds between polls"
+        )
+        parser.add_argument("--keep-days", type=int, default=7)
+        parser.add_argument("--once", action="store_true")
+
+    def handle(self, *args, **options):
+        pruned = ReportJob.prune(datetime.timedelta(days=options["keep_days"]))
+        if pruned:
+            self.stdout.write(f"Deleted {pruned} old report jobs")
+        handled = run_worker(
+            options["workers"], options["poll_interval"], once=options["once"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rendered {handled} reports"))
@@ -0,0 +1,310 @@
+import datetime
+import random
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import *
+
+FIRST_NAMES = [
+    "Aarav", "Aditi", "Amelia", "Arjun", "Diya", "Ethan", "Fatima", "Hiro",
+    "Isha", "Kabir", "Layla", "Lucas", "Maya", "Noah", "Olivia", "Priya",
+    "Rohan", "Sara", "Tanvi", "Vikram", "Yusuf", "Zara",
+]
+LAST_NAMES = [
+    "Bose", "Chen", "Das", "Fernandes", "Garcia", "Gupta", "Iyer", "Khan",
+    "Kumar", "Mehta", "Nair", "Patel", "Rao", "Reddy", "Shah", "Singh",
+    "Smith", "Tanaka", "Verma", "Williams",
+]
+SUBJECTS = [
+    ("MATH", "Mathematics"),
+    ("ENG", "English"),
+    ("SCI", "Science"),
+    ("HIST", "History"),
+    ("GEO", "Geography"),
+    ("CS", "Computer Science"),
+    ("ART", "Art"),
+    ("PE", "Physical Education"),
+    ("MUS", "Music"),
+    ("LANG", "Second Language"),
+]
+EXAM_TYPES = ["Unit Test 1", "Midterm", "Unit Test 2", "Final", "Quiz", "Project"]
+STATUS_WEIGHTS = [("present", 88), ("absent", 6), ("late", 4), ("excused", 2)]
+
+
+def bulk(model, objs, batch_size=2000):
+    """bulk_create an iterable in batches without materializing all of it"""
+    objs = iter(objs)
+    created = 0
+    while batch := list(islice(objs, batch_size)):
+        model.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill an empty database with a synthetic school: classes, students "
+        "with parents, attendance history, grades, assignments, submissions, "
+        "messages and announcements. Every seeded user's password is "
+        "'password'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--classes", type=int, default=20)
+        parser.add_argument("--students-per-class", type=int, default=30)
+        parser.add_argument("--subjects", type=int, default=6)
+        parser.add_argument(
+            "--days", type=int, default=180, help="School days of attendance"
+        )
+        parser.add_argument(
+            "--exams", type=int, default=4, help="Exams per subject per student"
+        )
+        parser.add_argument(
+            "--assignments",
+            type=int,
+            default=3,
+            help="Assignments per class subject",
+        )
+        parser.add_argument(
+            "--messages", type=int, default=3, help="Messages per student"
+        )
+        parser.add_argument("--announcements", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        if Student.objects.exists():
+            raise CommandError("The database already has students")
+        if not 1 <= options["subjects"] <= len(SUBJECTS):
+            raise CommandError(f"--subjects must be between 1 and {len(SUBJECTS)}")
+
+        self.rng = random.Random(options["seed"])
+        self.password = make_password("password")
+        started = timezone.now()
+
+        with transaction.atomic():
+            self.seed(options)
+            AttendanceSummary.rebuild()
+            DashboardCounter.reconcile()
+            Conversation.rebuild()
+            SearchEntry.rebuild()
+            rebuild_rankings()
+
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f"Seeded the school in {elapsed:.1f}s"))
+
+    def users(self, prefix, count, role):
+        users = [
+            User(
+                username=f"{prefix}{i}",
+                first_name=self.rng.choice(FIRST_NAMES),
+                last_name=self.rng.choice(LAST_NAMES),
+                email=f"{prefix}{i}@school.example",
+                password=self.password,
+            )
+            for i in range(1, count + 1)
+        ]
+        bulk(User, users)
+        users = list(User.objects.filter(username__startswith=prefix).order_by("pk"))
+        bulk(UserProfile, (UserProfile(user=user, role=role) for user in users))
+        return users
+
+    def seed(self, options):
+        rng = self.rng
+        n_classes = options["classes"]
+        per_class = options["students_per_class"]
+        n_students = n_classes * per_class
+
+        admin = self.users("seed_admin", 1, "admin")[0]
+        teachers = self.users(
+            "seed_teacher", max(n_classes, options["subjects"]), "teacher"
+        )
+        # Roughly one parent per 1.5 children, so some families have siblings
+        parents = self.users("seed_parent", max(1, n_students * 2 // 3), "parent")
+        student_users = self.users("seed_student", n_students, "student")
+        self.stdout.write(f"Created {User.objects.count()} users")
+
+        subjects = [
+            Subject(name=name, code=f"{code}101")
+            for code, name in SUBJECTS[: options["subjects"]]
+        ]
+        bulk(Subject, subjects)
+        subjects = list(Subject.objects.order_by("pk"))
+
+        sections = "ABCDEF"
+        classes = [
+            Class(
+                name=f"Grade {i // len(sections) + 1}",
+                section=sections[i % len(sections)],
+                class_teacher=teachers[i % len(teachers)],
+            )
+            for i in range(n_classes)
+        ]
+        bulk(Class, classes)
+        classes = list(Class.objects.order_by("pk"))
+
+        bulk(
+            ClassSubject,
+            (
+                ClassSubject(
+                    class_obj=class_obj,
+                    subject=subject,
+                    teacher=teachers[(c + s) % len(teachers)],
+                )
+                for c, class_obj in enumerate(classes)
+                for s, subject in enumerate(subjects)
+            ),
+        )
+        class_subjects = list(ClassSubject.objects.select_related("class_obj"))
+
+        today = timezone.now().date()
+        bulk(
+            Student,
+            (
+                Student(
+                    user=user,
+                    admission_number=f"ADM{i:06d}",
+                    class_enrolled=classes[i // per_class],
+                    roll_number=i % per_class + 1,
+                    parent=rng.choice(parents),
+                    admission_date=today
+                    - datetime.timedelta(days=rng.randint(30, 3000)),
+                )
+                for i, user in enumerate(student_users)
+            ),
+        )
+        students = list(Student.objects.order_by("pk"))
+        self.stdout.write(
+            f"Created {len(students)} students in {len(classes)} classes"
+        )
+
+        school_days = []
+        day = today
+        while len(school_days) < options["days"]:
+            if day.weekday() < 5:
+                school_days.append(day)
+            day -= datetime.timedelta(days=1)
+        statuses, weights = zip(*STATUS_WEIGHTS)
+        class_teachers = {c.pk: c.class_teacher_id for c in classes}
+        count = bulk(
+            Attendance,
+            (
+                Attendance(
+                    student_id=student.pk,
+                    date=date,
+                    status=status,
+                    marked_by_id=class_teachers[student.class_enrolled_id],
+                )
+                for student in students
+                for date, status in zip(
+                    school_days, rng.choices(statuses, weights, k=len(school_days))
+                )
+            ),
+            batch_size=5000,
+        )
+        self.stdout.write(f"Created {count} attendance records")
+
+        exam_dates = [
+            today - datetime.timedelta(days=30 * i + 7)
+            for i in range(options["exams"])
+        ]
+        count = bulk(
+            Grade,
+            (
+                Grade(
+                    student_id=student.pk,
+                    subject_id=subject.pk,
+                    exam_type=EXAM_TYPES[e % len(EXAM_TYPES)],
+                    marks_obtained=Decimal(rng.randint(20, 100)),
+                    total_marks=Decimal(100),
+                    exam_date=exam_date,
+                    uploaded_by_id=teachers[0].pk,
+                )
+                for student in students
+                for subject in subjects
+                for e, exam_date in enumerate(exam_dates)
+            ),
+            batch_size=5000,
+        )
+        self.stdout.write(f"Created {count} grades")
+
+        now = timezone.now()
+        bulk(
+            Assignment,
+            (
+                Assignment(
+                    title=f"{cs.subject_id}-{cs.class_obj_id} homework {a + 1}",
+                    description="Complete the exercises at the end of the chapter.",
+                    class_subject=cs,
+                    due_date=now + datetime.timedelta(days=rng.randint(-60, 30)),
+                    total_marks=20,
+                    created_by_id=cs.teacher_id,
+                )
+                for cs in class_subjects
+                for a in range(options["assignments"])
+            ),
+        )
+        students_by_class = {}
+        for student in students:
+            students_by_class.setdefault(student.class_enrolled_id, []).append(student)
+        count = bulk(
+            Submission,
+            (
+                Submission(
+                    assignment_id=assignment.pk,
+                    student_id=student.pk,
+                    submission_file="submissions/seed.pdf",
+                    marks_obtained=rng.randint(5, 20) if rng.random() < 0.6 else None,
+                )
+                for assignment in Assignment.objects.select_related("class_subject")
+                for student in students_by_class.get(
+                    assignment.class_subject.class_obj_id, []
+                )
+                if rng.random() < 0.8
+            ),
+            batch_size=5000,
+        )
+        self.stdout.write(f"Created {count} submissions")
+
+        count = bulk(
+            Message,
+            (
+                Message(
+                    sender=sender,
+                    receiver=receiver,
+                    subject=f"Update {m + 1}",
+                    content="Please see the notes about this week's lessons.",
+                    is_read=rng.random() < 0.7,
+                )
+                for user in student_users
+                for m in range(options["messages"])
+                for sender, receiver in [
+                    (rng.choice(teachers), user)
+                    if m % 2 == 0
+                    else (user, rng.choice(teachers))
+                ]
+            ),
+            batch_size=5000,
+        )
+        self.stdout.write(f"Created {count} messages")
+
+        roles = [role for role, _ in UserProfile.ROLE_CHOICES] + [""]
+        bulk(
+            Announcement,
+            (
+                Announcement(
+                    title=f"Announcement {i + 1}",
+                    content="The school will be closed for the public holiday.",
+                    target_role=rng.choice(roles),
+                    target_class=rng.choice(classes) if rng.random() < 0.3 else None,
+                    created_by=admin,
+                    is_active=rng.random() < 0.8,
+                )
+                for i in range(options["announcements"])
+            ),
+        )
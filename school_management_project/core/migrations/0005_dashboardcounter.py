@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_list_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20)),
+                ('academic_year', models.CharField(blank=True, max_length=20)),
+                ('value', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('name', 'academic_year')},
+            },
+        ),
+    ]
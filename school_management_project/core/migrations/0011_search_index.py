@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_report_jobs'),
+    ]
+
+    operations = [
+        # Fill it with the rebuild_search_index command
+        migrations.RunSQL(
+            sql=(
+                "CREATE VIRTUAL TABLE core_search USING fts5("
+                "heading, body, audience, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4 5 6 7 8')"
+            ),
+            reverse_sql="DROP TABLE core_search",
+        ),
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('rowid', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('heading', models.TextField()),
+                ('body', models.TextField()),
+                ('audience', models.TextField()),
+            ],
+            options={
+                'db_table': 'core_search',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubjectRank',
+            fields=[
+                ('grade', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='subject_rank', serialize=False, to='core.grade')),
+                ('rank', models.PositiveIntegerField()),
+                ('out_of', models.PositiveIntegerField()),
+                ('percentile', models.FloatField()),
+                ('class_obj', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.class')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ClassRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exam_type', models.CharField(max_length=50)),
+                ('average', models.FloatField()),
+                ('rank', models.PositiveIntegerField()),
+                ('out_of', models.PositiveIntegerField()),
+                ('percentile', models.FloatField()),
+                ('class_obj', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.class')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='class_ranks', to='core.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['class_obj', 'exam_type'], name='classrank_class_idx')],
+                'unique_together': {('student', 'class_obj', 'exam_type')},
+            },
+        ),
+    ]
@@ -1,6 +1,26 @@
-from django.db import models
+import datetime
+import uuid
+from itertools import islice
+
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.db.models.functions import (
+    Cast,
+    Coalesce,
+    Concat,
+    Greatest,
+    NullIf,
+    PercentRank,
+    Rank,
+    Round,
+    TruncMonth,
+)
 from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+
+from .storage import BLOB_DIR
 
 
 class UserProfile(models.Model):
@@ -17,11 +37,96 @@ class UserProfile(models.Model):
     address = models.TextField(blank=True)
     profile_picture = models.ImageField(upload_to="profiles/", blank=True, null=True)
     date_of_birth = models.DateField(null=True, blank=True)
+    # Set once core.thumbnails has rendered the picture's variants
+    thumbnails_ready = models.BooleanField(default=False, editable=False)
+    # Sum of the user's Conversation.unread, maintained alongside it
+    unread_messages = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.role}"
 
 
+def stored_file_fields():
+    """(model, field name) of every file field kept in the blob storage"""
+    return [
+        (UserProfile, "profile_picture"),
+        (Assignment, "attachment"),
+        (Submission, "submission_file"),
+        (ReportJob, "result"),
+    ]
+
+
+class StoredBlob(models.Model):
+    """Reference count of one file kept by ContentAddressedStorage"""
+
+    name = models.CharField(max_length=100, unique=True)
+    size = models.PositiveBigIntegerField()
+    refs = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} references)"
+
+    @classmethod
+    def acquire(cls, name, size, store):
+        """Add a reference to ``name``, calling ``store()`` to write the file
+
+        Both statements write before ``store()`` runs, so the transaction
+        holds the write lock (on the row, or on the whole SQLite database)
+        until the file is in place and a release() of the same blob waits.
+        """
+        with transaction.atomic():
+            cls.objects.bulk_create([cls(name=name, size=size)], ignore_conflicts=True)
+            cls.objects.filter(name=name).update(refs=F("refs") + 1)
+            store()
+
+    @classmethod
+    def release(cls, name, remove):
+        """Drop a reference to ``name``, calling ``remove()`` with the last
+
+        A file without a row predates the refcounts and is removed straight
+        away. Otherwise the file only goes when the row is deleted, and the
+        write lock taken by the first UPDATE is held until it is gone, so an
+        acquire() of the same content waits and then writes the file again.
+        """
+        with transaction.atomic():
+            if not cls.objects.filter(name=name).update(refs=F("refs") - 1):
+                remove()
+                return
+            deleted, _ = cls.objects.filter(name=name, refs__lte=0).delete()
+            if deleted:
+                remove()
+
+    @classmethod
+    def reconcile(cls):
+        """Recount the references from the file fields that use the storage
+
+        Returns the names of blobs nothing refers to any more; their rows
+        are removed and the caller may delete the files.
+        """
+        counts = {}
+        for model, field in stored_file_fields():
+            rows = (
+                model.objects.filter(**{f"{field}__startswith": f"{BLOB_DIR}/"})
+                .values_list(field)
+                .annotate(n=models.Count("pk"))
+                .order_by()
+            )
+            for name, n in rows:
+                counts[name] = counts.get(name, 0) + n
+
+        with transaction.atomic():
+            orphans = list(
+                cls.objects.exclude(name__in=counts).values_list("name", flat=True)
+            )
+            cls.objects.filter(name__in=orphans).delete()
+            for blob in cls.objects.all():
+                if blob.refs != counts[blob.name]:
+                    blob.refs = counts[blob.name]
+                    blob.save(update_fields=["refs"])
+        return orphans
+
+
 class Class(models.Model):
     name = models.CharField(max_length=50)
     section = models.CharField(max_length=10)
@@ -91,6 +196,11 @@ class Student(models.Model):
 
     class Meta:
         unique_together = ["class_enrolled", "roll_number"]
+        # Ascending indexes on purpose: walked backwards they yield
+        # (admission_date, id) descending, the keyset order of student_list.
+        indexes = [
+            models.Index(fields=["admission_date"], name="student_admission_date_idx"),
+        ]
 
     def __str__(self):
         return f"{self.admission_number} - {self.user.get_full_name()}"
@@ -111,8 +221,12 @@ class Attendance(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES)
     remarks = models.TextField(blank=True)
     marked_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    # Change stamp for report fingerprints, see core.reports
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
+        # The (student, date) unique index already serves "latest records of a
+        # student" lookups, SQLite walks it backwards for ORDER BY -date.
         unique_together = ["student", "date"]
         ordering = ["-date"]
 
@@ -120,6 +234,230 @@ class Attendance(models.Model):
         return f"{self.student} - {self.date} - {self.status}"
 
 
+class AttendanceSummary(models.Model):
+    """Per-student, per-month attendance counts kept in sync with Attendance"""
+
+    student = models.ForeignKey(
+        Student, on_delete=models.CASCADE, related_name="attendance_summaries"
+    )
+    month = models.DateField()
+    present = models.PositiveIntegerField(default=0)
+    absent = models.PositiveIntegerField(default=0)
+    late = models.PositiveIntegerField(default=0)
+    excused = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Attendance summaries"
+        unique_together = ["student", "month"]
+        ordering = ["-month"]
+
+    def __str__(self):
+        return f"{self.student} - {self.month:%b %Y}"
+
+    @property
+    def total(self):
+        return self.present + self.absent + self.late + self.excused
+
+    @staticmethod
+    def _counts(queryset):
+        return queryset.order_by().annotate(
+            **{
+                status: models.Count("pk", filter=models.Q(status=status))
+                for status, _ in Attendance.STATUS_CHOICES
+            }
+        )
+
+    @classmethod
+    def _upsert(cls, rows):
+        cls.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["student", "month"],
+            update_fields=[status for status, _ in Attendance.STATUS_CHOICES],
+        )
+
+    @classmethod
+    def refresh(cls, student_ids, dates):
+        """Recompute the summaries of ``student_ids`` for the months of ``dates``
+
+        Only the attendance rows of the affected months are read, so this
+        stays cheap however much history a student has.
+        """
+        student_ids = set(student_ids)
+        dates = [
+            d if isinstance(d, datetime.date) else datetime.date.fromisoformat(d)
+            for d in dates
+        ]
+        for month in {d.replace(day=1) for d in dates}:
+            next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+            counts = cls._counts(
+                Attendance.objects.filter(
+                    student_id__in=student_ids, date__gte=month, date__lt=next_month
+                ).values("student_id")
+            )
+            rows = [cls(month=month, **row) for row in counts]
+
+            with transaction.atomic():
+                cls.objects.filter(month=month, student_id__in=student_ids).exclude(
+                    student_id__in=[row.student_id for row in rows]
+                ).delete()
+                cls._upsert(rows)
+
+    @classmethod
+    def rebuild(cls, batch_size=1000):
+        """Recompute every summary from the raw attendance rows"""
+        counts = cls._counts(
+            Attendance.objects.annotate(month=TruncMonth("date")).values(
+                "student_id", "month"
+            )
+        )
+        rows = (cls(**row) for row in counts.iterator(chunk_size=batch_size))
+        with transaction.atomic():
+            cls.objects.all().delete()
+            while batch := list(islice(rows, batch_size)):
+                cls._upsert(batch)
+
+    @classmethod
+    def percentage_for(cls, student):
+        """Share of recorded days the student was present, from the summaries"""
+        totals = cls.objects.filter(student=student).aggregate(
+            present_days=models.Sum("present"),
+            total_days=models.Sum(
+                models.F("present")
+                + models.F("absent")
+                + models.F("late")
+                + models.F("excused")
+            ),
+        )
+        if not totals["total_days"]:
+            return 0
+        return round(totals["present_days"] / totals["total_days"] * 100, 2)
+
+
+class DashboardCounter(models.Model):
+    """Row counts shown on the admin dashboard, kept up to date by signals
+
+    ``academic_year`` is blank for school-wide totals and set for the
+    per-year breakdowns of students and classes.
+    """
+
+    name = models.CharField(max_length=20)
+    academic_year = models.CharField(max_length=20, blank=True)
+    value = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ["name", "academic_year"]
+
+    def __str__(self):
+        return f"{self.name} ({self.academic_year or 'all years'}): {self.value}"
+
+    @classmethod
+    def add(cls, deltas):
+        """Apply {(name, academic_year): delta} to the counters"""
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                [cls(name=name, academic_year=year) for name, year in deltas],
+                ignore_conflicts=True,
+            )
+            for (name, year), delta in deltas.items():
+                cls.objects.filter(name=name, academic_year=year).update(
+                    value=F("value") + delta
+                )
+
+    @classmethod
+    def count(cls):
+        """Count every counter from the source tables"""
+        counts = {
+            ("students", ""): Student.objects.count(),
+            ("teachers", ""): UserProfile.objects.filter(role="teacher").count(),
+            ("classes", ""): Class.objects.count(),
+            ("subjects", ""): Subject.objects.count(),
+        }
+        per_year = [
+            (
+                "students",
+                Student.objects.values(year=F("class_enrolled__academic_year")),
+            ),
+            ("classes", Class.objects.values(year=F("academic_year"))),
+        ]
+        for name, rows in per_year:
+            rows = rows.exclude(year=None).annotate(n=models.Count("pk")).order_by()
+            for row in rows:
+                counts[name, row["year"]] = row["n"]
+        return counts
+
+    @classmethod
+    def reconcile(cls):
+        """Replace the stored counters with fresh counts"""
+        counts = cls.count()
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(
+                cls(name=name, academic_year=year, value=value)
+                for (name, year), value in counts.items()
+            )
+        return counts
+
+    @classmethod
+    def snapshot(cls):
+        """Return {name: total} and {academic_year: {name: count}} in one query"""
+        totals, years = {}, {}
+        for name, year, value in cls.objects.values_list(
+            "name", "academic_year", "value"
+        ):
+            if year:
+                years.setdefault(year, {})[name] = value
+            else:
+                totals[name] = value
+        return totals, dict(sorted(years.items()))
+
+
+# Lowest percentage for each letter, best first; anything below is an F
+GRADE_LETTERS = [(90, "A+"), (80, "A"), (70, "B"), (60, "C"), (50, "D")]
+
+
+def grade_percentage_expression(prefix=""):
+    """SQL equivalent of Grade.percentage(), before rounding
+
+    ``prefix`` is the path to the grade from the queried model, e.g.
+    ``"grades__"`` on Student.
+    """
+    return models.Case(
+        models.When(
+            **{f"{prefix}total_marks__gt": 0},
+            then=Cast(f"{prefix}marks_obtained", models.FloatField())
+            * 100.0
+            / Cast(f"{prefix}total_marks", models.FloatField()),
+        ),
+        default=models.Value(0.0),
+        output_field=models.FloatField(),
+    )
+
+
+class GradeQuerySet(models.QuerySet):
+    def with_percentage(self):
+        """Annotate ``pct`` and ``letter_grade`` computed by the database
+
+        They match Grade.percentage() and Grade.grade_letter(), and can be
+        filtered, ordered and aggregated on, e.g.
+        ``Grade.objects.with_percentage().filter(subject__code="MATH101",
+        pct__lt=50)``.
+        """
+        return self.annotate(pct=Round(grade_percentage_expression(), 2)).annotate(
+            letter_grade=models.Case(
+                *[
+                    models.When(pct__gte=threshold, then=models.Value(letter))
+                    for threshold, letter in GRADE_LETTERS
+                ],
+                default=models.Value("F"),
+                output_field=models.CharField(),
+            )
+        )
+
+
 class Grade(models.Model):
     student = models.ForeignKey(
         Student, on_delete=models.CASCADE, related_name="grades"
@@ -135,6 +473,17 @@ class Grade(models.Model):
     exam_date = models.DateField()
     remarks = models.TextField(blank=True)
     uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    # Change stamp for report fingerprints, see core.reports
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = GradeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["student", "-exam_date"], name="grade_student_exam_date_idx"
+            ),
+        ]
 
     def percentage(self):
         if self.total_marks > 0:
@@ -143,23 +492,172 @@ class Grade(models.Model):
 
     def grade_letter(self):
         pct = self.percentage()
-        if pct >= 90:
-            return "A+"
-        elif pct >= 80:
-            return "A"
-        elif pct >= 70:
-            return "B"
-        elif pct >= 60:
-            return "C"
-        elif pct >= 50:
-            return "D"
-        else:
-            return "F"
+        for threshold, letter in GRADE_LETTERS:
+            if pct >= threshold:
+                return letter
+        return "F"
 
     def __str__(self):
         return f"{self.student} - {self.subject} - {self.exam_type}"
 
 
+class SubjectRank(models.Model):
+    """A grade's place among its class's grades in the same subject and exam
+
+    Materialized with RANK() and PERCENT_RANK() by refresh_rankings; the
+    class is the student's when the ranks were computed.
+    """
+
+    grade = models.OneToOneField(
+        Grade, on_delete=models.CASCADE, primary_key=True, related_name="subject_rank"
+    )
+    class_obj = models.ForeignKey(Class, on_delete=models.CASCADE, related_name="+")
+    rank = models.PositiveIntegerField()
+    out_of = models.PositiveIntegerField()
+    # Share of the partition ranked below, 100 for the top grade
+    percentile = models.FloatField()
+
+    def __str__(self):
+        return f"{self.grade}: {self.rank} of {self.out_of}"
+
+    @classmethod
+    def rows(cls, partitions=None):
+        """values() of the ranks of ``partitions``, or of every grade"""
+        grades = Grade.objects.filter(student__class_enrolled__isnull=False)
+        if partitions is not None:
+            grades = grades.filter(partitions_q(partitions, "student__class_enrolled"))
+        partition_by = [F("student__class_enrolled"), F("subject"), F("exam_type")]
+        order_by = Round(grade_percentage_expression(), 2).desc()
+        return (
+            grades.order_by()
+            .values(
+                grade=F("pk"),
+                class_obj=F("student__class_enrolled"),
+                rank=models.Window(
+                    Rank(), partition_by=partition_by, order_by=order_by
+                ),
+                out_of=models.Window(models.Count("pk"), partition_by=partition_by),
+                percentile=(
+                    1
+                    - models.Window(
+                        PercentRank(), partition_by=partition_by, order_by=order_by
+                    )
+                )
+                * 100,
+            )
+        )
+
+
+class ClassRank(models.Model):
+    """A student's place in their class by average percentage in one exam type
+
+    Materialized with RANK() and PERCENT_RANK() by refresh_rankings.
+    """
+
+    student = models.ForeignKey(
+        Student, on_delete=models.CASCADE, related_name="class_ranks"
+    )
+    class_obj = models.ForeignKey(Class, on_delete=models.CASCADE, related_name="+")
+    exam_type = models.CharField(max_length=50)
+    average = models.FloatField()
+    rank = models.PositiveIntegerField()
+    out_of = models.PositiveIntegerField()
+    # Share of the class ranked below, 100 for the top student
+    percentile = models.FloatField()
+
+    class Meta:
+        unique_together = ["student", "class_obj", "exam_type"]
+        indexes = [
+            models.Index(fields=["class_obj", "exam_type"], name="classrank_class_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.student} {self.exam_type}: {self.rank} of {self.out_of}"
+
+    @classmethod
+    def insert(cls, partitions=None):
+        """Insert the ranks of ``partitions``, or of every student
+
+        Django 4.2 puts window expressions over aggregates in the GROUP BY,
+        so the averages are grouped by the ORM and ranked around it.
+        """
+        if partitions is None:
+            students = Student.objects.filter(
+                class_enrolled__isnull=False, grades__isnull=False
+            )
+        else:
+            students = Student.objects.filter(
+                partitions_q(partitions, "class_enrolled", "grades__")
+            )
+        averages = (
+            students.order_by()
+            .values(
+                student=F("pk"),
+                class_obj=F("class_enrolled"),
+                exam_type=F("grades__exam_type"),
+            )
+            .annotate(
+                average=Round(models.Avg(grade_percentage_expression("grades__")), 2)
+            )
+        )
+        select_sql, params = averages.query.sql_with_params()
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (student_id, class_obj_id, exam_type, "
+                "average, rank, out_of, percentile) "
+                "SELECT student, class_obj, exam_type, average, RANK() OVER w, "
+                "COUNT(*) OVER (PARTITION BY class_obj, exam_type), "
+                "(1 - PERCENT_RANK() OVER w) * 100 "
+                f"FROM ({select_sql}) averages "
+                "WINDOW w AS (PARTITION BY class_obj, exam_type ORDER BY average DESC)",
+                params,
+            )
+
+
+def partitions_q(partitions, class_path, grade_prefix=""):
+    """Q matching the grades of ``partitions``, (class id, exam type) pairs"""
+    q = models.Q(pk__in=[])
+    for class_id, exam_type in partitions:
+        q |= models.Q(
+            **{class_path: class_id, f"{grade_prefix}exam_type": exam_type}
+        )
+    return q
+
+
+def refresh_rankings(partitions):
+    """Recompute the SubjectRank and ClassRank rows of ``partitions``
+
+    ``partitions`` are (class id, exam type) pairs; only their grades are
+    read, and each rank is one INSERT ... SELECT with window functions.
+    Class ranks depend on every subject, so a partition covers them all.
+    """
+    partitions = set(partitions)
+    if not partitions:
+        return
+    with transaction.atomic():
+        # Also drop the ranks students took with them to another class
+        grades = Grade.objects.filter(
+            partitions_q(partitions, "student__class_enrolled")
+        )
+        SubjectRank.objects.filter(
+            partitions_q(partitions, "class_obj", "grade__")
+            | models.Q(grade__in=grades)
+        ).delete()
+        ClassRank.objects.filter(partitions_q(partitions, "class_obj")).delete()
+        insert_from_select(SubjectRank, SubjectRank.rows(partitions))
+        ClassRank.insert(partitions)
+
+
+def rebuild_rankings():
+    """Recompute every SubjectRank and ClassRank"""
+    with transaction.atomic():
+        SubjectRank.objects.all().delete()
+        ClassRank.objects.all().delete()
+        insert_from_select(SubjectRank, SubjectRank.rows())
+        ClassRank.insert()
+
+
 class Assignment(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -172,6 +670,15 @@ class Assignment(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"], name="assignment_created_at_idx"),
+            models.Index(
+                fields=["created_by", "created_at"],
+                name="assignment_creator_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.title} - {self.class_subject}"
 
@@ -199,11 +706,170 @@ class Submission(models.Model):
 
     class Meta:
         unique_together = ["assignment", "student"]
+        indexes = [
+            models.Index(
+                fields=["assignment"],
+                condition=models.Q(marks_obtained__isnull=True),
+                name="submission_ungraded_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.student} - {self.assignment.title}"
 
 
+class ChunkedUpload(models.Model):
+    """A submission file arriving in chunks, see core.uploads"""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    student = models.ForeignKey(
+        Student, on_delete=models.CASCADE, related_name="chunked_uploads"
+    )
+    assignment = models.ForeignKey(
+        Assignment, on_delete=models.CASCADE, related_name="+"
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size} bytes)"
+
+
+class ReportJob(models.Model):
+    """A report queued for the run_report_worker command, see core.reports
+
+    ``fingerprint`` identifies the data the report was built from, so a
+    finished job is reused for as long as that data stays the same.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+    KIND_CHOICES = [
+        ("student", "Student report"),
+        ("class", "Class report"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    result = models.FileField(upload_to="reports/", blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, related_name="+"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["kind", "object_id", "fingerprint"], name="reportjob_lookup_idx"
+            ),
+            # The worker's queue, oldest first
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(status="pending"),
+                name="reportjob_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} report {self.object_id} ({self.status})"
+
+    @classmethod
+    def submit(cls, kind, object_id, fingerprint, user=None):
+        """Return the job for this report and data, queueing one if needed
+
+        A finished job or one still in the queue for the same fingerprint
+        is returned as is, so repeated requests cost no extra work.
+        """
+        job = (
+            cls.objects.filter(
+                kind=kind,
+                object_id=object_id,
+                fingerprint=fingerprint,
+                status__in=[cls.PENDING, cls.RUNNING, cls.DONE],
+            )
+            .order_by("-created_at")
+            .first()
+        )
+        if job is None:
+            job = cls.objects.create(
+                kind=kind,
+                object_id=object_id,
+                fingerprint=fingerprint,
+                requested_by=user,
+            )
+        return job
+
+    @classmethod
+    def claim(cls):
+        """Mark the oldest pending job running and return it, or None
+
+        The status check in the UPDATE lets several workers share a queue
+        without running a job twice.
+        """
+        while True:
+            job = cls.objects.filter(status=cls.PENDING).order_by("created_at").first()
+            if job is None:
+                return None
+            now = timezone.now()
+            if cls.objects.filter(pk=job.pk, status=cls.PENDING).update(
+                status=cls.RUNNING, started_at=now
+            ):
+                job.status, job.started_at = cls.RUNNING, now
+                return job
+
+    @classmethod
+    def requeue_stale(cls, max_age):
+        """Put back jobs left running for ``max_age`` by a worker that died"""
+        return cls.objects.filter(
+            status=cls.RUNNING, started_at__lt=timezone.now() - max_age
+        ).update(status=cls.PENDING, started_at=None)
+
+    @classmethod
+    def prune(cls, max_age):
+        """Delete jobs that finished more than ``max_age`` ago
+
+        Their files are released through the stored-file signals.
+        """
+        finished = cls.objects.filter(
+            status__in=[cls.DONE, cls.FAILED],
+            finished_at__lt=timezone.now() - max_age,
+        )
+        return finished.delete()[1].get(cls._meta.label, 0)
+
+    def finish(self, name, content, fingerprint):
+        # The data may have changed since the job was queued; file it under
+        # the fingerprint it was actually built from.
+        self.fingerprint = fingerprint
+        self.result.save(name, ContentFile(content), save=False)
+        self.status = self.DONE
+        self.finished_at = timezone.now()
+        self.save(update_fields=["fingerprint", "result", "status", "finished_at"])
+
+    def fail(self, error):
+        self.status = self.FAILED
+        self.error = error
+        self.finished_at = timezone.now()
+        self.save(update_fields=["status", "error", "finished_at"])
+
+
 class Announcement(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
@@ -219,6 +885,15 @@ class Announcement(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        # Feeds OR over target_role/target_class, so the planner walks the
+        # active announcements newest-first and stops at the LIMIT.
+        indexes = [
+            models.Index(
+                fields=["-created_at"],
+                condition=models.Q(is_active=True),
+                name="announcement_active_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -238,6 +913,285 @@ class Message(models.Model):
 
     class Meta:
         ordering = ["-sent_at"]
+        indexes = [
+            models.Index(
+                fields=["receiver", "is_read", "-sent_at"],
+                name="message_receiver_unread_idx",
+            ),
+            models.Index(fields=["receiver", "sent_at"], name="message_inbox_idx"),
+            models.Index(fields=["sender", "sent_at"], name="message_sent_idx"),
+            models.Index(
+                fields=["sender", "receiver", "sent_at"], name="message_thread_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.sender} to {self.receiver} - {self.subject}"
+
+    @classmethod
+    def broadcast(cls, sender, receivers, subject, content):
+        """Send one message to every user in ``receivers`` (a User queryset)
+
+        The receivers are resolved and every row written by a single
+        INSERT ... SELECT, so the users never round-trip through Python.
+        Returns the number of messages sent.
+        """
+        sent_at = timezone.now()
+        rows = (
+            receivers.exclude(pk=sender.pk)
+            .order_by()
+            .values(
+                receiver=F("pk"),
+                sender=models.Value(sender.pk),
+                subject=models.Value(subject),
+                content=models.Value(content),
+                sent_at=models.Value(sent_at),
+                is_read=models.Value(False),
+            )
+            .distinct()
+        )
+        with transaction.atomic():
+            sent = insert_from_select(cls, rows)
+            sent_now = cls.objects.filter(sender=sender, sent_at=sent_at)
+            Conversation.record(sent_now)
+            SearchEntry.index("message", sent_now)
+        return sent
+
+
+class Conversation(models.Model):
+    """One user's side of their messages with another user
+
+    Kept up to date as messages are sent and read, so the inbox lists
+    threads newest-first from an index and the unread badge is one row.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="conversations"
+    )
+    other = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    last_message = models.ForeignKey(
+        Message, on_delete=models.SET_NULL, null=True, related_name="+"
+    )
+    last_message_at = models.DateTimeField()
+    unread = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ["user", "other"]
+        indexes = [
+            models.Index(
+                fields=["user", "last_message_at"], name="conversation_latest_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} with {self.other}"
+
+    @classmethod
+    def record(cls, messages):
+        """Fold newly sent ``messages`` (a Message queryset) into both sides'
+        conversations and the receivers' unread counts
+        """
+        messages = messages.order_by()
+        table = connection.ops.quote_name(cls._meta.db_table)
+        newer = f"excluded.last_message_at >= {table}.last_message_at"
+        on_conflict = (
+            "ON CONFLICT (user_id, other_id) DO UPDATE SET "
+            f"last_message_id = CASE WHEN {newer} THEN excluded.last_message_id "
+            f"ELSE {table}.last_message_id END, "
+            f"last_message_at = CASE WHEN {newer} THEN excluded.last_message_at "
+            f"ELSE {table}.last_message_at END, "
+            f"unread = {table}.unread + excluded.unread"
+        )
+        sides = [
+            ("receiver", "sender", models.Count("pk", filter=models.Q(is_read=False))),
+            ("sender", "receiver", models.Value(0)),
+        ]
+        unread = (
+            messages.filter(receiver=models.OuterRef("user"), is_read=False)
+            .values("receiver")
+            .annotate(n=models.Count("pk"))
+            .values("n")
+        )
+        with transaction.atomic():
+            for user, other, unread_count in sides:
+                rows = messages.values(user=F(user), other=F(other)).annotate(
+                    last_message=models.Max("pk"),
+                    last_message_at=models.Max("sent_at"),
+                    unread=unread_count,
+                )
+                insert_from_select(cls, rows, on_conflict)
+            UserProfile.objects.filter(
+                user__in=messages.filter(is_read=False).values("receiver")
+            ).update(unread_messages=F("unread_messages") + models.Subquery(unread))
+
+    def mark_read(self):
+        """Mark everything the other user sent in this conversation as read"""
+        if not self.unread:
+            return 0
+        with transaction.atomic():
+            read = Message.objects.filter(
+                sender=self.other_id, receiver=self.user_id, is_read=False
+            ).update(is_read=True)
+            Conversation.objects.filter(pk=self.pk).update(unread=0)
+            UserProfile.objects.filter(user=self.user_id).update(
+                unread_messages=Greatest(F("unread_messages") - read, 0)
+            )
+        self.unread = 0
+        return read
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every conversation and unread count from the messages"""
+        with transaction.atomic():
+            cls.objects.all().delete()
+            UserProfile.objects.update(unread_messages=0)
+            cls.record(Message.objects.all())
+
+
+class SearchEntry(models.Model):
+    """One row of ``core_search``, the FTS5 index behind core.search
+
+    Mirrors the searchable text of the models in KINDS; the virtual table
+    itself is created by migration 0011. ``audience`` holds tokens naming
+    who may open the row, so role filtering happens inside the MATCH:
+
+    - ``<kind>`` on the kinds some role sees every row of
+    - student: ``su<user id>`` and ``sp<parent id>``
+    - message: ``mu<id>`` for the sender and the receiver
+    - announcement: ``nr<target role or "all">`` and ``nc<target class id>``
+    - assignment: ``ac<class id>`` and ``au<creator id>``
+
+    Kept in sync by signals; bulk writes call index() themselves.
+    """
+
+    KINDS = {
+        "student": Student,
+        "message": Message,
+        "announcement": Announcement,
+        "assignment": Assignment,
+    }
+
+    # pk * len(KINDS) + position of the kind, so every object has a fixed row
+    rowid = models.BigIntegerField(primary_key=True)
+    heading = models.TextField()
+    body = models.TextField()
+    audience = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = "core_search"
+
+    def __str__(self):
+        kind, object_id = self.source
+        return f"{kind} {object_id}: {self.heading}"
+
+    @property
+    def source(self):
+        """The (kind, primary key) this row indexes"""
+        kind, object_id = self.rowid % len(self.KINDS), self.rowid // len(self.KINDS)
+        return list(self.KINDS)[kind], object_id
+
+    @classmethod
+    def rowid_of(cls, kind):
+        return F("pk") * len(cls.KINDS) + list(cls.KINDS).index(kind)
+
+    @classmethod
+    def rows(cls, kind, objects):
+        """``objects`` as a values() queryset in the shape of the index"""
+
+        def text(*parts):
+            return Concat(*parts, output_field=models.TextField())
+
+        space = models.Value(" ")
+        objects = objects.order_by()
+        if kind == "student":
+            return objects.values(
+                rowid=cls.rowid_of(kind),
+                heading=text("user__first_name", space, "user__last_name"),
+                body=text("admission_number", space, "user__username"),
+                audience=text(
+                    models.Value("student su"),
+                    "user_id",
+                    models.Value(" sp"),
+                    "parent_id",
+                ),
+            )
+        if kind == "message":
+            return objects.values(
+                rowid=cls.rowid_of(kind),
+                heading=F("subject"),
+                body=F("content"),
+                audience=text(
+                    models.Value("mu"), "sender_id", models.Value(" mu"), "receiver_id"
+                ),
+            )
+        if kind == "announcement":
+            return objects.filter(is_active=True).values(
+                rowid=cls.rowid_of(kind),
+                heading=F("title"),
+                body=F("content"),
+                audience=text(
+                    models.Value("announcement nr"),
+                    Coalesce(
+                        NullIf("target_role", models.Value("")), models.Value("all")
+                    ),
+                    models.Value(" nc"),
+                    "target_class_id",
+                ),
+            )
+        return objects.values(
+            rowid=cls.rowid_of(kind),
+            heading=F("title"),
+            body=F("description"),
+            audience=text(
+                models.Value("assignment ac"),
+                "class_subject__class_obj_id",
+                models.Value(" au"),
+                "created_by_id",
+            ),
+        )
+
+    @classmethod
+    def index(cls, kind, objects):
+        """Index ``objects``, a queryset of ``kind``, replacing their old rows"""
+        objects = objects.order_by()
+        with transaction.atomic():
+            rowids = objects.values(rowid=cls.rowid_of(kind))
+            cls.objects.filter(pk__in=rowids).delete()
+            insert_from_select(cls, cls.rows(kind, objects))
+
+    @classmethod
+    def remove(cls, kind, pks):
+        offset = list(cls.KINDS).index(kind)
+        cls.objects.filter(pk__in=[pk * len(cls.KINDS) + offset for pk in pks]).delete()
+
+    @classmethod
+    def rebuild(cls):
+        """Reindex everything, then merge the index into one b-tree"""
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with transaction.atomic():
+            cls.objects.all().delete()
+            for kind, model in cls.KINDS.items():
+                insert_from_select(cls, cls.rows(kind, model.objects.all()))
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+
+
+def insert_from_select(model, rows, on_conflict=""):
+    """Insert the rows of ``rows`` into ``model`` with one INSERT ... SELECT
+
+    ``rows`` is a values() queryset whose names are ``model`` field names,
+    so the data never round-trips through Python. Returns the row count.
+    """
+    qn = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in rows.query.annotation_select]
+    select_sql, params = rows.query.sql_with_params()
+    sql = (
+        f"INSERT INTO {qn(model._meta.db_table)} "
+        f"({', '.join(qn(field.column) for field in fields)}) "
+        f"SELECT {', '.join(qn(field.name) for field in fields)} "
+        f"FROM ({select_sql}) selected WHERE true {on_conflict}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
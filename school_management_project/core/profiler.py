@@ -0,0 +1,189 @@
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_stats = {}
+MAX_SHAPES_PER_VIEW = 20
+
+
+# The recorder of the request being profiled. Context variables follow a
+# request into the threads that sync_to_async runs its queries in, where a
+# per-connection execute_wrapper would not reach.
+_active_recorder = ContextVar("query_recorder", default=None)
+
+
+class QueryRecorder:
+    """Execute wrapper that counts and times queries by their SQL shape.
+
+    Django hands the wrapper the SQL with placeholders and the parameters
+    separately, so the SQL string itself is the query shape. Every query is
+    also added to ``parent``, the recorder that was active when this one was
+    created, if any.
+    """
+
+    def __init__(self, parent=None):
+        self.shapes = Counter()
+        self.count = 0
+        self.duration = 0.0
+        self.parent = parent
+        # Async views run queries from several threads at once
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add(sql, time.perf_counter() - start)
+
+    def add(self, sql, elapsed):
+        with self._lock:
+            self.duration += elapsed
+            self.count += 1
+            self.shapes[sql] += 1
+        if self.parent is not None:
+            self.parent.add(sql, elapsed)
+
+
+@contextmanager
+def recording(recorder):
+    """Make ``recorder`` the active one, which sees the queries of this
+    thread and of the sync_to_async threads started from it
+    """
+    token = _active_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _active_recorder.reset(token)
+
+
+def _record_active(execute, sql, params, many, context):
+    recorder = _active_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver hooking QueryProfilerMiddleware into every
+    new connection, whichever thread opens it.
+    """
+    if _record_active not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_active)
+
+
+class QueryProfilerMiddleware:
+    """Record query count, DB time and repeated query shapes per view.
+
+    A request in which one query shape runs QUERY_PROFILER_N1_THRESHOLD
+    times or more is logged as a probable N+1. Set
+    QUERY_PROFILER_SAMPLE_RATE below 1 to profile only a share of requests.
+    Only the middleware listed after it is covered, so it goes first in
+    MIDDLEWARE; the session, auth and role lookups then count too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "QUERY_PROFILER_SAMPLE_RATE", 1.0)
+        self.threshold = getattr(settings, "QUERY_PROFILER_N1_THRESHOLD", 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        with recording(QueryRecorder(parent=_active_recorder.get())) as queries:
+            response = self.get_response(request)
+        self.finish(request, queries)
+        return response
+
+    async def __acall__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return await self.get_response(request)
+
+        with recording(QueryRecorder(parent=_active_recorder.get())) as queries:
+            response = await self.get_response(request)
+        self.finish(request, queries)
+        return response
+
+    def finish(self, request, recorder):
+        match = request.resolver_match
+        if match is not None:
+            self.record(match.view_name, recorder)
+
+    def record(self, view, recorder):
+        repeated = {
+            sql: n for sql, n in recorder.shapes.items() if n >= self.threshold
+        }
+        if repeated:
+            sql, n = max(repeated.items(), key=lambda item: item[1])
+            logger.warning("Probable N+1 in %s: %d x %s", view, n, sql[:300])
+
+        with _lock:
+            stats = _stats.setdefault(
+                view,
+                {
+                    "requests": 0,
+                    "queries": 0,
+                    "db_time": 0.0,
+                    "max_queries": 0,
+                    "n_plus_one_requests": 0,
+                    "repeated": {},
+                },
+            )
+            stats["requests"] += 1
+            stats["queries"] += recorder.count
+            stats["db_time"] += recorder.duration
+            stats["max_queries"] = max(stats["max_queries"], recorder.count)
+            if repeated:
+                stats["n_plus_one_requests"] += 1
+                shapes = stats["repeated"]
+                for sql, n in repeated.items():
+                    if sql in shapes or len(shapes) < MAX_SHAPES_PER_VIEW:
+                        shapes[sql] = max(shapes.get(sql, 0), n)
+
+
+def query_stats():
+    """Per-view aggregates of everything recorded by this process"""
+    with _lock:
+        snapshot = {
+            view: dict(stats, repeated=dict(stats["repeated"]))
+            for view, stats in _stats.items()
+        }
+
+    report = {}
+    for view, stats in sorted(snapshot.items()):
+        requests = stats["requests"]
+        repeated = sorted(stats["repeated"].items(), key=lambda item: -item[1])
+        report[view] = {
+            "requests": requests,
+            "avg_queries": round(stats["queries"] / requests, 2),
+            "max_queries": stats["max_queries"],
+            "avg_db_ms": round(stats["db_time"] * 1000 / requests, 3),
+            "n_plus_one_requests": stats["n_plus_one_requests"],
+            "repeated_queries": [
+                {"sql": sql, "max_per_request": n} for sql, n in repeated[:5]
+            ],
+        }
+    return report
+
+
+def reset_query_stats():
+    with _lock:
+        _stats.clear()
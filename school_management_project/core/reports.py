@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import Attendance, Class, Grade, ReportJob, Student
+from .utils import (
+    class_report_data,
+    render_class_report,
+    render_student_report,
+    student_report_data,
+)
+
+logger = logging.getLogger(__name__)
+
+# kind -> (file extension, renderer taking the report data)
+REPORT_FORMATS = {
+    "student": (".pdf", render_student_report),
+    "class": (".xlsx", render_class_report),
+}
+# A job running this long was left behind by a worker that died
+STALE_AFTER = timedelta(minutes=30)
+
+
+def report_students(kind, object_id):
+    if kind == "student":
+        return Student.objects.filter(pk=object_id)
+    return Student.objects.filter(class_enrolled=object_id)
+
+
+def report_fingerprint(kind, object_id):
+    """Hash of everything the report shows, cheap enough to take per request
+
+    The students' own details are hashed as they are; their grades and
+    attendance through the row count and latest ``updated_at``, which
+    changes whenever a row is added, edited or deleted. Renamed subjects
+    are not picked up until the student's grades next change.
+    """
+    students = report_students(kind, object_id)
+    digest = hashlib.sha256(f"{kind}:{object_id}".encode())
+    if kind == "class":
+        names = Class.objects.filter(pk=object_id).values_list("name", "section")
+        digest.update(repr(list(names)).encode())
+    details = students.order_by("pk").values_list(
+        "pk",
+        "admission_number",
+        "roll_number",
+        "user__first_name",
+        "user__last_name",
+        "class_enrolled__name",
+        "class_enrolled__section",
+        "parent__first_name",
+        "parent__last_name",
+    )
+    digest.update(repr(list(details)).encode())
+    for model in (Grade, Attendance):
+        stamp = model.objects.filter(student__in=students).aggregate(
+            rows=Count("pk"), changed=Max("updated_at")
+        )
+        digest.update(repr(sorted(stamp.items())).encode())
+    return digest.hexdigest()
+
+
+def report_data(kind, object_id):
+    if kind == "student":
+        student = Student.objects.select_related(
+            "user", "class_enrolled", "parent"
+        ).get(pk=object_id)
+        return student_report_data(student)
+    return class_report_data(Class.objects.get(pk=object_id))
+
+
+def render_report(kind, data):
+    """Runs in the worker processes, so it must not touch the database"""
+    return REPORT_FORMATS[kind][1](data)
+
+
+def report_filename(job):
+    return f"{job.kind}-report-{job.object_id}{REPORT_FORMATS[job.kind][0]}"
+
+
+def submit_report(kind, object_id, user=None):
+    """Return the ReportJob serving this report, queueing one if needed"""
+    return ReportJob.submit(kind, object_id, report_fingerprint(kind, object_id), user)
+
+
+def prepare_job(job):
+    """Read a job's data and fingerprint from one snapshot of the database"""
+    with transaction.atomic():
+        return report_fingerprint(job.kind, job.object_id), report_data(
+            job.kind, job.object_id
+        )
+
+
+def _claim_jobs(limit):
+    """Claim up to ``limit`` jobs as (job, fingerprint, data)"""
+    claimed = []
+    while len(claimed) < limit and (job := ReportJob.claim()):
+        try:
+            claimed.append((job, *prepare_job(job)))
+        except (Student.DoesNotExist, Class.DoesNotExist):
+            job.fail(f"The {job.kind} no longer exists")
+        except Exception as exc:
+            logger.exception("Could not read the data of %s", job)
+            job.fail(str(exc) or exc.__class__.__name__)
+    return claimed
+
+
+def _finish(job, fingerprint, render):
+    try:
+        content = render()
+    except Exception as exc:
+        logger.exception("Could not render %s", job)
+        job.fail(str(exc) or exc.__class__.__name__)
+    else:
+        job.finish(report_filename(job), content, fingerprint)
+
+
+def run_worker(workers, poll_interval=1.0, once=False, stale_after=STALE_AFTER):
+    """Render queued reports until interrupted, or until the queue is empty
+    with ``once``. Returns the number of jobs handled.
+
+    Data is read here and only rendering, the slow part, is sent to the
+    ``workers`` processes. With no workers the reports are rendered inline.
+    """
+    handled = 0
+    if not workers:
+        while True:
+            ReportJob.requeue_stale(stale_after)
+            claimed = _claim_jobs(1)
+            for job, fingerprint, data in claimed:
+                _finish(job, fingerprint, lambda: render_report(job.kind, data))
+                handled += 1
+            if not claimed:
+                if once:
+                    return handled
+                time.sleep(poll_interval)
+
+    running = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            if not running:
+                ReportJob.requeue_stale(stale_after)
+            for job, fingerprint, data in _claim_jobs(workers - len(running)):
+                running[pool.submit(render_report, job.kind, data)] = (job, fingerprint)
+            if not running:
+                if once:
+                    return handled
+                time.sleep(poll_interval)
+                continue
+            done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, fingerprint = running.pop(future)
+                _finish(job, fingerprint, future.result)
+                handled += 1
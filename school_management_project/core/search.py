@@ -0,0 +1,146 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import SearchEntry, Student
+
+# Matched terms come back between these and are turned into <mark> tags
+# once the rest of the text is escaped
+MARK_START, MARK_END = "\x02", "\x03"
+MAX_TERMS = 8
+# Longest prefix index of core_search, see migration 0011. FTS5 answers a
+# longer prefix by merging the doclist of every term it covers first.
+LONGEST_PREFIX = 8
+
+
+def match_query(text):
+    """The words of ``text`` as an FTS5 query, the last one as a prefix
+    while it is short enough to have a prefix index
+
+    Only whole words are passed on, quoted, so quotes and operators typed
+    by the user are never parsed as query syntax.
+    """
+    words = re.findall(r"\w+", text)[:MAX_TERMS]
+    terms = [f'"{word}"' for word in words]
+    if words and len(words[-1]) <= LONGEST_PREFIX:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def audience_tokens(user, role):
+    """The SearchEntry.audience tokens of the rows ``user`` may open, by kind
+
+    Mirrors the views: staff see every student, parents their children and
+    students themselves; messages are private to their two users;
+    announcements follow announcement_feed and assignments assignment_list.
+    A kind left out is one the user may not search.
+    """
+    tokens = {"message": [f"mu{user.pk}"]}
+    if role in ("admin", "teacher"):
+        tokens["student"] = ["student"]
+    elif role == "parent":
+        tokens["student"] = [f"sp{user.pk}"]
+    else:
+        tokens["student"] = [f"su{user.pk}"]
+
+    if role == "admin":
+        tokens["announcement"] = ["announcement"]
+    else:
+        tokens["announcement"] = [f"nr{role}", "nrall"]
+
+    if role == "teacher":
+        tokens["assignment"] = [f"au{user.pk}"]
+    elif role == "student":
+        class_id = (
+            Student.objects.filter(user=user)
+            .values_list("class_enrolled", flat=True)
+            .first()
+        )
+        if class_id:
+            tokens["announcement"].append(f"nc{class_id}")
+            tokens["assignment"] = [f"ac{class_id}"]
+    else:
+        tokens["assignment"] = ["assignment"]
+    return tokens
+
+
+def _marked(text):
+    return mark_safe(
+        escape(text).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+    )
+
+
+def _result_url(kind, object_id, audience, user, role):
+    if kind == "student" and role == "parent":
+        return reverse("child_details", kwargs={"student_id": object_id})
+    if kind == "message":
+        # The other of the two mu<id> tokens, or the user for notes to self
+        others = [
+            int(token[2:]) for token in audience.split() if token != f"mu{user.pk}"
+        ]
+        return reverse("conversation", kwargs={"user_id": (others or [user.pk])[0]})
+    if kind == "assignment":
+        if role == "student":
+            return reverse("submit_assignment", kwargs={"assignment_id": object_id})
+        return reverse("assignment_list")
+    return None
+
+
+def search(user, role, text, limit=10):
+    """The newest ``limit`` matches of ``text`` that ``user`` may see, by kind
+
+    Returns ``{kind: [result]}`` in SearchEntry.KINDS order, each result a
+    dict of object_id, title and snippet, with the matched terms in <mark>,
+    and url. The role filter is part of the MATCH and the rows come in
+    rowid order, so FTS5 stops after ``limit`` visible matches instead of
+    ranking every one; bm25() would count the matches of each term over
+    the whole table first.
+    """
+    terms = match_query(text)
+    if not terms:
+        return {}
+    table = connection.ops.quote_name(SearchEntry._meta.db_table)
+    sql = (
+        f"SELECT rowid, highlight({table}, 0, %s, %s), "
+        f"snippet({table}, 1, %s, %s, '…', 16), audience "
+        f"FROM {table} WHERE {table} MATCH %s ORDER BY rowid DESC LIMIT %s"
+    )
+    results = {}
+    with connection.cursor() as cursor:
+        for kind, tokens in audience_tokens(user, role).items():
+            allowed = " OR ".join(tokens)
+            query = f"{{heading body}} : ({terms}) AND audience : ({allowed})"
+            cursor.execute(sql, [MARK_START, MARK_END] * 2 + [query, limit])
+            for rowid, title, snippet, audience in cursor.fetchall():
+                _, object_id = SearchEntry(rowid=rowid).source
+                results.setdefault(kind, []).append(
+                    {
+                        "object_id": object_id,
+                        "title": _marked(title),
+                        "snippet": _marked(snippet),
+                        "url": _result_url(kind, object_id, audience, user, role),
+                    }
+                )
+    return {kind: results[kind] for kind in SearchEntry.KINDS if kind in results}
+
+
+def filter_matching(queryset, kind, text):
+    """Restrict ``queryset``, of ``kind``, to the rows matching ``text``
+
+    Unlike search() nothing is filtered by audience, for the admin.
+    """
+    terms = match_query(text)
+    if not terms:
+        return queryset.none()
+    table = connection.ops.quote_name(SearchEntry._meta.db_table)
+    kinds = len(SearchEntry.KINDS)
+    matching = RawSQL(
+        f"SELECT rowid / {kinds} FROM {table} WHERE {table} MATCH %s "
+        f"AND rowid %% {kinds} = %s",
+        [f"{{heading body}} : ({terms})", list(SearchEntry.KINDS).index(kind)],
+    )
+    return queryset.filter(pk__in=matching)
@@ -0,0 +1,263 @@
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .db import apply_sqlite_pragmas
+from .profiler import install_query_recorder
+from .feeds import invalidate_announcement_feeds
+from .thumbnails import schedule_thumbnails
+from .models import (
+    Announcement,
+    Assignment,
+    Attendance,
+    AttendanceSummary,
+    Class,
+    ClassSubject,
+    Conversation,
+    DashboardCounter,
+    Grade,
+    Message,
+    SearchEntry,
+    Student,
+    Subject,
+    UserProfile,
+    refresh_rankings,
+    stored_file_fields,
+)
+
+
+@receiver(pre_save, sender=Attendance)
+def remember_attendance_slot(sender, instance, **kwargs):
+    # An edit may move a record to another student or month; keep the old
+    # slot so its summary is refreshed too.
+    instance._previous_slot = None
+    if instance.pk:
+        instance._previous_slot = (
+            Attendance.objects.filter(pk=instance.pk)
+            .values_list("student_id", "date")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def refresh_attendance_summary(sender, instance, **kwargs):
+    AttendanceSummary.refresh([instance.student_id], [instance.date])
+    previous = getattr(instance, "_previous_slot", None)
+    if previous and previous != (instance.student_id, instance.date):
+        AttendanceSummary.refresh([previous[0]], [previous[1]])
+
+
+def _grade_partition(student_id, exam_type):
+    class_id = (
+        Student.objects.filter(pk=student_id)
+        .values_list("class_enrolled", flat=True)
+        .first()
+    )
+    return {(class_id, exam_type)} if class_id else set()
+
+
+@receiver(pre_save, sender=Grade)
+def remember_grade_partition(sender, instance, **kwargs):
+    # An edit may move a grade to another student or exam; rerank both
+    instance._previous_partition = set()
+    if instance.pk:
+        previous = (
+            Grade.objects.filter(pk=instance.pk)
+            .values_list("student_id", "exam_type")
+            .first()
+        )
+        if previous:
+            instance._previous_partition = _grade_partition(*previous)
+
+
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+def rerank_grade_partition(sender, instance, **kwargs):
+    refresh_rankings(
+        _grade_partition(instance.student_id, instance.exam_type)
+        | getattr(instance, "_previous_partition", set())
+    )
+
+
+@receiver(pre_save, sender=Student)
+def remember_ranked_class(sender, instance, **kwargs):
+    instance._previous_class_id = None
+    if instance.pk:
+        instance._previous_class_id = (
+            Student.objects.filter(pk=instance.pk)
+            .values_list("class_enrolled", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Student)
+def rerank_moved_student(sender, instance, **kwargs):
+    # A student moving class leaves the old class's rankings and joins the
+    # new one's. QuerySet.update() of class_enrolled skips this; call
+    # refresh_rankings() after such bulk moves.
+    previous = getattr(instance, "_previous_class_id", None)
+    if previous == instance.class_enrolled_id:
+        return
+    exam_types = set(
+        Grade.objects.filter(student=instance).values_list("exam_type", flat=True)
+    )
+    refresh_rankings(
+        (class_id, exam_type)
+        for class_id in (previous, instance.class_enrolled_id)
+        if class_id
+        for exam_type in exam_types
+    )
+
+
+@receiver(post_save, sender=Announcement)
+@receiver(post_delete, sender=Announcement)
+def drop_announcement_feeds(sender, instance, **kwargs):
+    invalidate_announcement_feeds()
+
+
+@receiver(post_save, sender=Message)
+def record_conversation(sender, instance, created, **kwargs):
+    if created:
+        Conversation.record(Message.objects.filter(pk=instance.pk))
+
+
+def index_for_search(sender, instance, **kwargs):
+    SearchEntry.index(
+        sender._meta.model_name, sender.objects.filter(pk=instance.pk)
+    )
+
+
+def remove_from_search(sender, instance, **kwargs):
+    SearchEntry.remove(sender._meta.model_name, [instance.pk])
+
+
+for model in SearchEntry.KINDS.values():
+    post_save.connect(index_for_search, sender=model)
+    post_delete.connect(remove_from_search, sender=model)
+
+
+@receiver(post_save, sender=User)
+def reindex_renamed_student(sender, instance, update_fields=None, **kwargs):
+    # Logging in saves last_login alone, which the index does not show
+    shown = {"first_name", "last_name", "username"}
+    if update_fields is None or shown.intersection(update_fields):
+        SearchEntry.index("student", Student.objects.filter(user=instance))
+
+
+@receiver(post_save, sender=ClassSubject)
+def reindex_moved_assignments(sender, instance, created, **kwargs):
+    if not created:
+        SearchEntry.index(
+            "assignment", Assignment.objects.filter(class_subject=instance)
+        )
+
+
+def _counter_keys(instance):
+    """The dashboard counters a saved instance contributes one to"""
+    if isinstance(instance, Student):
+        keys = {("students", "")}
+        if instance.class_enrolled_id:
+            year = (
+                Class.objects.filter(pk=instance.class_enrolled_id)
+                .values_list("academic_year", flat=True)
+                .first()
+            )
+            if year:
+                keys.add(("students", year))
+        return keys
+    if isinstance(instance, UserProfile):
+        return {("teachers", "")} if instance.role == "teacher" else set()
+    if isinstance(instance, Class):
+        return {("classes", ""), ("classes", instance.academic_year)}
+    return {("subjects", "")}
+
+
+COUNTED_MODELS = [Student, UserProfile, Class, Subject]
+
+
+def remember_counter_keys(sender, instance, **kwargs):
+    instance._counter_keys = set()
+    if not instance._state.adding:
+        previous = sender.objects.filter(pk=instance.pk).first()
+        if previous:
+            instance._counter_keys = _counter_keys(previous)
+            instance._previous_year = getattr(previous, "academic_year", None)
+
+
+def update_counters_on_save(sender, instance, **kwargs):
+    old_keys = getattr(instance, "_counter_keys", set())
+    new_keys = _counter_keys(instance)
+    deltas = {key: 1 for key in new_keys - old_keys}
+    deltas.update({key: -1 for key in old_keys - new_keys})
+
+    # Moving a class to another year moves its students with it
+    previous_year = getattr(instance, "_previous_year", None)
+    if sender is Class and previous_year and previous_year != instance.academic_year:
+        moved = instance.students.count()
+        deltas[("students", previous_year)] = -moved
+        deltas[("students", instance.academic_year)] = moved
+
+    DashboardCounter.add(deltas)
+
+
+def count_students_of_class(sender, instance, **kwargs):
+    # Deleting a class sets its students' class to NULL without signals
+    instance._student_count = instance.students.count()
+
+
+def update_counters_on_delete(sender, instance, **kwargs):
+    deltas = {key: -1 for key in _counter_keys(instance)}
+    if sender is Class:
+        deltas[("students", instance.academic_year)] = -instance._student_count
+    DashboardCounter.add(deltas)
+
+
+for model in COUNTED_MODELS:
+    pre_save.connect(remember_counter_keys, sender=model)
+    post_save.connect(update_counters_on_save, sender=model)
+    post_delete.connect(update_counters_on_delete, sender=model)
+pre_delete.connect(count_students_of_class, sender=Class)
+
+
+connection_created.connect(apply_sqlite_pragmas)
+connection_created.connect(install_query_recorder)
+
+
+def remember_stored_files(sender, instance, **kwargs):
+    instance._stored_files = {}
+    if instance.pk:
+        fields = [field for model, field in stored_file_fields() if model is sender]
+        instance._stored_files = (
+            sender.objects.filter(pk=instance.pk).values(*fields).first() or {}
+        )
+
+
+def release_replaced_files(sender, instance, **kwargs):
+    for field, name in getattr(instance, "_stored_files", {}).items():
+        if name and name != getattr(instance, field).name:
+            getattr(instance, field).storage.delete(name)
+
+
+def release_stored_files(sender, instance, **kwargs):
+    for model, field in stored_file_fields():
+        if model is sender and getattr(instance, field):
+            getattr(instance, field).storage.delete(getattr(instance, field).name)
+
+
+def thumbnail_new_picture(sender, instance, **kwargs):
+    previous = getattr(instance, "_stored_files", {}).get("profile_picture")
+    if not instance.profile_picture or instance.profile_picture.name == previous:
+        return
+    if instance.thumbnails_ready:
+        UserProfile.objects.filter(pk=instance.pk).update(thumbnails_ready=False)
+        instance.thumbnails_ready = False
+    schedule_thumbnails(instance)
+
+
+for model in {model for model, _ in stored_file_fields()}:
+    pre_save.connect(remember_stored_files, sender=model)
+    post_save.connect(release_replaced_files, sender=model)
+    post_delete.connect(release_stored_files, sender=model)
+post_save.connect(thumbnail_new_picture, sender=UserProfile)
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+BLOB_DIR = "blobs"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Store each distinct file once, named after the SHA-256 of its content
+
+    Uploads are hashed while they are copied to a temporary file in chunks,
+    so a large file is never held in memory, then moved to
+    ``blobs/<first two hex digits>/<hash><extension>``. A file that is
+    already stored is not written again. StoredBlob counts the references
+    to each blob and delete() only removes the file when the last one goes,
+    within the transaction that drops the count, so a concurrent save of
+    the same content cannot find the file and then lose it.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Names come from the content, so an existing name is the same file
+        return name
+
+    def blob_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()[:10]
+        return f"{BLOB_DIR}/{digest[:2]}/{digest}{extension}"
+
+    def _save(self, name, content):
+        from .models import StoredBlob
+
+        tmp_dir = self.path(f"{BLOB_DIR}/tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+
+            name = self.blob_name(digest.hexdigest(), name)
+            StoredBlob.acquire(name, size, lambda: self.store_blob(tmp_path, name))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return name
+
+    def store_blob(self, tmp_path, name):
+        """Move the upload at ``tmp_path`` to ``name`` unless it is there"""
+        path = self.path(name)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(tmp_path, self.file_permissions_mode)
+        os.replace(tmp_path, path)
+
+    def delete(self, name):
+        """Drop one reference to ``name``; remove the file with the last one
+
+        The reference goes when the transaction deleting it commits, so a
+        rollback keeps both. Files saved before this storage was in use have
+        no StoredBlob and are deleted as FileSystemStorage would.
+        """
+        from .models import StoredBlob
+
+        remove = super().delete
+        transaction.on_commit(lambda: StoredBlob.release(name, lambda: remove(name)))
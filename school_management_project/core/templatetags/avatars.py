@@ -0,0 +1,36 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from core.thumbnails import avatar_sources
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar(user, size=48):
+    """A ``size`` pixel square avatar of ``user``, from the smallest fitting
+    thumbnail, or a placeholder icon when the user has no picture
+    """
+    profile = getattr(user, "profile", None)
+    sources = avatar_sources(profile, size)
+    if sources is None:
+        return format_html(
+            '<i class="fas fa-user-circle text-muted" style="font-size: {}px"></i>',
+            size,
+        )
+    return format_html(
+        '<picture>{}<img src="{}" alt="{}" width="{}" height="{}" '
+        'class="rounded-circle" loading="lazy"></picture>',
+        format_html_join(
+            "",
+            '<source type="{}" srcset="{}" sizes="{}px">',
+            (
+                (source["type"], source["srcset"], size)
+                for source in sources["sources"]
+            ),
+        ),
+        sources["src"],
+        user.get_full_name() or user.username,
+        size,
+        size,
+    )
@@ -1,3 +1,1864 @@
-from django.test import TestCase
+import base64
+import copy
+import datetime
+import hashlib
+import os
+import re
+import tempfile
+import zipfile
+from decimal import Decimal
+from unittest import mock
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+import numpy as np
+from openpyxl import Workbook, load_workbook
+from PIL import Image
+
+from .analytics import rolling_rates, student_analytics
+from .feeds import VERSION_KEY, announcement_feed
+from .models import *
+from .pagination import keyset_paginate
+from .profiler import (
+    QueryProfilerMiddleware,
+    QueryRecorder,
+    query_stats,
+    recording,
+    reset_query_stats,
+)
+from .reports import run_worker
+from .thumbnails import (
+    THUMBNAIL_FORMATS,
+    THUMBNAIL_SIZES,
+    remove_orphan_thumbnails,
+    thumbnail_name,
+    thumbnail_storage,
+)
+from .uploads import UploadError, append_chunk, upload_path
+from .utils import (
+    _ReportCardsTemplate,
+    class_report_data,
+    generate_report_cards,
+    generate_school_report,
+)
+
+
+def create_user(username, role, **extra):
+    user = User.objects.create(
+        username=username, first_name=username.title(), **extra
+    )
+    UserProfile.objects.create(user=user, role=role)
+    return user
+
+
+def seed_school(classes=2, students_per_class=10, days=20):
+    """Create a small but complete school and return its main objects"""
+    admin = create_user("admin", "admin", is_staff=True)
+    school = {
+        "admin": admin,
+        "teacher": create_user("teacher", "teacher"),
+        "parent": create_user("parent", "parent"),
+        "subject": Subject.objects.create(name="Mathematics", code="MATH101"),
+        "students": [],
+    }
+    add_classes(school, classes, students_per_class, days)
+
+    for i, role in enumerate(["", "admin", "teacher", "student", "parent"] * 4):
+        Announcement.objects.create(
+            title=f"Notice {i}",
+            content="School is closed on Friday",
+            target_role=role,
+            created_by=admin,
+            is_active=bool(i % 3),
+        )
+    return school
+
+
+def add_classes(school, classes, students_per_class, days=20):
+    """Grow ``school`` by ``classes`` classes full of students with history"""
+    teacher, parent = school["teacher"], school["parent"]
+    subject = school["subject"]
+    start = datetime.date(2024, 9, 2)
+    offset = Class.objects.count()
+
+    for c in range(offset, offset + classes):
+        class_obj = Class.objects.create(
+            name=f"Grade {c + 1}", section="A", class_teacher=teacher
+        )
+        class_subject = ClassSubject.objects.create(
+            class_obj=class_obj, subject=subject, teacher=teacher
+        )
+        assignment = Assignment.objects.create(
+            title=f"Homework {c + 1}",
+            description="Exercises 1-10",
+            class_subject=class_subject,
+            due_date=timezone.now() + datetime.timedelta(days=7),
+            total_marks=10,
+            created_by=teacher,
+        )
+        for roll in range(1, students_per_class + 1):
+            user = create_user(f"student{c}_{roll}", "student")
+            student = Student.objects.create(
+                user=user,
+                admission_number=f"ADM{c:02d}{roll:03d}",
+                class_enrolled=class_obj,
+                roll_number=roll,
+                parent=parent,
+                admission_date=start,
+            )
+            school["students"].append(student)
+            Attendance.objects.bulk_create(
+                Attendance(
+                    student=student,
+                    date=start + datetime.timedelta(days=d),
+                    status="present" if (d + roll) % 5 else "absent",
+                    marked_by=teacher,
+                )
+                for d in range(days)
+            )
+            Grade.objects.bulk_create(
+                Grade(
+                    student=student,
+                    subject=subject,
+                    exam_type=exam_type,
+                    marks_obtained=30 + roll,
+                    total_marks=50,
+                    exam_date=start + datetime.timedelta(days=i * 30),
+                    uploaded_by=teacher,
+                )
+                for i, exam_type in enumerate(["Unit Test", "Midterm", "Final"])
+            )
+            if roll % 2:
+                Submission.objects.create(
+                    assignment=assignment, student=student, submission_file="a.pdf"
+                )
+            Message.objects.create(
+                sender=teacher,
+                receiver=user,
+                subject="Reminder",
+                content="Homework is due next week",
+            )
+            Message.objects.create(
+                sender=user, receiver=teacher, subject="Question", content="Page 12?"
+            )
+            Message.objects.create(
+                sender=teacher, receiver=parent, subject="Progress", content="Report"
+            )
+
+    AttendanceSummary.rebuild()
+
+
+class QueryPlanTests(TestCase):
+    """The hot dashboard queries must be answered from an index"""
+
+    HOT_TABLES = {
+        "core_attendance",
+        "core_grade",
+        "core_message",
+        "core_conversation",
+        "core_announcement",
+        "core_submission",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school()
+
+    def setUp(self):
+        # Cached feeds would hide the announcement queries from the check
+        cache.clear()
+
+    def assertIndexedPlans(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        checked = 0
+        for query in ctx.captured_queries:
+            table = re.search(r'FROM "(\w+)"', query["sql"])
+            if not table or table.group(1) not in self.HOT_TABLES:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                plan = [row[-1] for row in cursor.fetchall()]
+            checked += 1
+            for step in plan:
+                with self.subTest(url=url, sql=query["sql"]):
+                    self.assertNotIn("TEMP B-TREE", step)
+                    self.assertNotRegex(step, r"^SCAN \w+$")
+        self.assertGreater(checked, 0, f"no hot queries issued by {url}")
+
+    def test_admin_dashboard(self):
+        self.assertIndexedPlans(self.school["admin"], "/admin-dashboard/")
+
+    def test_teacher_dashboard(self):
+        self.assertIndexedPlans(self.school["teacher"], "/teacher-dashboard/")
+
+    def test_student_dashboard(self):
+        student = self.school["students"][0]
+        self.assertIndexedPlans(student.user, "/student-dashboard/")
+
+    def test_parent_dashboard(self):
+        self.assertIndexedPlans(self.school["parent"], "/parent-dashboard/")
+
+    def test_child_details(self):
+        student = self.school["students"][0]
+        self.assertIndexedPlans(self.school["parent"], f"/child/{student.id}/")
+
+    def test_inbox(self):
+        student = self.school["students"][0]
+        self.assertIndexedPlans(student.user, "/messages/inbox/")
+
+    def test_conversation(self):
+        student = self.school["students"][0]
+        self.assertIndexedPlans(
+            student.user, f"/messages/with/{self.school['teacher'].pk}/"
+        )
+
+
+class SeedSchoolTests(TestCase):
+    def seed(self):
+        call_command(
+            "seed_school",
+            classes=1,
+            students_per_class=2,
+            days=3,
+            subjects=2,
+            exams=2,
+            assignments=1,
+            messages=2,
+            announcements=4,
+            stdout=StringIO(),
+        )
+
+    def test_small_school(self):
+        self.seed()
+        # 1 admin, 2 teachers (one per subject), 1 parent and 2 students
+        self.assertEqual(User.objects.count(), 6)
+        self.assertEqual(Student.objects.count(), 2)
+        self.assertEqual(Attendance.objects.count(), 2 * 3)
+        self.assertEqual(Grade.objects.count(), 2 * 2 * 2)
+        self.assertEqual(Assignment.objects.count(), 2)
+        self.assertEqual(Message.objects.count(), 2 * 2)
+        self.assertEqual(Announcement.objects.count(), 4)
+
+        # The denormalized tables match their sources
+        summaries = AttendanceSummary.objects.values_list(
+            "present", "absent", "late", "excused"
+        )
+        self.assertEqual(sum(map(sum, summaries)), 6)
+        self.assertEqual(
+            {
+                (counter.name, counter.academic_year): counter.value
+                for counter in DashboardCounter.objects.all()
+            },
+            DashboardCounter.count(),
+        )
+        self.assertEqual(
+            sum(UserProfile.objects.values_list("unread_messages", flat=True)),
+            Message.objects.filter(is_read=False).count(),
+        )
+        # Both sides of every pair of users who exchanged messages
+        pairs = {
+            frozenset(pair)
+            for pair in Message.objects.values_list("sender", "receiver")
+        }
+        self.assertEqual(Conversation.objects.count(), 2 * len(pairs))
+        self.assertEqual(
+            SearchEntry.objects.count(),
+            2 + 4 + 2 + Announcement.objects.filter(is_active=True).count(),
+        )
+        self.assertEqual(SubjectRank.objects.count(), Grade.objects.count())
+        self.assertEqual(ClassRank.objects.count(), 2 * 2)
+
+    def test_refuses_a_school_with_students(self):
+        self.seed()
+        with self.assertRaises(CommandError):
+            self.seed()
+
+
+class PaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=1, students_per_class=5, days=0)
+        # Two newer students, then three admitted on the same day
+        cls.students = cls.school["students"]
+        for student, days in zip(cls.students[3:], [2, 1]):
+            Student.objects.filter(pk=student.pk).update(
+                admission_date=student.admission_date + datetime.timedelta(days=days)
+            )
+
+    def pages(self, page_size):
+        pages, cursor = [], None
+        while True:
+            page, cursor = keyset_paginate(
+                Student.objects.all(), cursor, "admission_date", page_size
+            )
+            pages.append([student.pk for student in page])
+            if cursor is None:
+                return pages
+
+    def test_pages_follow_the_date_then_the_pk(self):
+        expected = [self.students[i].pk for i in [3, 4, 2, 1, 0]]
+        self.assertEqual(self.pages(2), [expected[:2], expected[2:4], expected[4:]])
+        # Equal dates are split across pages without skipping or repeating
+        self.assertEqual(self.pages(3), [expected[:3], expected[3:]])
+        self.assertEqual(self.pages(5), [expected])
+
+    def test_bad_cursors_give_the_first_page(self):
+        first, _ = keyset_paginate(Student.objects.all(), None, "admission_date", 2)
+        for cursor in [
+            "not base64!",
+            base64.urlsafe_b64encode(b"x|1").decode(),
+            base64.urlsafe_b64encode(b"2025-01-01|x").decode(),
+        ]:
+            with self.subTest(cursor=cursor):
+                page, _ = keyset_paginate(
+                    Student.objects.all(), cursor, "admission_date", 2
+                )
+                self.assertEqual(page, first)
+
+        self.client.force_login(self.school["admin"])
+        response = self.client.get(
+            reverse("student_list"),
+            {"cursor": base64.urlsafe_b64encode(b"yesterday|3").decode()},
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class AnnouncementFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=1, students_per_class=2, days=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feed_is_cached_until_an_announcement_changes(self):
+        self.client.force_login(self.school["parent"])
+        self.client.get("/parent-dashboard/")
+        with self.assertNumQueries(0):
+            feed = announcement_feed("parent")
+        self.assertTrue(all(a.target_role in ("parent", "") for a in feed))
+
+        announcement = Announcement.objects.create(
+            title="Sports day",
+            content="Wear house colours",
+            target_role="parent",
+            created_by=self.school["admin"],
+        )
+        self.assertEqual(announcement_feed("parent")[0], announcement)
+
+        announcement.is_active = False
+        announcement.save()
+        self.assertNotIn(announcement, announcement_feed("parent"))
+
+    def test_culled_version_does_not_bring_back_a_stale_feed(self):
+        announcement_feed("parent")
+        announcement = Announcement.objects.create(
+            title="Sports day",
+            content="Wear house colours",
+            target_role="parent",
+            created_by=self.school["admin"],
+        )
+        announcement_feed("parent")
+        cache.delete(VERSION_KEY)
+        self.assertEqual(announcement_feed("parent")[0], announcement)
+
+    def test_student_feed_includes_class_announcements(self):
+        student = self.school["students"][0]
+        announcement = Announcement.objects.create(
+            title="Class trip",
+            content="Bring a packed lunch",
+            target_role="teacher",
+            target_class=student.class_enrolled,
+            created_by=self.school["admin"],
+        )
+        self.assertIn(
+            announcement, announcement_feed("student", student.class_enrolled_id)
+        )
+        self.assertNotIn(announcement, announcement_feed("parent"))
+
+
+class DashboardCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=2, students_per_class=3, days=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertCountersMatch(self):
+        stored = {
+            (c.name, c.academic_year): c.value
+            for c in DashboardCounter.objects.exclude(value=0)
+        }
+        actual = {key: n for key, n in DashboardCounter.count().items() if n}
+        self.assertEqual(stored, actual)
+
+    def test_counters_follow_creates_updates_and_deletes(self):
+        self.assertCountersMatch()
+        self.assertEqual(DashboardCounter.snapshot()[0]["students"], 6)
+
+        first, second = Class.objects.order_by("pk")
+        first.academic_year = "2025-2026"
+        first.save()
+        self.assertCountersMatch()
+
+        student = self.school["students"][-1]
+        student.class_enrolled = first
+        student.roll_number = 99
+        student.save()
+        self.assertCountersMatch()
+
+        second.delete()
+        self.assertCountersMatch()
+
+        self.school["students"][0].user.delete()
+        profile = self.school["parent"].profile
+        profile.role = "teacher"
+        profile.save()
+        self.assertCountersMatch()
+
+    def test_admin_dashboard_reads_counters(self):
+        self.client.force_login(self.school["admin"])
+        with self.assertNumQueries(5):
+            response = self.client.get("/admin-dashboard/")
+        self.assertEqual(response.context["total_students"], 6)
+        self.assertEqual(response.context["total_classes"], 2)
+        self.assertEqual(
+            response.context["yearly_counts"],
+            {"2024-2025": {"students": 6, "classes": 2}},
+        )
+
+
+class GradePercentageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=1, students_per_class=1, days=1)
+        student = cls.school["students"][0]
+        subject = Subject.objects.get(code="MATH101")
+        marks = [(0, 0), (49.99, 100), (50, 100), (89.99, 100), (179.99, 200)]
+        marks += [(7, 9), (100, 100)]
+        for obtained, total in marks:
+            Grade.objects.create(
+                student=student,
+                subject=subject,
+                exam_type="Quiz",
+                marks_obtained=obtained,
+                total_marks=total,
+                exam_date=datetime.date(2024, 10, 1),
+            )
+
+    def test_annotations_match_python_methods(self):
+        for grade in Grade.objects.with_percentage():
+            with self.subTest(marks=grade.marks_obtained, total=grade.total_marks):
+                self.assertAlmostEqual(grade.pct, float(grade.percentage()))
+                self.assertEqual(grade.letter_grade, grade.grade_letter())
+
+    def test_filter_on_percentage_without_loading_rows(self):
+        failing = Grade.objects.with_percentage().filter(
+            subject__code="MATH101", pct__lt=50
+        )
+        self.assertEqual(
+            sorted(failing.values_list("marks_obtained", flat=True)),
+            [0, Decimal("49.99")],
+        )
+        self.assertEqual(
+            Grade.objects.with_percentage().filter(letter_grade="A+").count(), 2
+        )
+
+
+class GradeImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=1, students_per_class=3, days=1)
+
+    def setUp(self):
+        self.client.force_login(self.school["teacher"])
+        Grade.objects.all().delete()
+
+    def upload(self, name, content):
+        return self.client.post(
+            "/grades/upload/", {"grades_file": SimpleUploadedFile(name, content)}
+        )
+
+    def test_csv_import_creates_all_rows(self):
+        sheet = (
+            "admission_number,subject_code,exam_type,marks_obtained,total_marks,"
+            "exam_date,remarks\n"
+            "ADM00001,MATH101,Final,45,50,2025-03-01,Well done\n"
+            "ADM00002,MATH101,Final,38.5,50,2025-03-01,\n"
+        )
+        # 8 to import, 6 to rerank the class's Final results
+        with self.assertNumQueries(14):
+            response = self.upload("marks.csv", sheet.encode())
+        self.assertRedirects(
+            response, "/teacher-dashboard/", fetch_redirect_response=False
+        )
+        self.assertEqual(
+            sorted(Grade.objects.values_list("marks_obtained", flat=True)),
+            [Decimal("38.5"), Decimal("45")],
+        )
+
+    def test_invalid_rows_are_reported_and_nothing_is_saved(self):
+        sheet = (
+            "admission_number,subject_code,exam_type,marks_obtained,total_marks,"
+            "exam_date\n"
+            "ADM00001,MATH101,Final,45,50,2025-03-01\n"
+            "NOPE,MATH101,Final,60,50,03/01/2025\n"
+        )
+        response = self.upload("marks.csv", sheet.encode())
+        self.assertEqual(response.status_code, 200)
+        (line, problem), = response.context["import_errors"]
+        self.assertEqual(line, 3)
+        self.assertIn("unknown admission number", problem)
+        self.assertIn("exceed total marks", problem)
+        self.assertIn("exam date", problem)
+        self.assertFalse(Grade.objects.exists())
+
+    def test_short_rows_are_reported(self):
+        sheet = (
+            "admission_number,subject_code,exam_type,marks_obtained,total_marks,"
+            "exam_date\n"
+            "ADM00001,MATH101,Final,45\n"
+        )
+        response = self.upload("marks.csv", sheet.encode())
+        self.assertEqual(
+            response.context["import_errors"],
+            [(2, "missing total_marks, exam_date")],
+        )
+        self.assertFalse(Grade.objects.exists())
+
+    def test_unreadable_files_are_reported(self):
+        for name, content in [
+            ("marks.csv", "admission_number\nADM\xe9".encode("latin-1")),
+            ("marks.xlsx", b"not a zip file"),
+        ]:
+            with self.subTest(name=name):
+                response = self.upload(name, content)
+                self.assertEqual(response.status_code, 200)
+                (line, problem), = response.context["import_errors"]
+                self.assertEqual(line, 1)
+                self.assertIn("not a readable", problem)
+
+    def test_uploading_a_sheet_again_updates_its_grades(self):
+        sheet = (
+            "admission_number,subject_code,exam_type,marks_obtained,total_marks,"
+            "exam_date\n"
+            "ADM00001,MATH101,Final,{},50,2025-03-01\n"
+        )
+        self.upload("marks.csv", sheet.format(40).encode())
+        self.upload("marks.csv", sheet.format(45).encode())
+        grade = Grade.objects.get()
+        self.assertEqual(grade.marks_obtained, 45)
+        self.assertEqual(grade.subject_rank.rank, 1)
+
+        twice = sheet + sheet.split("\n")[1]
+        response = self.upload("marks.csv", twice.format(1, 2).encode())
+        self.assertEqual(
+            response.context["import_errors"],
+            [(3, "same student, subject, exam and date as line 2")],
+        )
+        self.assertEqual(Grade.objects.get().marks_obtained, 45)
+
+    def test_errors_keep_the_line_numbers_after_blank_lines(self):
+        sheet = (
+            "admission_number,subject_code,exam_type,marks_obtained,total_marks,"
+            "exam_date,remarks\n"
+            "\n"
+            'ADM00001,MATH101,Final,45,50,2025-03-01,"Two\nlines"\n'
+            ",,,,,,\n"
+            "ADM00002,MATH101,Final,45,50,2025/03/01,\n"
+        )
+        response = self.upload("marks.csv", sheet.encode())
+        self.assertEqual(
+            response.context["import_errors"], [(6, "exam date must be YYYY-MM-DD")]
+        )
+
+        wb = Workbook()
+        wb.active.append(sheet.splitlines()[0].split(","))
+        wb.active.append([])
+        wb.active.append(["ADM00001", "MATH101", "Final", 45, 50, "2025-03-01"])
+        wb.active.append(["ADM00002", "MATH101", "Final", 45, 50, "2025/03/01"])
+        buffer = BytesIO()
+        wb.save(buffer)
+        response = self.upload("marks.xlsx", buffer.getvalue())
+        self.assertEqual(
+            response.context["import_errors"], [(4, "exam date must be YYYY-MM-DD")]
+        )
+
+    def test_xlsx_import(self):
+        wb = Workbook()
+        wb.active.append(
+            ["Admission_Number", "Subject_Code", "Exam_Type", "Marks_Obtained"]
+            + ["Total_Marks", "Exam_Date"]
+        )
+        wb.active.append(
+            ["ADM00003", "MATH101", "Midterm", 20, 25, datetime.datetime(2025, 1, 15)]
+        )
+        buffer = BytesIO()
+        wb.save(buffer)
+        self.upload("marks.xlsx", buffer.getvalue())
+        grade = Grade.objects.get()
+        self.assertEqual(grade.student.admission_number, "ADM00003")
+        self.assertEqual(grade.exam_date, datetime.date(2025, 1, 15))
+        self.assertEqual(grade.uploaded_by, self.school["teacher"])
+
+
+class RankingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=2, students_per_class=4, days=1)
+        cls.students = cls.school["students"]
+        # Tie the first two students of the first class in every exam
+        Grade.objects.filter(student=cls.students[1]).update(marks_obtained=31)
+        rebuild_rankings()
+
+    def ranks(self):
+        return {
+            "subject": set(
+                SubjectRank.objects.values_list(
+                    "grade", "class_obj", "rank", "out_of", "percentile"
+                )
+            ),
+            "class": set(
+                ClassRank.objects.values_list(
+                    "student", "class_obj", "exam_type", "average", "rank", "out_of"
+                )
+            ),
+        }
+
+    def test_ranks_match_the_grades(self):
+        for grade in Grade.objects.select_related("student", "subject_rank"):
+            partition = Grade.objects.filter(
+                student__class_enrolled=grade.student.class_enrolled_id,
+                subject=grade.subject_id,
+                exam_type=grade.exam_type,
+            )
+            better = sum(g.percentage() > grade.percentage() for g in partition)
+            self.assertEqual(grade.subject_rank.rank, better + 1)
+            self.assertEqual(grade.subject_rank.out_of, len(partition))
+
+        final = ClassRank.objects.filter(
+            class_obj=self.students[0].class_enrolled_id, exam_type="Final"
+        )
+        self.assertEqual(
+            dict(final.values_list("student", "rank")),
+            {
+                self.students[3].pk: 1,
+                self.students[2].pk: 2,
+                self.students[0].pk: 3,
+                self.students[1].pk: 3,
+            },
+        )
+        self.assertEqual(final.get(rank=1).percentile, 100)
+        self.assertAlmostEqual(final.filter(rank=3)[0].percentile, 100 / 3)
+
+    def test_upload_reranks_only_the_affected_partition(self):
+        other_class = self.students[-1].class_enrolled_id
+        ClassRank.objects.filter(class_obj=other_class).update(rank=99)
+        self.client.force_login(self.school["teacher"])
+        sheet = (
+            "admission_number,subject_code,exam_type,marks_obtained,total_marks,"
+            "exam_date\n"
+            f"{self.students[0].admission_number},MATH101,Final,50,50,2025-03-01\n"
+        )
+        self.client.post(
+            reverse("upload_grades"),
+            {"grades_file": SimpleUploadedFile("marks.csv", sheet.encode())},
+        )
+
+        self.assertEqual(
+            ClassRank.objects.get(student=self.students[0], exam_type="Final").rank, 1
+        )
+        self.assertEqual(
+            set(ClassRank.objects.filter(class_obj=other_class).values_list("rank")),
+            {(99,)},
+        )
+
+    def test_incremental_updates_match_a_rebuild(self):
+        grade = Grade.objects.filter(student=self.students[0]).first()
+        grade.marks_obtained = 50
+        grade.exam_type = "Retake"
+        grade.save()
+        Grade.objects.filter(student=self.students[2], exam_type="Final").delete()
+        Grade.objects.create(
+            student=self.students[5],
+            subject=self.school["subject"],
+            exam_type="Final",
+            marks_obtained=10,
+            total_marks=50,
+            exam_date=datetime.date(2025, 3, 1),
+        )
+
+        incremental = self.ranks()
+        rebuild_rankings()
+        self.assertEqual(incremental, self.ranks())
+
+    def test_moving_a_student_reranks_both_classes(self):
+        moved = self.students[3]
+        moved.class_enrolled = self.students[-1].class_enrolled
+        moved.roll_number = 99
+        moved.save()
+
+        self.assertEqual(
+            ClassRank.objects.get(student=moved, exam_type="Final").class_obj,
+            moved.class_enrolled,
+        )
+        incremental = self.ranks()
+        rebuild_rankings()
+        self.assertEqual(incremental, self.ranks())
+
+    def test_child_details_show_the_ranks(self):
+        self.client.force_login(self.school["parent"])
+        response = self.client.get(
+            reverse("child_details", args=[self.students[3].pk])
+        )
+        self.assertContains(response, "Class Rank (Final):</strong> 1 of 4")
+        self.assertContains(response, "<td>1 of 4</td>", count=3)
+
+
+class AttendanceMarkingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=1, students_per_class=3, days=0)
+        cls.students = cls.school["students"]
+        cls.class_obj = cls.students[0].class_enrolled
+        cls.date = datetime.date(2025, 3, 3)
+
+    def setUp(self):
+        self.client.force_login(self.school["teacher"])
+
+    def mark(self, url, statuses):
+        data = {"date": self.date.isoformat()}
+        for student, status in zip(self.students, statuses):
+            data[f"status_{student.pk}"] = status
+        return self.client.post(url, data)
+
+    def summary(self, student):
+        return AttendanceSummary.objects.filter(student=student).values_list(
+            "present", "absent", "late"
+        ).first()
+
+    def test_marking_again_updates_the_records_and_summaries(self):
+        url = reverse("mark_attendance", args=[self.class_obj.pk])
+        self.mark(url, ["present", "absent", "late"])
+        self.assertEqual(self.summary(self.students[1]), (0, 1, 0))
+
+        self.mark(url, ["present", "present", ""])
+        self.assertEqual(
+            dict(Attendance.objects.values_list("student", "status")),
+            {
+                self.students[0].pk: "present",
+                self.students[1].pk: "present",
+                self.students[2].pk: "late",
+            },
+        )
+        self.assertEqual(self.summary(self.students[1]), (1, 0, 0))
+
+    def test_an_invalid_status_saves_nothing(self):
+        url = reverse("mark_attendance", args=[self.class_obj.pk])
+        response = self.mark(url, ["present", "asleep", "late"])
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertFalse(Attendance.objects.exists())
+        self.assertFalse(AttendanceSummary.objects.exists())
+
+    def test_grade_level_defaults_to_the_latest_academic_year(self):
+        old_class = Class.objects.create(
+            name=self.class_obj.name, section="B", academic_year="2023-2024"
+        )
+        old_student = Student.objects.create(
+            user=create_user("alumnus", "student"),
+            admission_number="ADM99999",
+            class_enrolled=old_class,
+            roll_number=1,
+            admission_date=datetime.date(2023, 9, 1),
+        )
+        self.client.force_login(self.school["admin"])
+        url = reverse("mark_grade_attendance", args=[self.class_obj.name])
+        self.assertNotIn(old_student, self.client.get(url).context["students"])
+
+        self.students.append(old_student)
+        self.addCleanup(self.students.pop)
+        self.mark(url, ["present"] * 4)
+        self.assertFalse(old_student.attendance_records.exists())
+        self.assertEqual(Attendance.objects.count(), 3)
+
+        self.mark(f"{url}?academic_year=2023-2024", ["present"] * 4)
+        self.assertTrue(old_student.attendance_records.exists())
+
+
+class AttendanceAnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # 40 calendar days from Monday 2024-09-02; the seed marks a student
+        # absent every fifth day, so 80% attendance
+        cls.school = seed_school(classes=1, students_per_class=3, days=40)
+        cls.perfect, cls.chronic, cls.streak = cls.school["students"]
+        cls.perfect.attendance_records.update(status="present")
+        records = cls.streak.attendance_records
+        records.update(status="present")
+        records.filter(date__gte=datetime.date(2024, 10, 9)).update(status="excused")
+
+    def test_metrics(self):
+        analytics = student_analytics(Student.objects.all())
+        self.assertEqual(
+            analytics[self.perfect.pk],
+            {
+                "rate": 1.0,
+                "chronic": False,
+                "longest_streak": 0,
+                "current_streak": 0,
+                "worst_weekday": None,
+                "recent_rate": 1.0,
+                "trend": 0.0,
+            },
+        )
+        chronic = analytics[self.chronic.pk]
+        self.assertAlmostEqual(chronic["rate"], 0.8)
+        self.assertTrue(chronic["chronic"])
+        self.assertEqual((chronic["longest_streak"], chronic["current_streak"]), (1, 0))
+        # Absent on two of the six Thursdays, one day of each other weekday
+        self.assertEqual(chronic["worst_weekday"], "Thursday")
+
+        streak = analytics[self.streak.pk]
+        self.assertAlmostEqual(streak["rate"], 37 / 40)
+        self.assertFalse(streak["chronic"])
+        self.assertEqual((streak["longest_streak"], streak["current_streak"]), (3, 3))
+        self.assertAlmostEqual(streak["recent_rate"], 27 / 30)
+        self.assertAlmostEqual(streak["trend"], -0.1)
+
+    def test_rolling_rates_cover_calendar_days(self):
+        dates = np.array(["2024-09-02", "2024-09-03", "2024-10-02"], "datetime64[D]")
+        recorded = np.array([[True, True, True], [False, True, True]])
+        attended = np.array([[False, True, True], [False, False, True]])
+        rates = rolling_rates(dates, recorded, attended)
+        np.testing.assert_allclose(
+            rates, [[0, 0.5, 1], [np.nan, 0, 0.5]], equal_nan=True
+        )
+
+    def test_class_report_shows_the_analytics(self):
+        rows = class_report_data(self.perfect.class_enrolled)["rows"]
+        self.assertEqual(
+            [row[-4:] for row in rows],
+            [
+                ["100.00%", 0, "", "No"],
+                ["80.00%", 1, "Thursday", "Yes"],
+                ["90.00%", 3, "Wednesday", "No"],
+            ],
+        )
+
+    def test_at_risk_list(self):
+        self.client.force_login(self.school["teacher"])
+        url = reverse("at_risk_students")
+        self.assertRedirects(
+            self.client.get(url), reverse("dashboard"), fetch_redirect_response=False
+        )
+
+        self.client.force_login(self.school["admin"])
+        rows = self.client.get(url).context["rows"]
+        self.assertEqual(
+            [(row["student"], row["reasons"]) for row in rows],
+            [
+                (
+                    self.chronic,
+                    ["chronically absent", "below 90% over the last 30 days"],
+                ),
+                (self.streak, ["absent the last 3 school days"]),
+            ],
+        )
+
+
+class QueryProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=1, students_per_class=6, days=1)
+
+    def setUp(self):
+        reset_query_stats()
+
+    def test_repeated_query_shape_is_flagged(self):
+        def n_plus_one_view(request):
+            for student in Student.objects.all():
+                student.user.get_full_name()
+            return HttpResponse()
+
+        request = RequestFactory().get("/students/")
+        request.resolver_match = resolve("/students/")
+        middleware = QueryProfilerMiddleware(n_plus_one_view)
+        with self.assertLogs("core.profiler", "WARNING"):
+            middleware(request)
+
+        stats = query_stats()["student_list"]
+        self.assertEqual(stats["requests"], 1)
+        self.assertEqual(stats["max_queries"], 7)
+        self.assertEqual(stats["n_plus_one_requests"], 1)
+        self.assertIn('FROM "auth_user"', stats["repeated_queries"][0]["sql"])
+        self.assertEqual(stats["repeated_queries"][0]["max_per_request"], 6)
+
+    def test_session_and_user_queries_are_counted(self):
+        self.client.force_login(self.school["teacher"])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/teacher-dashboard/")
+        stats = query_stats()["teacher_dashboard"]
+        self.assertEqual(stats["max_queries"], len(queries))
+        self.assertTrue(any("django_session" in q["sql"] for q in queries))
+
+    def test_endpoint_is_staff_only(self):
+        self.client.force_login(self.school["teacher"])
+        self.client.get("/teacher-dashboard/")
+        self.assertEqual(self.client.get("/profiler/queries/").status_code, 302)
+
+        self.client.force_login(self.school["admin"])
+        views = self.client.get("/profiler/queries/").json()["views"]
+        self.assertEqual(views["teacher_dashboard"]["requests"], 1)
+        self.assertEqual(views["teacher_dashboard"]["n_plus_one_requests"], 0)
+
+
+class AsyncDashboardTests(TestCase):
+    def setUp(self):
+        self.school = seed_school(classes=1, students_per_class=2, days=3)
+        student = self.school["students"][0]
+        self.users = {
+            "admin": self.school["admin"],
+            "teacher": self.school["teacher"],
+            "student": student.user,
+            "parent": self.school["parent"],
+        }
+        reset_query_stats()
+
+    def test_async_dashboards_match_the_sync_ones(self):
+        for role, user in self.users.items():
+            with self.subTest(role=role):
+                self.client.force_login(user)
+                sync = self.client.get(reverse(f"{role}_dashboard"))
+                response = self.client.get(reverse(f"{role}_dashboard_async"))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, sync.content)
+
+    def test_async_queries_are_profiled(self):
+        self.client.force_login(self.users["student"])
+        self.client.get(reverse("student_dashboard_async"))
+        stats = query_stats()["student_dashboard_async"]
+        self.assertGreaterEqual(stats["max_queries"], 4)
+
+    def test_enclosing_recorder_sees_the_async_queries(self):
+        self.client.force_login(self.users["student"])
+        with recording(QueryRecorder()) as recorder:
+            self.client.get(reverse("student_dashboard_async"))
+        stats = query_stats()["student_dashboard_async"]
+        self.assertGreaterEqual(recorder.count, stats["max_queries"])
+        self.assertGreaterEqual(stats["max_queries"], 4)
+
+    def test_role_and_login_are_enforced(self):
+        url = reverse("student_dashboard_async")
+        self.assertRedirects(
+            self.client.get(url), f"{reverse('login')}?next={url}"
+        )
+        self.client.force_login(self.users["teacher"])
+        self.assertRedirects(
+            self.client.get(url), reverse("dashboard"), fetch_redirect_response=False
+        )
+
+
+class RoleAuthTests(TestCase):
+    def setUp(self):
+        self.teacher = create_user("mentor", "teacher")
+
+    def test_dashboard_follows_the_role(self):
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse("dashboard"))
+        self.assertRedirects(response, reverse("teacher_dashboard"))
+
+    def test_wrong_role_is_sent_back_to_the_dashboard(self):
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse("admin_dashboard"))
+        self.assertRedirects(
+            response, reverse("dashboard"), fetch_redirect_response=False
+        )
+
+    def test_changed_role_applies_to_the_next_request(self):
+        self.client.force_login(self.teacher)
+        self.teacher.profile.role = "admin"
+        self.teacher.profile.save()
+        response = self.client.get(reverse("admin_dashboard"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile_and_student_load_with_the_user(self):
+        school = seed_school(classes=1, students_per_class=1, days=1)
+        student = school["students"][0]
+        self.client.force_login(student.user)
+        response = self.client.get(reverse("student_dashboard"))
+        user = response.wsgi_request.user
+        with self.assertNumQueries(0):
+            self.assertEqual(user.profile.role, "student")
+            self.assertEqual(
+                user.student_profile.class_enrolled, student.class_enrolled
+            )
+
+
+class BroadcastTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=2, students_per_class=3, days=1)
+        cls.class_obj = cls.school["students"][0].class_enrolled
+
+    def setUp(self):
+        self.client.force_login(self.school["teacher"])
+
+    def broadcast(self, **data):
+        data.setdefault("subject", "Trip")
+        data.setdefault("content", "The museum trip is on Friday")
+        return self.client.post(reverse("broadcast_message"), data)
+
+    def test_class_broadcast_reaches_each_student_once(self):
+        before = Message.objects.count()
+        self.broadcast(audience="class", class_obj=self.class_obj.pk)
+
+        sent = Message.objects.order_by("pk")[before:]
+        self.assertEqual(
+            sorted(message.receiver_id for message in sent),
+            sorted(self.class_obj.students.values_list("user_id", flat=True)),
+        )
+        self.assertTrue(all(m.sender == self.school["teacher"] for m in sent))
+        self.assertTrue(all(m.sent_at and not m.is_read for m in sent))
+
+    def test_siblings_parent_gets_one_copy(self):
+        before = Message.objects.count()
+        self.broadcast(audience="class_parents", class_obj=self.class_obj.pk)
+        receivers = Message.objects.order_by("pk")[before:].values_list(
+            "receiver", flat=True
+        )
+        self.assertEqual(list(receivers), [self.school["parent"].pk])
+
+    def test_role_broadcast_skips_the_sender(self):
+        sent = Message.broadcast(
+            self.school["teacher"],
+            User.objects.filter(profile__role="teacher"),
+            "Staff meeting",
+            "Monday at 4pm",
+        )
+        self.assertEqual(sent, 0)
+
+    def test_class_is_required_for_class_audiences(self):
+        response = self.broadcast(audience="class_parents")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("class_obj", response.context["form"].errors)
+
+    def test_students_cannot_broadcast(self):
+        self.client.force_login(self.school["students"][0].user)
+        response = self.broadcast(audience="role", role="parent")
+        self.assertRedirects(
+            response, reverse("dashboard"), fetch_redirect_response=False
+        )
+
+
+class ConversationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=1, students_per_class=3, days=1)
+        cls.teacher = cls.school["teacher"]
+        cls.parent = cls.school["parent"]
+
+    def unread(self, user):
+        return UserProfile.objects.get(user=user).unread_messages
+
+    def test_sending_updates_both_sides(self):
+        before = self.unread(self.parent)
+        message = Message.objects.create(
+            sender=self.teacher, receiver=self.parent, subject="Trip", content="Fri"
+        )
+        self.assertEqual(self.unread(self.parent), before + 1)
+
+        theirs = Conversation.objects.get(user=self.parent, other=self.teacher)
+        mine = Conversation.objects.get(user=self.teacher, other=self.parent)
+        self.assertEqual(theirs.last_message, message)
+        self.assertEqual(mine.last_message, message)
+        self.assertEqual(theirs.unread, before + 1)
+        self.assertEqual(mine.unread, 0)
+
+    def test_opening_a_conversation_marks_it_read(self):
+        self.assertGreater(self.unread(self.parent), 0)
+        self.client.force_login(self.parent)
+        self.client.get(reverse("conversation", args=[self.teacher.pk]))
+
+        self.assertEqual(self.unread(self.parent), 0)
+        self.assertFalse(
+            Message.objects.filter(receiver=self.parent, is_read=False).exists()
+        )
+
+    def test_broadcast_and_rebuild_agree(self):
+        Message.broadcast(
+            self.teacher, User.objects.filter(profile__role="student"), "Quiz", "Mon"
+        )
+        Message.objects.create(
+            sender=self.parent, receiver=self.teacher, subject="Hi", content="?"
+        )
+        incremental = {
+            (c.user_id, c.other_id): (c.last_message_id, c.unread)
+            for c in Conversation.objects.all()
+        }
+        counters = dict(UserProfile.objects.values_list("user", "unread_messages"))
+
+        Conversation.rebuild()
+        self.assertEqual(
+            incremental,
+            {
+                (c.user_id, c.other_id): (c.last_message_id, c.unread)
+                for c in Conversation.objects.all()
+            },
+        )
+        self.assertEqual(
+            counters, dict(UserProfile.objects.values_list("user", "unread_messages"))
+        )
+
+    def test_thread_pages_merge_both_directions(self):
+        student = self.school["students"][0].user
+        for i in range(30):
+            pair = [self.teacher, student] if i % 3 else [student, self.teacher]
+            Message.objects.create(
+                sender=pair[0], receiver=pair[1], subject=f"#{i}", content="."
+            )
+        self.client.force_login(student)
+        url = reverse("conversation", args=[self.teacher.pk])
+
+        subjects, cursor = [], ""
+        while True:
+            response = self.client.get(url, {"cursor": cursor} if cursor else {})
+            subjects += [m.subject for m in response.context["thread"]]
+            cursor = response.context["next_cursor"]
+            if not cursor:
+                break
+        expected = Message.objects.filter(
+            sender__in=[student, self.teacher], receiver__in=[student, self.teacher]
+        ).order_by("-sent_at", "-pk")
+        self.assertEqual(subjects, [m.subject for m in expected])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=2, students_per_class=2, days=1)
+        cls.student = cls.school["students"][0]
+        cls.other = cls.school["students"][-1]
+        cls.student.user.first_name = "Zoë"
+        cls.student.user.save()
+
+    def search(self, user, query):
+        self.client.force_login(user)
+        response = self.client.get(reverse("search"), {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return {
+            kind: [str(result["title"]) for result in results]
+            for kind, results in response.context["results"].items()
+        }
+
+    def test_results_follow_the_role(self):
+        student = self.student.user
+        self.assertEqual(
+            self.search(student, "homework"),
+            {
+                "message": ["Reminder"],
+                "assignment": ["<mark>Homework</mark> 1"],
+            },
+        )
+        self.assertEqual(self.search(student, self.other.admission_number), {})
+        self.assertEqual(
+            self.search(self.school["parent"], "zoe"),
+            {"student": [f"<mark>Zoë</mark> {student.last_name}"]},
+        )
+        # Active announcements for everyone or for teachers, newest first
+        self.assertEqual(
+            self.search(self.school["teacher"], "notice"),
+            {
+                "announcement": [
+                    f"<mark>Notice</mark> {i}"
+                    for i in reversed(range(20))
+                    if i % 5 in (0, 2) and i % 3
+                ]
+            },
+        )
+
+    def test_last_word_is_a_prefix_and_syntax_is_not_parsed(self):
+        admin = self.school["admin"]
+        found = self.search(admin, "adm00")
+        self.assertEqual(len(found["student"]), 2)
+        # Earlier words must match whole
+        self.assertEqual(self.search(admin, "zo adm00"), {})
+        self.assertEqual(
+            self.search(admin, '"zo* ('), {"student": ["<mark>Zoë</mark> "]}
+        )
+
+    def test_admin_search_uses_the_index(self):
+        self.client.force_login(
+            create_user("root", "admin", is_staff=True, is_superuser=True)
+        )
+        response = self.client.get(
+            reverse("admin:core_student_changelist"), {"q": "zoe"}
+        )
+        self.assertEqual(list(response.context["cl"].result_list), [self.student])
+
+    def test_index_follows_changes(self):
+        teacher = self.school["teacher"]
+        Message.broadcast(
+            teacher, User.objects.filter(profile__role="student"), "Quiz", "Monday"
+        )
+        Message.objects.filter(subject="Question").first().delete()
+        for announcement in Announcement.objects.all()[:4]:
+            announcement.is_active = not announcement.is_active
+            announcement.save()
+        self.other.user.last_name = "Renamed"
+        self.other.user.save()
+        self.student.delete()
+
+        incremental = set(SearchEntry.objects.values_list())
+        SearchEntry.rebuild()
+        self.assertEqual(incremental, set(SearchEntry.objects.values_list()))
+        self.assertEqual(
+            self.search(teacher, "renamed"),
+            {"student": [f"{self.other.user.first_name} <mark>Renamed</mark>"]},
+        )
+
+
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=1, students_per_class=2, days=1)
+        cls.assignment = Assignment.objects.create(
+            title="Essay",
+            description="500 words",
+            class_subject=ClassSubject.objects.get(),
+            due_date=timezone.now(),
+            total_marks=10,
+            created_by=cls.school["teacher"],
+        )
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def submit(self, student, data):
+        return Submission.objects.create(
+            assignment=self.assignment,
+            student=student,
+            submission_file=SimpleUploadedFile("essay.PDF", data),
+        )
+
+    def test_identical_uploads_share_one_file(self):
+        first, second = self.school["students"]
+        a = self.submit(first, b"%PDF the same essay")
+        b = self.submit(second, b"%PDF the same essay")
+
+        digest = hashlib.sha256(b"%PDF the same essay").hexdigest()
+        self.assertEqual(a.submission_file.name, f"blobs/{digest[:2]}/{digest}.pdf")
+        self.assertEqual(a.submission_file.name, b.submission_file.name)
+        self.assertEqual(StoredBlob.objects.get().refs, 2)
+        blob_dir = os.path.dirname(a.submission_file.path)
+        self.assertEqual(os.listdir(blob_dir), [f"{digest}.pdf"])
+
+    def test_file_is_removed_with_its_last_reference(self):
+        first, second = self.school["students"]
+        a = self.submit(first, b"shared")
+        b = self.submit(second, b"shared")
+        path = a.submission_file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            a.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            b.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(StoredBlob.objects.exists())
+
+    def test_rolled_back_delete_keeps_the_file(self):
+        submission = self.submit(self.school["students"][0], b"kept")
+        path = submission.submission_file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                submission.delete()
+                raise RuntimeError
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(StoredBlob.objects.get().refs, 1)
+
+    def test_release_writes_before_it_reads(self):
+        name = self.submit(self.school["students"][0], b"essay").submission_file.name
+        with CaptureQueriesContext(connection) as queries:
+            StoredBlob.release(name, lambda: None)
+        statements = [
+            q["sql"]
+            for q in queries
+            if not q["sql"].startswith(("SAVEPOINT", "RELEASE"))
+        ]
+        self.assertTrue(statements[0].startswith("UPDATE"), statements[0])
+        self.assertFalse(StoredBlob.objects.exists())
+
+    def test_missing_file_is_written_again(self):
+        first, second = self.school["students"]
+        path = self.submit(first, b"restored").submission_file.path
+        os.remove(path)
+        self.submit(second, b"restored")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"restored")
+        self.assertEqual(StoredBlob.objects.get().refs, 2)
+
+    def test_replacing_a_file_releases_the_old_one(self):
+        submission = self.submit(self.school["students"][0], b"draft")
+        old = submission.submission_file.name
+        with self.captureOnCommitCallbacks(execute=True):
+            submission.submission_file = SimpleUploadedFile("essay.pdf", b"final")
+            submission.save()
+        self.assertFalse(default_storage.exists(old))
+        self.assertEqual(
+            list(StoredBlob.objects.values_list("name", flat=True)),
+            [submission.submission_file.name],
+        )
+
+    def test_reconcile_recounts_references(self):
+        submission = self.submit(self.school["students"][0], b"essay")
+        orphan = default_storage.save("stray.txt", ContentFile(b"left behind"))
+        StoredBlob.objects.filter(name=submission.submission_file.name).update(refs=5)
+
+        self.assertEqual(StoredBlob.reconcile(), [orphan])
+        self.assertEqual(
+            dict(StoredBlob.objects.values_list("name", "refs")),
+            {submission.submission_file.name: 1},
+        )
+
+
+class ChunkedUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=1, students_per_class=2, days=1)
+        cls.student = cls.school["students"][1]  # has not submitted yet
+        cls.assignment = Assignment.objects.get()
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(
+            MEDIA_ROOT=media.name,
+            CHUNKED_UPLOAD_DIR=os.path.join(media.name, "chunks"),
+            CHUNKED_UPLOAD_MAX_CHUNK=4,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_login(self.student.user)
+
+    def start(self, data=b"0123456789", **extra):
+        response = self.client.post(
+            reverse("start_chunked_upload", args=[self.assignment.pk]),
+            {"filename": "essay.txt", "size": len(data), **extra},
+        )
+        return response.json()
+
+    def put(self, upload_id, chunk, offset, checksum=None):
+        return self.client.put(
+            reverse("upload_chunk", args=[upload_id]),
+            chunk,
+            content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+            HTTP_UPLOAD_CHECKSUM=checksum or hashlib.sha256(chunk).hexdigest(),
+        )
+
+    def test_chunks_become_a_submission_on_the_last_one(self):
+        data = b"0123456789"
+        upload = self.start(data, sha256=hashlib.sha256(data).hexdigest())
+        for offset in range(0, len(data), 4):
+            response = self.put(upload["upload_id"], data[offset : offset + 4], offset)
+            self.assertEqual(response.status_code, 200)
+
+        self.assertTrue(response.json()["complete"])
+        submission = Submission.objects.get(student=self.student)
+        self.assertEqual(submission.submission_file.read(), data)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(os.listdir(settings.CHUNKED_UPLOAD_DIR), [])
+
+    def test_bad_chunks_are_rejected_without_moving_the_offset(self):
+        upload_id = self.start()["upload_id"]
+        self.assertEqual(self.put(upload_id, b"0123", 0, "0" * 64).status_code, 400)
+        self.assertEqual(self.put(upload_id, b"45", 4).status_code, 409)
+        self.assertEqual(self.put(upload_id, b"012345", 0).status_code, 413)
+        self.assertEqual(ChunkedUpload.objects.get().offset, 0)
+
+    def test_restarting_resumes_where_the_upload_stopped(self):
+        upload_id = self.start()["upload_id"]
+        self.put(upload_id, b"0123", 0)
+
+        resumed = self.start()
+        self.assertEqual(resumed["upload_id"], upload_id)
+        self.assertEqual(resumed["offset"], 4)
+        status = self.client.get(reverse("upload_chunk", args=[upload_id])).json()
+        self.assertEqual(status, {"offset": 4, "size": 10})
+
+    def test_wrong_file_checksum_discards_the_upload(self):
+        upload_id = self.start(sha256="f" * 64)["upload_id"]
+        self.put(upload_id, b"0123", 0)
+        self.put(upload_id, b"4567", 4)
+        self.assertEqual(self.put(upload_id, b"89", 8).status_code, 422)
+        self.assertFalse(Submission.objects.filter(student=self.student).exists())
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_losing_a_race_for_a_chunk_leaves_the_winner_in_place(self):
+        upload_id = self.start()["upload_id"]
+        first, second = ChunkedUpload.objects.get(), ChunkedUpload.objects.get()
+        append_chunk(first, BytesIO(b"0123"), 4, 0, hashlib.sha256(b"0123").hexdigest())
+        with self.assertRaises(UploadError) as raised:
+            append_chunk(
+                second, BytesIO(b"abcd"), 4, 0, hashlib.sha256(b"abcd").hexdigest()
+            )
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(second.offset, 4)
+
+        with open(upload_path(first), "rb") as f:
+            self.assertEqual(f.read(), b"0123")
+        self.assertEqual(
+            os.listdir(settings.CHUNKED_UPLOAD_DIR), [f"{upload_id}.part"]
+        )
+
+    def test_submitting_meanwhile_discards_the_upload(self):
+        upload_id = self.start()["upload_id"]
+        self.put(upload_id, b"0123", 0)
+        self.put(upload_id, b"4567", 4)
+        Submission.objects.create(
+            assignment=self.assignment,
+            student=self.student,
+            submission_file=SimpleUploadedFile("essay.txt", b"from the form"),
+        )
+
+        response = self.put(upload_id, b"89", 8)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(os.listdir(settings.CHUNKED_UPLOAD_DIR), [])
+
+    def test_oversized_files_and_bad_headers_are_rejected(self):
+        with override_settings(CHUNKED_UPLOAD_MAX_SIZE=9):
+            self.assertIn("size", self.start()["errors"])
+
+        upload_id = self.start()["upload_id"]
+        response = self.client.put(
+            reverse("upload_chunk", args=[upload_id]),
+            b"0123",
+            content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET="start",
+        )
+        self.assertEqual(response.json(), {"error": "Invalid Upload-Offset"})
+        response = self.client.generic(
+            "PUT",
+            reverse("upload_chunk", args=[upload_id]),
+            b"0123",
+            content_type="application/octet-stream",
+            CONTENT_LENGTH="four",
+            HTTP_UPLOAD_OFFSET="0",
+        )
+        self.assertEqual(response.json(), {"error": "Invalid Content-Length"})
+        self.assertEqual(ChunkedUpload.objects.get().offset, 0)
+
+    def test_other_students_cannot_write_to_an_upload(self):
+        upload_id = self.start()["upload_id"]
+        self.client.force_login(self.school["students"][0].user)
+        self.assertEqual(self.put(upload_id, b"0123", 0).status_code, 404)
+
+
+class SqliteProfileTests(TestCase):
+    def test_production_profile_tunes_each_new_connection(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        profile = connections.configure_settings(
+            {
+                "default": {
+                    "ENGINE": "django.db.backends.sqlite3",
+                    "NAME": os.path.join(tmp.name, "school.sqlite3"),
+                    **copy.deepcopy(settings.SQLITE_PRODUCTION),
+                }
+            }
+        )["default"]
+        production = DatabaseWrapper(profile, alias="production")
+        self.addCleanup(production.close)
+
+        with production.cursor() as cursor:
+            pragmas = {}
+            for name in ["journal_mode", "synchronous", "busy_timeout", "mmap_size"]:
+                cursor.execute(f"PRAGMA {name}")
+                pragmas[name] = cursor.fetchone()[0]
+        self.assertEqual(
+            pragmas,
+            {
+                "journal_mode": "wal",
+                "synchronous": 1,
+                "busy_timeout": 20000,
+                "mmap_size": 256 * 1024 * 1024,
+            },
+        )
+        self.assertEqual(production.settings_dict["CONN_MAX_AGE"], 600)
+
+
+class ReportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=1, students_per_class=3, days=5)
+        cls.student = cls.school["students"][0]
+        cls.class_obj = cls.student.class_enrolled
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_login(self.school["teacher"])
+
+    def request(self, kind, object_id):
+        return self.client.post(reverse("request_report", args=[kind, object_id]))
+
+    def test_report_is_queued_rendered_and_then_served_from_cache(self):
+        response = self.request("class", self.class_obj.pk)
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job["status"], "pending")
+
+        self.assertEqual(run_worker(0, once=True), 1)
+        status = self.client.get(job["status_url"]).json()
+        self.assertEqual(status["status"], "done")
+        download = self.client.get(status["download_url"])
+        workbook = load_workbook(BytesIO(b"".join(download.streaming_content)))
+        self.assertEqual(workbook.active.max_row, 4)
+
+        again = self.request("class", self.class_obj.pk)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()["job_id"], job["job_id"])
+        self.assertEqual(ReportJob.objects.count(), 1)
+
+    def test_changed_grades_or_attendance_queue_a_new_report(self):
+        first = self.request("student", self.student.pk).json()["job_id"]
+        self.assertEqual(self.request("student", self.student.pk).json()["job_id"], first)
+        run_worker(0, once=True)
+
+        grade = self.student.grades.first()
+        grade.marks_obtained += 1
+        grade.save()
+        second = self.request("student", self.student.pk)
+        self.assertEqual(second.status_code, 202)
+        self.assertNotEqual(second.json()["job_id"], first)
+
+        run_worker(0, once=True)
+        self.student.attendance_records.first().delete()
+        self.assertEqual(self.request("class", self.class_obj.pk).status_code, 202)
+        self.assertEqual(self.request("student", self.student.pk).status_code, 202)
+
+    def test_reports_are_rendered_in_worker_processes(self):
+        self.request("student", self.student.pk)
+        self.request("class", self.class_obj.pk)
+        self.assertEqual(run_worker(2, once=True), 2)
+
+        job = ReportJob.objects.get(kind="student")
+        self.assertEqual(job.status, ReportJob.DONE)
+        self.assertTrue(job.result.read().startswith(b"%PDF"))
+
+    def test_only_the_family_sees_a_student_report(self):
+        job = self.request("student", self.student.pk).json()
+        self.client.force_login(create_user("stranger", "parent"))
+        self.assertEqual(self.request("student", self.student.pk).status_code, 404)
+        self.assertEqual(self.client.get(job["status_url"]).status_code, 404)
+        self.assertEqual(self.request("class", self.class_obj.pk).status_code, 404)
+
+        self.client.force_login(self.school["parent"])
+        self.assertEqual(self.client.get(job["status_url"]).status_code, 200)
+        self.client.force_login(self.student.user)
+        self.assertEqual(self.request("student", self.student.pk).status_code, 202)
+        other = self.school["students"][1]
+        self.assertEqual(self.request("student", other.pk).status_code, 404)
+
+    def test_job_whose_data_cannot_be_read_fails_and_the_worker_goes_on(self):
+        self.request("student", self.student.pk)
+        self.request("class", self.class_obj.pk)
+        with mock.patch(
+            "core.reports.report_data", side_effect=[ValueError("bad row"), {}]
+        ), self.assertLogs("core.reports", "ERROR"):
+            run_worker(0, once=True)
+        failed = ReportJob.objects.get(kind="student")
+        self.assertEqual((failed.status, failed.error), (ReportJob.FAILED, "bad row"))
+        claimed = ReportJob.objects.get(kind="class")
+        self.assertNotEqual(claimed.status, ReportJob.RUNNING)
+
+    def test_failed_jobs_report_their_error_and_old_jobs_are_pruned(self):
+        self.request("student", self.student.pk)
+        Student.objects.filter(pk=self.student.pk).delete()
+        run_worker(0, once=True)
+        self.assertEqual(ReportJob.objects.get().error, "The student no longer exists")
+
+        self.request("class", self.class_obj.pk)
+        run_worker(0, once=True)
+        name = ReportJob.objects.get(kind="class").result.name
+        self.assertTrue(default_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(ReportJob.prune(datetime.timedelta(0)), 2)
+        self.assertFalse(default_storage.exists(name))
+
+
+class ClassReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=2, students_per_class=4, days=7)
+        cls.students = cls.school["students"]
+        Grade.objects.filter(student=cls.students[0], exam_type="Final").update(
+            marks_obtained=17, total_marks=30
+        )
+        # Saved one by one so the summaries the report reads are refreshed
+        late = Attendance.objects.get(student=cls.students[1], date__day=3)
+        late.status = "late"
+        late.save()
+        cls.students[2].grades.all().delete()
+        cls.students[3].attendance_records.all().delete()
+
+    def expected_row(self, student):
+        """Attendance % and average grade, computed one student at a time"""
+        records = list(student.attendance_records.all())
+        present = sum(record.status == "present" for record in records)
+        grades = [grade.percentage() for grade in student.grades.all()]
+        return (
+            present / len(records) * 100 if records else 0,
+            sum(grades) / len(grades) if grades else 0,
+        )
+
+    def assertRowMatches(self, row, student):
+        attendance, average = self.expected_row(student)
+        self.assertAlmostEqual(float(row[3].rstrip("%")), attendance, delta=0.005)
+        self.assertAlmostEqual(float(row[4].rstrip("%")), float(average), delta=0.01)
+
+    def test_class_report_matches_per_student_figures(self):
+        class_obj = self.students[0].class_enrolled
+        rows = class_report_data(class_obj)["rows"]
+        self.assertEqual(len(rows), 4)
+        for row, student in zip(rows, self.students):
+            with self.subTest(student=student.admission_number):
+                self.assertEqual(row[2], student.admission_number)
+                self.assertRowMatches(row, student)
+        self.assertEqual(rows[2][4], "0.00%")
+        self.assertEqual(rows[3][3], "0.00%")
+
+    def test_school_report_has_a_matching_sheet_per_class(self):
+        workbook = load_workbook(generate_school_report())
+        self.assertEqual(
+            workbook.sheetnames, [f"Grade {c} - A" for c in (1, 2)]
+        )
+        rows = [
+            row
+            for sheet in workbook.worksheets
+            for row in sheet.iter_rows(min_row=2, values_only=True)
+        ]
+        self.assertEqual(len(rows), len(self.students))
+        for row, student in zip(rows, self.students):
+            with self.subTest(student=student.admission_number):
+                self.assertEqual(row[2], student.admission_number)
+                self.assertRowMatches(row, student)
+
+
+class ReportCardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=1, students_per_class=3, days=1)
+
+    def generate(self, events, **kwargs):
+        result = generate_report_cards(
+            Student.objects.all(),
+            progress=lambda done, total: events.append((done, total)),
+            **kwargs,
+        )
+        return result.getvalue()
+
+    def test_zip_has_one_card_per_student(self):
+        for workers in [1, 2]:
+            with self.subTest(workers=workers):
+                progress = []
+                content = self.generate(progress, output="zip", workers=workers)
+                names = zipfile.ZipFile(BytesIO(content)).namelist()
+                self.assertEqual(
+                    sorted(names),
+                    [f"{s.admission_number}.pdf" for s in self.school["students"]],
+                )
+                self.assertEqual(progress, [(1, 3), (2, 3), (3, 3)])
+
+    def test_pdf_reports_progress_while_the_document_is_built(self):
+        events = []
+        build = _ReportCardsTemplate.build
+
+        def logged_build(doc, *args, **kwargs):
+            events.append("build")
+            build(doc, *args, **kwargs)
+            events.append("built")
+
+        with mock.patch.object(_ReportCardsTemplate, "build", logged_build):
+            content = self.generate(events, output="pdf")
+        self.assertTrue(content.startswith(b"%PDF"))
+        self.assertEqual(content.count(b"/Type /Page\n"), 3)
+        self.assertEqual(events, ["build", (1, 3), (2, 3), (3, 3), "built"])
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = create_user("pupil", "student")
+
+    def upload_picture(self, color="red"):
+        buffer = BytesIO()
+        Image.new("RGB", (600, 400), color).save(buffer, "PNG")
+        profile = self.user.profile
+        profile.profile_picture = SimpleUploadedFile("me.png", buffer.getvalue())
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        profile.refresh_from_db()
+        return profile
+
+    def test_upload_renders_every_size_and_format(self):
+        profile = self.upload_picture()
+        self.assertTrue(profile.thumbnails_ready)
+        for size in THUMBNAIL_SIZES:
+            for extension, image_format, _ in THUMBNAIL_FORMATS:
+                name = thumbnail_name(profile.profile_picture.name, size, extension)
+                with Image.open(thumbnail_storage.path(name)) as thumb:
+                    self.assertEqual(thumb.size, (size, size))
+                    self.assertEqual(thumb.format, image_format)
+
+    def test_avatar_uses_the_smallest_fitting_thumbnail(self):
+        profile = self.upload_picture()
+        html = Template("{% load avatars %}{% avatar user 100 %}").render(
+            Context({"user": self.user})
+        )
+        jpeg = thumbnail_name(profile.profile_picture.name, 128, "jpg")
+        self.assertIn(f'src="{thumbnail_storage.url(jpeg)}"', html)
+        self.assertIn('<source type="image/webp"', html)
+
+    def test_new_picture_waits_for_its_own_thumbnails(self):
+        first = self.upload_picture("red").profile_picture.name
+        profile = self.user.profile
+        profile.profile_picture = SimpleUploadedFile("me.png", b"not an image")
+        with self.assertLogs("core.thumbnails", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                profile.save()
+        profile.refresh_from_db()
+        self.assertNotEqual(profile.profile_picture.name, first)
+        self.assertFalse(profile.thumbnails_ready)
+        html = Template("{% load avatars %}{% avatar user %}").render(
+            Context({"user": self.user})
+        )
+        self.assertIn(f'src="{profile.profile_picture.url}"', html)
+
+    def test_thumbnails_of_deleted_pictures_are_removed(self):
+        name = self.upload_picture().profile_picture.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.profile.delete()
+        self.assertEqual(remove_orphan_thumbnails(), 6)
+        self.assertFalse(
+            thumbnail_storage.exists(thumbnail_name(name, 48, "webp"))
+        )
+
+
+class QueryBudgetTests(TestCase):
+    """Every view stays within a fixed number of queries at any data size
+
+    Each page is measured on a small school, then again after the school
+    has grown. A count that grows with the data means a per-row query.
+    """
+
+    # (role, url name, reverse() kwargs, maximum queries)
+    BUDGETS = [
+        ("admin", "dashboard", None, 2),
+        ("admin", "admin_dashboard", None, 5),
+        ("admin", "student_list", None, 3),
+        ("admin", "student_create", None, 4),
+        ("admin", "at_risk_students", None, 4),
+        ("admin", "mark_grade_attendance", {"class_name": "Grade 1"}, 3),
+        ("admin", "announcement_create", None, 3),
+        ("admin", "query_profile", None, 2),
+        ("teacher", "teacher_dashboard", None, 5),
+        ("teacher", "mark_attendance", "class_id", 4),
+        ("teacher", "upload_grades", None, 4),
+        ("teacher", "assignment_create", None, 3),
+        ("teacher", "assignment_list", None, 3),
+        ("teacher", "send_message", None, 3),
+        ("teacher", "broadcast_message", None, 3),
+        ("teacher", "inbox", None, 3),
+        ("teacher", "conversation", "user_id", 5),
+        ("student", "student_dashboard", None, 7),
+        ("student", "assignment_list", None, 3),
+        ("student", "submit_assignment", "assignment_id", 3),
+        ("student", "inbox", None, 3),
+        ("parent", "parent_dashboard", None, 4),
+        ("parent", "child_details", "student_id", 9),
+        ("parent", "inbox", None, 3),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = seed_school(classes=1, students_per_class=3, days=5)
+        cls.student = cls.school["students"][0]
+        # Measure the conversation page once its messages have been read
+        Conversation.objects.get(
+            user=cls.school["teacher"], other=cls.student.user
+        ).mark_read()
+        cls.users = {
+            "admin": cls.school["admin"],
+            "teacher": cls.school["teacher"],
+            "student": cls.student.user,
+            "parent": cls.school["parent"],
+        }
+
+    def url_kwargs(self, kwargs):
+        if kwargs == "class_id":
+            return {"class_id": self.student.class_enrolled_id}
+        if kwargs == "assignment_id":
+            assignment = Assignment.objects.filter(
+                class_subject__class_obj=self.student.class_enrolled_id
+            ).first()
+            return {"assignment_id": assignment.pk}
+        if kwargs == "student_id":
+            return {"student_id": self.student.pk}
+        if kwargs == "user_id":
+            return {"user_id": self.student.user_id}
+        return kwargs
+
+    def count_queries(self, role, name, kwargs):
+        cache.clear()
+        self.client.force_login(self.users[role])
+        url = reverse(name, kwargs=self.url_kwargs(kwargs))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 400, url)
+        return len(ctx.captured_queries)
+
+    def test_query_counts_stay_within_budget_as_data_grows(self):
+        small = {
+            (role, name): self.count_queries(role, name, kwargs)
+            for role, name, kwargs, _ in self.BUDGETS
+        }
+        add_classes(self.school, classes=3, students_per_class=8, days=10)
+
+        for role, name, kwargs, budget in self.BUDGETS:
+            with self.subTest(role=role, view=name):
+                large = self.count_queries(role, name, kwargs)
+                self.assertLessEqual(large, budget)
+                self.assertEqual(large, small[role, name], "grows with the data")
@@ -0,0 +1,139 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Square edge lengths in pixels, smallest first
+THUMBNAIL_SIZES = [48, 128, 256]
+# (extension, Pillow format, save options), preferred format first
+THUMBNAIL_FORMATS = [
+    ("webp", "WEBP", {"quality": 80, "method": 4}),
+    ("jpg", "JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+]
+
+# Thumbnails are named after the picture they come from, and the picture's
+# blob name after its content, so they need no reference counting of their
+# own. reconcile_blobs removes those whose picture is gone.
+thumbnail_storage = FileSystemStorage()
+_executor = None
+
+
+def thumbnail_name(name, size, extension):
+    return f"thumbs/{name}-{size}.{extension}"
+
+
+def render_thumbnails(name):
+    """Write every size and format of the picture stored as ``name``"""
+    with default_storage.open(name) as f, Image.open(f) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        for size in THUMBNAIL_SIZES:
+            thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            for extension, image_format, options in THUMBNAIL_FORMATS:
+                target = thumbnail_name(name, size, extension)
+                if thumbnail_storage.exists(target):
+                    continue
+                buffer = BytesIO()
+                thumb.save(buffer, image_format, **options)
+                thumbnail_storage.save(target, ContentFile(buffer.getvalue()))
+
+
+def generate_thumbnails(profile_id, name):
+    """Render the thumbnails of a profile picture and mark them ready
+
+    The flag is only set if the profile still has this picture, so a
+    slower job for a replaced picture cannot mark the new one ready.
+    """
+    try:
+        render_thumbnails(name)
+        UserProfile.objects.filter(pk=profile_id, profile_picture=name).update(
+            thumbnails_ready=True
+        )
+    except Exception:
+        # The original is still shown, so log it rather than fail the job
+        logger.exception("Could not render the thumbnails of %s", name)
+
+
+def _work(profile_id, name):
+    try:
+        generate_thumbnails(profile_id, name)
+    finally:
+        # Worker threads outlive requests, so nothing else closes theirs
+        close_old_connections()
+
+
+def _submit(profile_id, name):
+    global _executor
+    if not settings.THUMBNAIL_WORKERS:
+        generate_thumbnails(profile_id, name)
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            settings.THUMBNAIL_WORKERS, thread_name_prefix="thumbnails"
+        )
+    _executor.submit(_work, profile_id, name)
+
+
+def schedule_thumbnails(profile):
+    """Render the thumbnails in the worker pool once the picture is committed
+
+    Pillow releases the GIL while it decodes, resizes and encodes, so a few
+    threads keep the work off the request without a separate process.
+    """
+    name = profile.profile_picture.name
+    transaction.on_commit(lambda: _submit(profile.pk, name))
+
+
+def remove_orphan_thumbnails():
+    """Delete thumbnails whose picture is no longer stored; returns how many"""
+    removed = 0
+    root = thumbnail_storage.path("thumbs")
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            picture = os.path.relpath(path, root).rsplit("-", 1)[0]
+            if not default_storage.exists(picture):
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def avatar_sources(profile, size):
+    """The fallback URL and per-format srcsets for showing a picture at ``size``
+
+    The fallback is the smallest variant at least ``size`` pixels wide. The
+    srcsets list every variant so high-density screens can pick a larger one.
+    Returns None when there is no picture, and only the original when its
+    thumbnails are not ready yet.
+    """
+    if not profile or not profile.profile_picture:
+        return None
+    if not profile.thumbnails_ready:
+        return {"src": profile.profile_picture.url, "sources": []}
+
+    name = profile.profile_picture.name
+    fitting = next((s for s in THUMBNAIL_SIZES if s >= size), THUMBNAIL_SIZES[-1])
+    sources = [
+        {
+            "type": f"image/{image_format.lower()}",
+            "srcset": ", ".join(
+                f"{thumbnail_storage.url(thumbnail_name(name, s, extension))} {s}w"
+                for s in THUMBNAIL_SIZES
+            ),
+        }
+        for extension, image_format, _ in THUMBNAIL_FORMATS
+    ]
+    extension = THUMBNAIL_FORMATS[-1][0]
+    return {
+        "src": thumbnail_storage.url(thumbnail_name(name, fitting, extension)),
+        "sources": sources,
+    }
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import ChunkedUpload, Submission
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A chunk was rejected; ``status`` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def upload_path(upload):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f"{upload.pk}.part")
+
+
+def start_upload(student, assignment, filename, size, sha256=""):
+    """Return the upload of this file to resume, or a new one
+
+    An unfinished upload of a file with the same name and size is picked
+    up where it stopped, so a client that lost its upload id can resume.
+    """
+    upload = (
+        ChunkedUpload.objects.filter(
+            student=student, assignment=assignment, filename=filename, size=size
+        )
+        .order_by("-updated_at")
+        .first()
+    )
+    if upload is None or upload.sha256 != sha256:
+        upload = ChunkedUpload.objects.create(
+            student=student,
+            assignment=assignment,
+            filename=filename,
+            size=size,
+            sha256=sha256,
+        )
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    return upload
+
+
+def append_chunk(upload, stream, length, offset, checksum):
+    """Write ``length`` bytes read from ``stream`` at ``offset``
+
+    ``checksum`` is the SHA-256 of the chunk. A chunk that does not start
+    where the previous one ended, runs past the declared size or fails its
+    checksum is rejected and leaves the upload as it was. Returns the
+    Submission once the last chunk is in, otherwise None.
+    """
+    if offset != upload.offset:
+        raise UploadError(f"Expected the chunk at offset {upload.offset}", 409)
+    if length <= 0 or length > settings.CHUNKED_UPLOAD_MAX_CHUNK:
+        raise UploadError(
+            f"Chunks must be 1 to {settings.CHUNKED_UPLOAD_MAX_CHUNK} bytes", 413
+        )
+    if offset + length > upload.size:
+        raise UploadError("The chunk runs past the end of the file")
+
+    # The chunk goes to a file of its own first, so a rejected or losing
+    # request never touches the bytes already received
+    path = upload_path(upload)
+    chunk_path = f"{path}.{uuid.uuid4().hex}"
+    digest = hashlib.sha256()
+    try:
+        with open(chunk_path, "wb") as f:
+            remaining = length
+            while remaining:
+                data = stream.read(min(READ_SIZE, remaining))
+                if not data:
+                    break
+                digest.update(data)
+                f.write(data)
+                remaining -= len(data)
+        if remaining or digest.hexdigest() != checksum.lower():
+            raise UploadError("The chunk was incomplete or failed its checksum")
+
+        with transaction.atomic():
+            # Only one of two racing requests for the same chunk moves the
+            # offset, and the row stays locked until its chunk is written
+            moved = ChunkedUpload.objects.filter(pk=upload.pk, offset=offset).update(
+                offset=offset + length, updated_at=timezone.now()
+            )
+            if not moved:
+                upload.refresh_from_db(fields=["offset"])
+                raise UploadError("The chunk was already received", 409)
+            with open(chunk_path, "rb") as chunk:
+                with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                    f.seek(offset)
+                    shutil.copyfileobj(chunk, f, READ_SIZE)
+                    f.truncate(offset + length)
+    finally:
+        os.remove(chunk_path)
+
+    upload.offset = offset + length
+    if upload.offset == upload.size:
+        return finish_upload(upload)
+    return None
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while data := f.read(READ_SIZE):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def finish_upload(upload):
+    """Turn a complete upload into the student's Submission"""
+    path = upload_path(upload)
+    if upload.sha256 and file_sha256(path) != upload.sha256.lower():
+        discard_upload(upload)
+        raise UploadError("The file failed its checksum, upload it again", 422)
+
+    submitted = UploadError("The assignment was already submitted", 409)
+    # The student may have used the submission form since starting the upload
+    if Submission.objects.filter(
+        assignment=upload.assignment_id, student=upload.student_id
+    ).exists():
+        discard_upload(upload)
+        raise submitted
+    try:
+        with open(path, "rb") as f, transaction.atomic():
+            submission = Submission.objects.create(
+                assignment=upload.assignment,
+                student=upload.student,
+                submission_file=File(f, name=upload.filename),
+            )
+            upload.delete()
+    except IntegrityError:
+        discard_upload(upload)
+        raise submitted
+    os.remove(path)
+    return submission
+
+
+def discard_upload(upload):
+    if os.path.exists(upload_path(upload)):
+        os.remove(upload_path(upload))
+    upload.delete()
+
+
+def expire_uploads(max_age):
+    """Discard uploads that have not received a chunk for ``max_age``"""
+    stale = ChunkedUpload.objects.filter(updated_at__lt=timezone.now() - max_age)
+    count = 0
+    for upload in list(stale):
+        discard_upload(upload)
+        count += 1
+    return count
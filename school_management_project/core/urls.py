@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     # Authentication
@@ -12,6 +12,11 @@ urlpatterns = [
     path('teacher-dashboard/', views.teacher_dashboard, name='teacher_dashboard'),
     path('student-dashboard/', views.student_dashboard, name='student_dashboard'),
     path('parent-dashboard/', views.parent_dashboard, name='parent_dashboard'),
+    # The same dashboards as async views, for ASGI
+    path('admin-dashboard/async/', async_views.admin_dashboard, name='admin_dashboard_async'),
+    path('teacher-dashboard/async/', async_views.teacher_dashboard, name='teacher_dashboard_async'),
+    path('student-dashboard/async/', async_views.student_dashboard, name='student_dashboard_async'),
+    path('parent-dashboard/async/', async_views.parent_dashboard, name='parent_dashboard_async'),
     
     # Student Management
     path('students/', views.student_list, name='student_list'),
@@ -19,6 +24,8 @@ urlpatterns = [
     
     # Attendance
     path('attendance/mark/<int:class_id>/', views.mark_attendance, name='mark_attendance'),
+    path('attendance/mark-grade/<str:class_name>/', views.mark_grade_attendance, name='mark_grade_attendance'),
+    path('attendance/at-risk/', views.at_risk_students, name='at_risk_students'),
     
     # Grades
     path('grades/upload/', views.upload_grades, name='upload_grades'),
@@ -27,14 +34,29 @@ urlpatterns = [
     path('assignments/', views.assignment_list, name='assignment_list'),
     path('assignments/create/', views.assignment_create, name='assignment_create'),
     path('assignments/<int:assignment_id>/submit/', views.submit_assignment, name='submit_assignment'),
+    path('assignments/<int:assignment_id>/uploads/', views.start_chunked_upload, name='start_chunked_upload'),
+    path('uploads/<uuid:upload_id>/', views.upload_chunk, name='upload_chunk'),
     
     # Announcements
     path('announcements/create/', views.announcement_create, name='announcement_create'),
     
     # Messages
     path('messages/send/', views.send_message, name='send_message'),
+    path('messages/broadcast/', views.broadcast_message, name='broadcast_message'),
     path('messages/inbox/', views.inbox, name='inbox'),
+    path('messages/with/<int:user_id>/', views.conversation, name='conversation'),
     
     # Parent
     path('child/<int:student_id>/', views.view_child_details, name='child_details'),
+
+    # Search
+    path('search/', views.search, name='search'),
+
+    # Reports
+    path('reports/<str:kind>/<int:object_id>/', views.request_report, name='request_report'),
+    path('reports/jobs/<uuid:job_id>/', views.report_job, name='report_job'),
+    path('reports/jobs/<uuid:job_id>/download/', views.download_report, name='download_report'),
+
+    # Monitoring
+    path('profiler/queries/', views.query_profile, name='query_profile'),
 ]
\ No newline at end of file
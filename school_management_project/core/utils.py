@@ -1,139 +1,414 @@
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import (
+    Flowable,
+    PageBreak,
+    Paragraph,
+    SimpleDocTemplate,
+    Spacer,
+    Table,
+    TableStyle,
+)
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
+from itertools import groupby
+from operator import itemgetter
+from xml.sax.saxutils import escape
 from openpyxl import Workbook
+from django.db.models import (
+    Avg,
+    F,
+    FloatField,
+    IntegerField,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Sum,
+)
 from django.http import HttpResponse
+from .analytics import student_analytics
+from .models import (
+    AttendanceSummary,
+    Class,
+    Grade,
+    Student,
+    grade_percentage_expression,
+)
 
 
-def generate_student_report(student):
-    """Generate PDF report for a student"""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Title
-    title_style = ParagraphStyle(
-        "CustomTitle",
-        parent=styles["Heading1"],
-        fontSize=24,
-        textColor=colors.HexColor("#2c3e50"),
-        spaceAfter=30,
-        alignment=1,
-    )
-    elements.append(
-        Paragraph(f"Student Report: {student.user.get_full_name()}", title_style)
-    )
-    elements.append(Spacer(1, 12))
+# Styles are immutable once built, so share them across every report instead
+# of rebuilding the sample stylesheet for each student.
+_STYLES = getSampleStyleSheet()
+_TITLE_STYLE = ParagraphStyle(
+    "CustomTitle",
+    parent=_STYLES["Heading1"],
+    fontSize=24,
+    textColor=colors.HexColor("#2c3e50"),
+    spaceAfter=30,
+    alignment=1,
+)
+_INFO_TABLE_STYLE = TableStyle(
+    [
+        ("BACKGROUND", (0, 0), (0, -1), colors.grey),
+        ("TEXTCOLOR", (0, 0), (0, -1), colors.whitesmoke),
+        ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+        ("FONTNAME", (0, 0), (-1, -1), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, -1), 12),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 12),
+        ("GRID", (0, 0), (-1, -1), 1, colors.black),
+    ]
+)
+_GRADE_TABLE_STYLE = TableStyle(
+    [
+        ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, 0), 12),
+        ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
+        ("GRID", (0, 0), (-1, -1), 1, colors.black),
+    ]
+)
+_GRADE_COL_WIDTHS = [
+    1.5 * inch,
+    1.2 * inch,
+    0.8 * inch,
+    0.8 * inch,
+    1 * inch,
+    0.7 * inch,
+]
+
+
+def student_report_data(student, grades=None):
+    """Collect the plain data a report card needs.
+
+    The result only holds strings, so it can be handed to a worker process.
+    Pass ``grades`` when they have already been fetched (with their subject
+    and the with_percentage() annotations).
+    """
+    if grades is None:
+        grades = (
+            student.grades.select_related("subject")
+            .with_percentage()
+            .order_by("-exam_date")
+        )
+
+    return {
+        "name": student.user.get_full_name(),
+        "admission_number": student.admission_number,
+        "class": str(student.class_enrolled),
+        "roll_number": str(student.roll_number),
+        "parent": student.parent.get_full_name() if student.parent else "N/A",
+        "grades": [
+            [
+                grade.subject.name,
+                grade.exam_type,
+                str(grade.marks_obtained),
+                str(grade.total_marks),
+                f"{grade.pct:.2f}%",
+                grade.letter_grade,
+            ]
+            for grade in grades
+        ],
+    }
+
+
+def _report_elements(data):
+    elements = [
+        Paragraph(f"Student Report: {escape(data['name'])}", _TITLE_STYLE),
+        Spacer(1, 12),
+    ]
 
     # Student Info
     info_data = [
-        ["Admission Number:", student.admission_number],
-        ["Class:", str(student.class_enrolled)],
-        ["Roll Number:", str(student.roll_number)],
-        ["Parent:", student.parent.get_full_name() if student.parent else "N/A"],
+        ["Admission Number:", data["admission_number"]],
+        ["Class:", data["class"]],
+        ["Roll Number:", data["roll_number"]],
+        ["Parent:", data["parent"]],
     ]
-
     info_table = Table(info_data, colWidths=[2 * inch, 4 * inch])
-    info_table.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (0, -1), colors.grey),
-                ("TEXTCOLOR", (0, 0), (0, -1), colors.whitesmoke),
-                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                ("FONTNAME", (0, 0), (-1, -1), "Helvetica-Bold"),
-                ("FONTSIZE", (0, 0), (-1, -1), 12),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 12),
-                ("GRID", (0, 0), (-1, -1), 1, colors.black),
-            ]
-        )
-    )
+    info_table.setStyle(_INFO_TABLE_STYLE)
     elements.append(info_table)
     elements.append(Spacer(1, 20))
 
     # Grades
-    elements.append(Paragraph("Academic Performance", styles["Heading2"]))
+    elements.append(Paragraph("Academic Performance", _STYLES["Heading2"]))
     elements.append(Spacer(1, 12))
 
-    grades = student.grades.all().order_by("-exam_date")
-    if grades:
+    if data["grades"]:
         grade_data = [["Subject", "Exam Type", "Marks", "Total", "Percentage", "Grade"]]
-        for grade in grades:
-            grade_data.append(
-                [
-                    grade.subject.name,
-                    grade.exam_type,
-                    str(grade.marks_obtained),
-                    str(grade.total_marks),
-                    f"{grade.percentage()}%",
-                    grade.grade_letter(),
-                ]
+        grade_data.extend(data["grades"])
+        grade_table = Table(grade_data, colWidths=_GRADE_COL_WIDTHS)
+        grade_table.setStyle(_GRADE_TABLE_STYLE)
+        elements.append(grade_table)
+
+    return elements
+
+
+def render_student_report(data):
+    """Render the PDF bytes for data built by student_report_data"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    doc.build(_report_elements(data))
+    return buffer.getvalue()
+
+
+def generate_student_report(student):
+    """Generate PDF report for a student"""
+    return BytesIO(render_student_report(student_report_data(student)))
+
+
+def _report_card_name(data):
+    return f"{data['admission_number'].replace('/', '-')}.pdf"
+
+
+class _ReportCardEnd(Flowable):
+    """Invisible marker laid out after the last element of a report card"""
+
+    def __init__(self, done):
+        super().__init__()
+        self.done = done
+
+    def wrap(self, available_width, available_height):
+        return 0, 0
+
+    def draw(self):
+        pass
+
+
+class _ReportCardsTemplate(SimpleDocTemplate):
+    """Reports ``progress(done, total)`` as each card is laid out"""
+
+    def __init__(self, fileobj, progress, total, **kwargs):
+        super().__init__(fileobj, **kwargs)
+        self.progress, self.total = progress, total
+
+    def afterFlowable(self, flowable):
+        if self.progress and isinstance(flowable, _ReportCardEnd):
+            self.progress(flowable.done, self.total)
+
+
+def generate_report_cards(
+    students=None, output="zip", workers=None, progress=None, fileobj=None
+):
+    """Generate report cards for many students at once.
+
+    ``students`` is a Student queryset (a class, the whole school, ...) and
+    defaults to every student. Grades are fetched with one prefetch query.
+    With ``output="zip"`` the PDFs are rendered across a process pool of
+    ``workers`` processes (``workers=1`` renders in-process) and each card is
+    written to the archive as soon as it is rendered. ``output="pdf"``
+    produces one merged document with a page break between students; it is
+    laid out as a single document, so it is always rendered in-process and
+    ``workers`` is ignored.
+
+    ``progress(done, total)`` is called once each card is rendered, for
+    ``output="pdf"`` as the build lays out its last page. The result is
+    written to ``fileobj`` (a BytesIO by default), which is returned rewound.
+    """
+    if output not in ("zip", "pdf"):
+        raise ValueError("output must be 'zip' or 'pdf'")
+    if students is None:
+        students = Student.objects.all()
+    if fileobj is None:
+        fileobj = BytesIO()
+
+    students = (
+        students.select_related("user", "parent", "class_enrolled")
+        .prefetch_related(
+            Prefetch(
+                "grades",
+                queryset=Grade.objects.select_related("subject")
+                .with_percentage()
+                .order_by("-exam_date"),
             )
+        )
+        .order_by("class_enrolled_id", "roll_number")
+    )
+    reports = [student_report_data(s, s.grades.all()) for s in students]
+    total = len(reports)
+
+    if output == "pdf":
+        doc = _ReportCardsTemplate(fileobj, progress, total, pagesize=A4)
+        elements = []
+        for done, data in enumerate(reports, 1):
+            if elements:
+                elements.append(PageBreak())
+            elements.extend(_report_elements(data))
+            elements.append(_ReportCardEnd(done))
+        doc.build(elements or [Spacer(1, 0)])
+        fileobj.seek(0)
+        return fileobj
+
+    workers = workers or os.cpu_count() or 1
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as archive:
+        if workers == 1 or total < 2:
+            rendered = map(render_student_report, reports)
+            _write_report_cards(archive, reports, rendered, total, progress)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunksize = max(1, total // (workers * 8))
+                rendered = pool.map(render_student_report, reports, chunksize=chunksize)
+                _write_report_cards(archive, reports, rendered, total, progress)
 
-        grade_table = Table(
-            grade_data,
-            colWidths=[
-                1.5 * inch,
-                1.2 * inch,
-                0.8 * inch,
-                0.8 * inch,
-                1 * inch,
-                0.7 * inch,
-            ],
+    fileobj.seek(0)
+    return fileobj
+
+
+def _write_report_cards(archive, reports, rendered, total, progress):
+    for done, (data, pdf) in enumerate(zip(reports, rendered), 1):
+        archive.writestr(_report_card_name(data), pdf)
+        if progress:
+            progress(done, total)
+
+
+CLASS_REPORT_HEADERS = [
+    "Roll No",
+    "Name",
+    "Admission No",
+    "Attendance %",
+    "Average Grade",
+    "30-Day Attendance %",
+    "Longest Absence Streak",
+    "Most Missed Day",
+    "Chronic Absence",
+]
+
+
+def class_report_rows(students):
+    """Annotate a Student queryset with everything the class report needs.
+
+    Attendance counts (from the monthly summaries) and the average grade
+    percentage are computed by correlated subqueries, so the whole report is
+    a single SELECT no matter how many students it covers. The streaks and
+    rates of core.analytics come from student_analytics, keyed by the
+    student id that follows the class id in each row.
+    """
+    summaries = AttendanceSummary.objects.filter(student=OuterRef("pk")).order_by()
+    summary_days = F("present") + F("absent") + F("late") + F("excused")
+    grades = Grade.objects.filter(student=OuterRef("pk")).order_by()
+
+    return (
+        students.order_by("class_enrolled_id", "roll_number")
+        .annotate(
+            total_days=Subquery(
+                summaries.values("student")
+                .annotate(n=Sum(summary_days))
+                .values("n"),
+                output_field=IntegerField(),
+            ),
+            present_days=Subquery(
+                summaries.values("student").annotate(n=Sum("present")).values("n"),
+                output_field=IntegerField(),
+            ),
+            avg_grade=Subquery(
+                grades.values("student")
+                .annotate(avg=Avg(grade_percentage_expression()))
+                .values("avg"),
+                output_field=FloatField(),
+            ),
         )
-        grade_table.setStyle(
-            TableStyle(
-                [
-                    ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
-                    ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-                    ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                    ("FONTSIZE", (0, 0), (-1, 0), 12),
-                    ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-                    ("GRID", (0, 0), (-1, -1), 1, colors.black),
-                ]
-            )
+        .values_list(
+            "class_enrolled_id",
+            "pk",
+            "roll_number",
+            "user__first_name",
+            "user__last_name",
+            "admission_number",
+            "total_days",
+            "present_days",
+            "avg_grade",
         )
-        elements.append(grade_table)
+    )
 
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
 
+def _class_report_row(roll_number, first_name, last_name, admission_number,
+                      total_days, present_days, avg_grade, analytics=None):
+    total_days = total_days or 0
+    attendance_pct = (present_days or 0) / total_days * 100 if total_days else 0
+    analytics = analytics or {}
+    recent_rate = analytics.get("recent_rate")
+    return [
+        roll_number,
+        f"{first_name} {last_name}".strip(),
+        admission_number,
+        f"{attendance_pct:.2f}%",
+        f"{avg_grade or 0:.2f}%",
+        f"{recent_rate * 100:.2f}%" if recent_rate is not None else "",
+        analytics.get("longest_streak", 0),
+        analytics.get("worst_weekday") or "",
+        "Yes" if analytics.get("chronic") else "No",
+    ]
 
-def generate_class_report(class_obj):
-    """Generate Excel report for a class"""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"{class_obj.name} - {class_obj.section}"
 
-    # Headers
-    headers = ["Roll No", "Name", "Admission No", "Attendance %", "Average Grade"]
-    ws.append(headers)
+def _sheet_title(class_obj, used):
+    # Excel caps sheet titles at 31 characters and requires them to be unique
+    title = f"{class_obj.name} - {class_obj.section}"[:31]
+    base, n = title, 2
+    while title in used:
+        suffix = f" ({n})"
+        title = base[: 31 - len(suffix)] + suffix
+        n += 1
+    used.add(title)
+    return title
 
+
+def class_report_data(class_obj):
+    """Collect the plain data a class report needs, see student_report_data"""
     students = class_obj.students.all()
-    for student in students:
-        # Calculate attendance percentage
-        total_days = student.attendance_records.count()
-        present_days = student.attendance_records.filter(status="present").count()
-        attendance_pct = (present_days / total_days * 100) if total_days > 0 else 0
-
-        # Calculate average grade
-        grades = student.grades.all()
-        avg_grade = sum([g.percentage() for g in grades]) / len(grades) if grades else 0
-
-        row = [
-            student.roll_number,
-            student.user.get_full_name(),
-            student.admission_number,
-            f"{attendance_pct:.2f}%",
-            f"{avg_grade:.2f}%",
-        ]
+    analytics = student_analytics(students)
+    return {
+        "title": _sheet_title(class_obj, set()),
+        "rows": [
+            _class_report_row(*row[2:], analytics.get(row[1]))
+            for row in class_report_rows(students).iterator()
+        ],
+    }
+
+
+def render_class_report(data):
+    """Render the workbook bytes for data built by class_report_data"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(data["title"])
+    ws.append(CLASS_REPORT_HEADERS)
+    for row in data["rows"]:
         ws.append(row)
 
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def generate_class_report(class_obj):
+    """Generate Excel report for a class"""
+    return BytesIO(render_class_report(class_report_data(class_obj)))
+
+
+def generate_school_report(classes=None):
+    """Generate Excel report for the whole school, one sheet per class"""
+    if classes is None:
+        classes = Class.objects.all()
+    classes = {c.pk: c for c in classes.order_by("pk")}
+
+    wb = Workbook(write_only=True)
+    used_titles = set()
+    students = Student.objects.filter(class_enrolled__in=list(classes))
+    analytics = student_analytics(students)
+    rows = class_report_rows(students).iterator(chunk_size=2000)
+
+    for class_id, class_rows in groupby(rows, key=itemgetter(0)):
+        ws = wb.create_sheet(_sheet_title(classes[class_id], used_titles))
+        ws.append(CLASS_REPORT_HEADERS)
+        for row in class_rows:
+            ws.append(_class_report_row(*row[2:], analytics.get(row[1])))
+
+    if not used_titles:
+        wb.create_sheet("Report").append(CLASS_REPORT_HEADERS)
+
     buffer = BytesIO()
     wb.save(buffer)
     buffer.seek(0)
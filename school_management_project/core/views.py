@@ -1,11 +1,29 @@
+import os
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Subquery
+from django.http import FileResponse, Http404, JsonResponse
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_http_methods, require_POST
 from .models import *
+from .analytics import CHRONIC_BELOW, WINDOW_DAYS, at_risk
+from .auth import role_required, user_role
+from .feeds import announcement_feed
 from .forms import *
+from .imports import import_grades
+from .pagination import keyset_paginate, keyset_paginate_union
+from .profiler import query_stats
+from .reports import REPORT_FORMATS, report_filename, submit_report
+from .search import search as search_index
+from .uploads import UploadError, append_chunk, start_upload
 
 
 def user_login(request):
@@ -32,147 +50,215 @@ def user_logout(request):
 
 @login_required
 def dashboard(request):
-    user_role = request.user.profile.role
-
-    if user_role == "admin":
+    role = user_role(request.user)
+    if role == "admin":
         return redirect("admin_dashboard")
-    elif user_role == "teacher":
+    elif role == "teacher":
         return redirect("teacher_dashboard")
-    elif user_role == "student":
+    elif role == "student":
         return redirect("student_dashboard")
-    elif user_role == "parent":
+    elif role == "parent":
         return redirect("parent_dashboard")
     else:
         messages.error(request, "Invalid user role")
         return redirect("login")
 
 
-@login_required
-def admin_dashboard(request):
-    if request.user.profile.role != "admin":
-        messages.error(request, "Access denied")
-        return redirect("dashboard")
+# Each role dashboard is built from independent queries, listed as
+# context name -> callable so that the sync views below and core.async_views
+# share them.
 
-    context = {
-        "total_students": Student.objects.count(),
-        "total_teachers": UserProfile.objects.filter(role="teacher").count(),
-        "total_classes": Class.objects.count(),
-        "total_subjects": Subject.objects.count(),
-        "recent_students": Student.objects.select_related(
-            "user", "class_enrolled"
-        ).order_by("-admission_date")[:5],
-        "announcements": Announcement.objects.filter(is_active=True).order_by(
-            "-created_at"
-        )[:5],
+
+def admin_dashboard_queries(request):
+    return {
+        "counters": DashboardCounter.snapshot,
+        "recent_students": lambda: list(
+            Student.objects.select_related("user", "class_enrolled").order_by(
+                "-admission_date"
+            )[:5]
+        ),
+        "announcements": announcement_feed,
     }
-    return render(request, "admin_dashboard.html", context)
 
 
-@login_required
-def teacher_dashboard(request):
-    if request.user.profile.role != "teacher":
-        messages.error(request, "Access denied")
-        return redirect("dashboard")
+def admin_dashboard_context(request, results):
+    totals, yearly_counts = results.pop("counters")
+    return {
+        "total_students": totals.get("students", 0),
+        "total_teachers": totals.get("teachers", 0),
+        "total_classes": totals.get("classes", 0),
+        "total_subjects": totals.get("subjects", 0),
+        "yearly_counts": yearly_counts,
+        **results,
+    }
 
-    assigned_subjects = ClassSubject.objects.filter(
-        teacher=request.user
-    ).select_related("class_obj", "subject")
 
-    context = {
-        "assigned_subjects": assigned_subjects,
+def teacher_dashboard_queries(request):
+    return {
+        "assigned_subjects": lambda: list(
+            ClassSubject.objects.filter(teacher=request.user).select_related(
+                "class_obj", "subject"
+            )
+        ),
         "pending_submissions": Submission.objects.filter(
             assignment__created_by=request.user, marks_obtained__isnull=True
-        ).count(),
-        "announcements": Announcement.objects.filter(
-            Q(target_role="teacher") | Q(target_role="")
-        )
-        .filter(is_active=True)
-        .order_by("-created_at")[:5],
-        "messages": Message.objects.filter(
-            receiver=request.user, is_read=False
-        ).count(),
+        ).count,
+        "announcements": lambda: announcement_feed("teacher"),
     }
-    return render(request, "teacher_dashboard.html", context)
 
 
-@login_required
-def student_dashboard(request):
-    if request.user.profile.role != "student":
-        messages.error(request, "Access denied")
-        return redirect("dashboard")
+def teacher_dashboard_context(request, results):
+    return {**results, "unread_messages": request.user.profile.unread_messages}
 
-    student = request.user.student_profile
-    recent_attendance = Attendance.objects.filter(student=student).order_by("-date")[
-        :10
-    ]
-    recent_grades = (
-        Grade.objects.filter(student=student)
-        .select_related("subject")
-        .order_by("-exam_date")[:5]
-    )
 
+def student_dashboard_queries(request):
+    student = request.user.student_profile
     submitted_assignment_ids = Submission.objects.filter(student=student).values_list(
         "assignment_id", flat=True
     )
-    pending_assignments = (
-        Assignment.objects.filter(class_subject__class_obj=student.class_enrolled)
-        .exclude(id__in=submitted_assignment_ids)
-        .order_by("due_date")[:5]
-    )
-
-    context = {
-        "student": student,
-        "recent_attendance": recent_attendance,
-        "recent_grades": recent_grades,
-        "pending_assignments": pending_assignments,
-        "announcements": Announcement.objects.filter(
-            Q(target_role="student")
-            | Q(target_role="")
-            | Q(target_class=student.class_enrolled)
-        )
-        .filter(is_active=True)
-        .order_by("-created_at")[:5],
+    return {
+        "recent_attendance": lambda: list(
+            Attendance.objects.filter(student=student).order_by("-date")[:10]
+        ),
+        "recent_grades": lambda: list(
+            Grade.objects.filter(student=student)
+            .select_related("subject", "subject_rank")
+            .with_percentage()
+            .order_by("-exam_date")[:5]
+        ),
+        "class_ranks": lambda: list(
+            ClassRank.objects.filter(
+                student=student, class_obj=student.class_enrolled_id
+            ).order_by("exam_type")
+        ),
+        "pending_assignments": lambda: list(
+            Assignment.objects.filter(class_subject__class_obj=student.class_enrolled)
+            .exclude(id__in=submitted_assignment_ids)
+            .order_by("due_date")[:5]
+        ),
+        "announcements": lambda: announcement_feed(
+            "student", student.class_enrolled_id
+        ),
     }
-    return render(request, "student_dashboard.html", context)
 
 
-@login_required
-def parent_dashboard(request):
-    if request.user.profile.role != "parent":
-        messages.error(request, "Access denied")
-        return redirect("dashboard")
+def student_dashboard_context(request, results):
+    return {**results, "student": request.user.student_profile}
 
-    children = Student.objects.filter(parent=request.user).select_related(
-        "user", "class_enrolled"
-    )
 
-    context = {
-        "children": children,
-        "announcements": Announcement.objects.filter(
-            Q(target_role="parent") | Q(target_role="")
-        )
-        .filter(is_active=True)
-        .order_by("-created_at")[:5],
+def parent_dashboard_queries(request):
+    return {
+        "children": lambda: list(
+            Student.objects.filter(parent=request.user).select_related(
+                "user__profile", "class_enrolled"
+            )
+        ),
+        "announcements": lambda: announcement_feed("parent"),
     }
-    return render(request, "parent_dashboard.html", context)
 
 
-@login_required
+def parent_dashboard_context(request, results):
+    return results
+
+
+# role -> (template, queries, context builder)
+DASHBOARDS = {
+    "admin": ("admin_dashboard.html", admin_dashboard_queries, admin_dashboard_context),
+    "teacher": (
+        "teacher_dashboard.html",
+        teacher_dashboard_queries,
+        teacher_dashboard_context,
+    ),
+    "student": (
+        "student_dashboard.html",
+        student_dashboard_queries,
+        student_dashboard_context,
+    ),
+    "parent": (
+        "parent_dashboard.html",
+        parent_dashboard_queries,
+        parent_dashboard_context,
+    ),
+}
+
+
+def render_dashboard(request, role):
+    template, queries, context = DASHBOARDS[role]
+    results = {name: query() for name, query in queries(request).items()}
+    return render(request, template, context(request, results))
+
+
+@role_required("admin")
+def admin_dashboard(request):
+    return render_dashboard(request, "admin")
+
+
+@role_required("teacher")
+def teacher_dashboard(request):
+    return render_dashboard(request, "teacher")
+
+
+@role_required("student")
+def student_dashboard(request):
+    return render_dashboard(request, "student")
+
+
+@role_required("parent")
+def parent_dashboard(request):
+    return render_dashboard(request, "parent")
+
+
+@role_required("admin")
 def student_list(request):
-    if request.user.profile.role != "admin":
-        messages.error(request, "Access denied")
-        return redirect("dashboard")
+    students = Student.objects.select_related(
+        "user__profile", "class_enrolled", "parent"
+    ).only(
+        "admission_number",
+        "roll_number",
+        "admission_date",
+        "user__first_name",
+        "user__last_name",
+        "user__profile__profile_picture",
+        "user__profile__thumbnails_ready",
+        "class_enrolled__name",
+        "class_enrolled__section",
+        "parent__first_name",
+        "parent__last_name",
+    )
+    students, next_cursor = keyset_paginate(
+        students, request.GET.get("cursor"), "admission_date"
+    )
+    return render(
+        request,
+        "student_list.html",
+        {"students": students, "next_cursor": next_cursor},
+    )
 
-    students = Student.objects.select_related("user", "class_enrolled").all()
-    return render(request, "student_list.html", {"students": students})
 
+@role_required("admin")
+def at_risk_students(request):
+    """Students whose attendance needs following up, see core.analytics"""
+    flagged = at_risk(Student.objects.filter(class_enrolled__isnull=False))
+    students = Student.objects.select_related("user", "class_enrolled").in_bulk(
+        [student_id for student_id, _, _ in flagged]
+    )
+    return render(
+        request,
+        "at_risk_students.html",
+        {
+            "rows": [
+                {"student": students[student_id], "reasons": reasons, **metrics}
+                for student_id, metrics, reasons in flagged
+                if student_id in students
+            ],
+            "chronic_below": CHRONIC_BELOW,
+            "window_days": WINDOW_DAYS,
+        },
+    )
 
-@login_required
-def student_create(request):
-    if request.user.profile.role != "admin":
-        messages.error(request, "Access denied")
-        return redirect("dashboard")
 
+@role_required("admin")
+def student_create(request):
     if request.method == "POST":
         user_form = UserRegisterForm(request.POST)
         profile_form = UserProfileForm(request.POST, request.FILES)
@@ -207,25 +293,57 @@ def student_create(request):
     )
 
 
-@login_required
-def mark_attendance(request, class_id):
-    if request.user.profile.role not in ["admin", "teacher"]:
-        messages.error(request, "Access denied")
-        return redirect("dashboard")
+def _save_attendance(request, students):
+    """Upsert the posted attendance for ``students`` in one atomic statement
+
+    Students without a posted status are left unmarked. Returns the saved
+    records; raises ValueError, saving nothing, if the date or any posted
+    status is invalid.
+    """
+    date = parse_date(request.POST.get("date") or "")
+    if date is None:
+        raise ValueError("Invalid date")
+    valid_statuses = {choice for choice, _ in Attendance.STATUS_CHOICES}
+    records = []
+    for student in students:
+        status = request.POST.get(f"status_{student.id}")
+        if not status:
+            continue
+        if status not in valid_statuses:
+            raise ValueError(f"Invalid status for {student}")
+        records.append(
+            Attendance(
+                student=student, date=date, status=status, marked_by=request.user
+            )
+        )
 
+    with transaction.atomic():
+        Attendance.objects.bulk_create(
+            records,
+            update_conflicts=True,
+            unique_fields=["student", "date"],
+            update_fields=["status", "marked_by", "updated_at"],
+        )
+        # bulk_create skips the post_save signal, so refresh the summaries here
+        AttendanceSummary.refresh([record.student_id for record in records], [date])
+    return records
+
+
+@role_required("admin", "teacher")
+def mark_attendance(request, class_id):
     class_obj = get_object_or_404(Class, id=class_id)
-    students = Student.objects.filter(class_enrolled=class_obj).select_related("user")
+    students = (
+        Student.objects.filter(class_enrolled=class_obj)
+        .select_related("user")
+        .order_by("roll_number")
+    )
 
     if request.method == "POST":
-        date = request.POST.get("date")
-        for student in students:
-            status = request.POST.get(f"status_{student.id}")
-            if status:
-                Attendance.objects.update_or_create(
-                    student=student,
-                    date=date,
-                    defaults={"status": status, "marked_by": request.user},
-                )
+        try:
+            _save_attendance(request, students)
+        except ValueError as error:
+            messages.error(request, str(error))
+            return redirect("mark_attendance", class_id=class_id)
         messages.success(request, "Attendance marked successfully")
         return redirect("teacher_dashboard")
 
@@ -237,13 +355,67 @@ def mark_attendance(request, class_id):
     )
 
 
-@login_required
-def upload_grades(request):
-    if request.user.profile.role != "teacher":
-        messages.error(request, "Access denied")
-        return redirect("dashboard")
+@role_required("admin")
+def mark_grade_attendance(request, class_name):
+    """Mark attendance for every section of a grade level at once
+
+    Only the sections of ``?academic_year=``, by default the latest year
+    the grade level has classes in, so past years' students are never
+    marked for today.
+    """
+    classes = Class.objects.filter(name=class_name)
+    academic_year = request.GET.get("academic_year") or Subquery(
+        classes.order_by("-academic_year").values("academic_year")[:1]
+    )
+    classes = classes.filter(academic_year=academic_year)
+
+    students = (
+        Student.objects.filter(class_enrolled__in=classes)
+        .select_related("user", "class_enrolled")
+        .order_by("class_enrolled__section", "roll_number")
+    )
 
     if request.method == "POST":
+        try:
+            records = _save_attendance(request, students)
+        except ValueError as error:
+            messages.error(request, str(error))
+            return redirect(request.get_full_path())
+        messages.success(
+            request, f"Attendance marked for {len(records)} students in {class_name}"
+        )
+        return redirect("admin_dashboard")
+
+    today = timezone.now().date()
+    return render(
+        request,
+        "mark_attendance.html",
+        {
+            "class_obj": class_name,
+            "students": students,
+            "today": today,
+            "show_section": True,
+        },
+    )
+
+
+@role_required("teacher")
+def upload_grades(request):
+    form = GradeForm()
+    import_form = GradeImportForm()
+    import_errors = []
+
+    if request.method == "POST" and "grades_file" in request.FILES:
+        import_form = GradeImportForm(request.POST, request.FILES)
+        if import_form.is_valid():
+            saved, import_errors = import_grades(
+                import_form.cleaned_data["grades_file"], request.user
+            )
+            if not import_errors:
+                messages.success(request, f"{saved} grades uploaded successfully")
+                return redirect("teacher_dashboard")
+            messages.error(request, "No grades were saved, fix the rows below")
+    elif request.method == "POST":
         form = GradeForm(request.POST)
         if form.is_valid():
             grade = form.save(commit=False)
@@ -251,18 +423,16 @@ def upload_grades(request):
             grade.save()
             messages.success(request, "Grade uploaded successfully")
             return redirect("teacher_dashboard")
-    else:
-        form = GradeForm()
 
-    return render(request, "grade_form.html", {"form": form})
+    return render(
+        request,
+        "grade_form.html",
+        {"form": form, "import_form": import_form, "import_errors": import_errors},
+    )
 
 
-@login_required
+@role_required("teacher")
 def assignment_create(request):
-    if request.user.profile.role != "teacher":
-        messages.error(request, "Access denied")
-        return redirect("dashboard")
-
     if request.method == "POST":
         form = AssignmentForm(request.POST, request.FILES)
         if form.is_valid():
@@ -279,27 +449,32 @@ def assignment_create(request):
 
 @login_required
 def assignment_list(request):
-    if request.user.profile.role == "student":
+    role = user_role(request.user)
+    if role == "student":
         student = request.user.student_profile
         assignments = Assignment.objects.filter(
             class_subject__class_obj=student.class_enrolled
-        ).order_by("-created_at")
-    elif request.user.profile.role == "teacher":
-        assignments = Assignment.objects.filter(created_by=request.user).order_by(
-            "-created_at"
         )
+    elif role == "teacher":
+        assignments = Assignment.objects.filter(created_by=request.user)
     else:
-        assignments = Assignment.objects.all().order_by("-created_at")
+        assignments = Assignment.objects.all()
 
-    return render(request, "assignment_list.html", {"assignments": assignments})
+    assignments = assignments.only(
+        "title", "description", "due_date", "total_marks", "created_at"
+    )
+    assignments, next_cursor = keyset_paginate(
+        assignments, request.GET.get("cursor"), "created_at"
+    )
+    return render(
+        request,
+        "assignment_list.html",
+        {"assignments": assignments, "next_cursor": next_cursor},
+    )
 
 
-@login_required
+@role_required("student")
 def submit_assignment(request, assignment_id):
-    if request.user.profile.role != "student":
-        messages.error(request, "Access denied")
-        return redirect("dashboard")
-
     assignment = get_object_or_404(Assignment, id=assignment_id)
     student = request.user.student_profile
 
@@ -320,12 +495,75 @@ def submit_assignment(request, assignment_id):
     )
 
 
-@login_required
-def announcement_create(request):
-    if request.user.profile.role not in ["admin", "teacher"]:
-        messages.error(request, "Access denied")
-        return redirect("dashboard")
+@require_POST
+@role_required("student")
+def start_chunked_upload(request, assignment_id):
+    """Begin or resume a chunked upload of an assignment submission"""
+    assignment = get_object_or_404(Assignment, id=assignment_id)
+    student = request.user.student_profile
+    if Submission.objects.filter(assignment=assignment, student=student).exists():
+        return JsonResponse({"error": "Already submitted"}, status=409)
+
+    form = ChunkedUploadForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+    upload = start_upload(student, assignment, **form.cleaned_data)
+    return JsonResponse(
+        {
+            "upload_id": upload.pk,
+            "upload_url": reverse("upload_chunk", args=[upload.pk]),
+            "offset": upload.offset,
+            "chunk_size": settings.CHUNKED_UPLOAD_MAX_CHUNK,
+        },
+        status=201,
+    )
 
+
+@require_http_methods(["GET", "PUT"])
+@role_required("student")
+def upload_chunk(request, upload_id):
+    """GET the offset to resume from, or PUT the chunk that starts there
+
+    A PUT carries the raw chunk as its body, its position in the
+    Upload-Offset header and its SHA-256 in Upload-Checksum. Each request
+    only lasts as long as one chunk, however slow the client is.
+    """
+    upload = get_object_or_404(
+        ChunkedUpload, id=upload_id, student=request.user.student_profile
+    )
+    if request.method == "PUT":
+        headers = {}
+        for header in ["Content-Length", "Upload-Offset"]:
+            try:
+                headers[header] = int(request.headers.get(header, ""))
+            except ValueError:
+                return JsonResponse({"error": f"Invalid {header}"}, status=400)
+        try:
+            submission = append_chunk(
+                upload,
+                request,
+                headers["Content-Length"],
+                headers["Upload-Offset"],
+                request.headers.get("Upload-Checksum", ""),
+            )
+        except UploadError as e:
+            return JsonResponse(
+                {"error": str(e), "offset": upload.offset}, status=e.status
+            )
+        if submission:
+            messages.success(request, "Assignment submitted successfully")
+            return JsonResponse(
+                {
+                    "offset": upload.size,
+                    "complete": True,
+                    "next": reverse("student_dashboard"),
+                }
+            )
+    return JsonResponse({"offset": upload.offset, "size": upload.size})
+
+
+@role_required("admin", "teacher")
+def announcement_create(request):
     if request.method == "POST":
         form = AnnouncementForm(request.POST)
         if form.is_valid():
@@ -356,29 +594,187 @@ def send_message(request):
     return render(request, "message_form.html", {"form": form})
 
 
+@role_required("admin", "teacher")
+def broadcast_message(request):
+    if request.method == "POST":
+        form = BroadcastForm(request.POST)
+        if form.is_valid():
+            sent = Message.broadcast(
+                request.user,
+                form.receivers(),
+                form.cleaned_data["subject"],
+                form.cleaned_data["content"],
+            )
+            messages.success(request, f"Message sent to {sent} recipients")
+            return redirect("dashboard")
+    else:
+        form = BroadcastForm()
+
+    return render(request, "broadcast_form.html", {"form": form})
+
+
 @login_required
 def inbox(request):
-    received_messages = Message.objects.filter(receiver=request.user).order_by(
-        "-sent_at"
+    conversations, next_cursor = keyset_paginate(
+        Conversation.objects.filter(user=request.user).select_related(
+            "other", "last_message"
+        ),
+        request.GET.get("cursor"),
+        "last_message_at",
     )
-    sent_messages = Message.objects.filter(sender=request.user).order_by("-sent_at")
-
     return render(
         request,
         "inbox.html",
-        {"received_messages": received_messages, "sent_messages": sent_messages},
+        {"conversations": conversations, "next_cursor": next_cursor},
     )
 
 
 @login_required
-def view_child_details(request, student_id):
-    if request.user.profile.role != "parent":
-        messages.error(request, "Access denied")
-        return redirect("dashboard")
+def conversation(request, user_id):
+    try:
+        conversation = Conversation.objects.select_related("other").get(
+            user=request.user, other=user_id
+        )
+        other = conversation.other
+    except Conversation.DoesNotExist:
+        conversation = None
+        other = get_object_or_404(User, id=user_id)
 
+    if request.method == "POST":
+        form = ReplyForm(request.POST)
+        if form.is_valid():
+            message = form.save(commit=False)
+            message.sender = request.user
+            message.receiver = other
+            message.save()
+            return redirect("conversation", user_id=user_id)
+    else:
+        form = ReplyForm()
+
+    if conversation:
+        conversation.mark_read()
+    fields = ["sender", "subject", "content", "sent_at"]
+    thread, next_cursor = keyset_paginate_union(
+        [
+            Message.objects.filter(sender=request.user, receiver=other).only(*fields),
+            Message.objects.filter(sender=other, receiver=request.user).only(*fields),
+        ],
+        request.GET.get("cursor"),
+        "sent_at",
+    )
+    return render(
+        request,
+        "conversation.html",
+        {
+            "other": other,
+            "thread": thread,
+            "next_cursor": next_cursor,
+            "form": form,
+        },
+    )
+
+
+@role_required("parent")
+def view_child_details(request, student_id):
     student = get_object_or_404(Student, id=student_id, parent=request.user)
     attendance = Attendance.objects.filter(student=student).order_by("-date")[:20]
-    grades = Grade.objects.filter(student=student).order_by("-exam_date")
+    grades = (
+        Grade.objects.filter(student=student)
+        .select_related("subject", "subject_rank")
+        .with_percentage()
+        .order_by("-exam_date")
+    )
+    class_ranks = ClassRank.objects.filter(
+        student=student, class_obj=student.class_enrolled_id
+    ).order_by("exam_type")
 
-    context = {"student": student, "attendance": attendance, "grades": grades}
+    context = {
+        "student": student,
+        "attendance": attendance,
+        "attendance_percentage": AttendanceSummary.percentage_for(student),
+        "grades": grades,
+        "class_ranks": class_ranks,
+    }
     return render(request, "child_details.html", context)
+
+
+@login_required
+def search(request):
+    query = request.GET.get("q", "").strip()
+    role = user_role(request.user)
+    results = search_index(request.user, role, query) if query else []
+    return render(
+        request,
+        "search.html",
+        {"search_query": query, "results": results},
+    )
+
+
+def _reportable(request, kind):
+    """The students or classes whose ``kind`` reports the user may see"""
+    role = user_role(request.user)
+    if kind == "class":
+        if role in ("admin", "teacher"):
+            return Class.objects.all()
+        return Class.objects.none()
+    if role == "parent":
+        return Student.objects.filter(parent=request.user)
+    if role == "student":
+        return Student.objects.filter(user=request.user)
+    return Student.objects.all()
+
+
+def _report_job(request, job_id):
+    job = get_object_or_404(ReportJob, id=job_id)
+    if not _reportable(request, job.kind).filter(pk=job.object_id).exists():
+        raise Http404
+    return job
+
+
+def _job_json(job):
+    data = {
+        "job_id": str(job.pk),
+        "status": job.status,
+        "status_url": reverse("report_job", kwargs={"job_id": job.pk}),
+    }
+    if job.status == ReportJob.DONE:
+        data["download_url"] = reverse("download_report", kwargs={"job_id": job.pk})
+    elif job.status == ReportJob.FAILED:
+        data["error"] = job.error
+    return data
+
+
+@require_POST
+@login_required
+def request_report(request, kind, object_id):
+    """Queue a student or class report for run_report_worker
+
+    Answers 200 with a download link when a report of the current data
+    already exists, otherwise 202 with the job to poll.
+    """
+    if kind not in REPORT_FORMATS:
+        raise Http404
+    get_object_or_404(_reportable(request, kind), pk=object_id)
+    job = submit_report(kind, object_id, request.user)
+    return JsonResponse(_job_json(job), status=200 if job.status == job.DONE else 202)
+
+
+@login_required
+def report_job(request, job_id):
+    return JsonResponse(_job_json(_report_job(request, job_id)))
+
+
+@login_required
+def download_report(request, job_id):
+    job = _report_job(request, job_id)
+    if job.status != ReportJob.DONE:
+        raise Http404
+    return FileResponse(
+        job.result.open("rb"), as_attachment=True, filename=report_filename(job)
+    )
+
+
+@staff_member_required
+def query_profile(request):
+    """Per-view query statistics gathered by QueryProfilerMiddleware"""
+    return JsonResponse({"pid": os.getpid(), "views": query_stats()})
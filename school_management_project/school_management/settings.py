@@ -22,6 +22,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the queries of the session, auth and role layers count too
+    "core.profiler.QueryProfilerMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -31,6 +33,11 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Share of requests profiled by QueryProfilerMiddleware, and how many runs of
+# one query shape in a single request count as a probable N+1.
+QUERY_PROFILER_SAMPLE_RATE = 1.0
+QUERY_PROFILER_N1_THRESHOLD = 5
+
 ROOT_URLCONF = "school_management.urls"
 
 TEMPLATES = [
@@ -58,6 +65,37 @@ DATABASES = {
     }
 }
 
+# Production profile for SQLite, selected with DJANGO_DATABASE_PROFILE=production.
+# WAL lets dashboards keep reading while attendance is written, writers
+# wait up to "timeout" seconds for the lock instead of failing with
+# "database is locked", and connections are kept across requests. PRAGMAS
+# are run on each new connection by core.db.apply_sqlite_pragmas.
+# benchmark_sqlite compares it with the default setup above.
+SQLITE_PRODUCTION = {
+    "OPTIONS": {"timeout": 20},
+    "CONN_MAX_AGE": 600,
+    "CONN_HEALTH_CHECKS": True,
+    "PRAGMAS": {
+        "journal_mode": "wal",
+        # Safe with WAL: a power cut can lose the last commits, not corrupt
+        "synchronous": "normal",
+        "cache_size": -64000,  # KiB, per connection
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "memory",
+    },
+}
+if os.environ.get("DJANGO_DATABASE_PROFILE") == "production":
+    DATABASES["default"].update(SQLITE_PRODUCTION)
+
+# Announcement feeds are cached here. LocMemCache is per process, so with
+# several workers point this at a shared backend (file-based, memcached,
+# redis) to have invalidations reach every worker immediately.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"
@@ -79,8 +117,26 @@ STATICFILES_DIRS = [BASE_DIR / "core" / "static"]
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Partial submission uploads (core.uploads), the largest chunk and the
+# largest whole file accepted
+CHUNKED_UPLOAD_DIR = BASE_DIR / "chunked_uploads"
+CHUNKED_UPLOAD_MAX_CHUNK = 2 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+
+# Threads rendering profile picture thumbnails; 0 renders them in-process
+THUMBNAIL_WORKERS = 2
+
+# Uploads are stored once per distinct content, see core.storage
+STORAGES = {
+    "default": {"BACKEND": "core.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Loads the profile and student record along with the user on each request
+AUTHENTICATION_BACKENDS = ["core.auth.ProfileBackend"]
+
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "dashboard"
 LOGOUT_REDIRECT_URL = "login"